@@ -1,12 +1,1107 @@
-
+import datetime
+import email.utils
+import heapq
 import http.server
-import socketserver
+import ipaddress
 import os
+import queue
+import re
+import secrets
+import selectors
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
 
 PORT = int(os.environ.get("PORT", 8080))
 
-Handler = http.server.SimpleHTTPRequestHandler
+# "simple" keeps the original single-threaded TCPServer; "production" serves
+# HTTP/1.1 keep-alive connections from a bounded worker pool.
+SERVER_MODE = os.environ.get("SERVER_MODE", "simple")
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 16))
+SERVER_BACKLOG = int(os.environ.get("SERVER_BACKLOG", 128))
+# Open connections (busy, readable or parked idle) the production server
+# holds at once; beyond this, new clients wait in the listen backlog.
+SERVER_MAX_CONNECTIONS = int(os.environ.get("SERVER_MAX_CONNECTIONS", 1024))
+KEEPALIVE_TIMEOUT = float(os.environ.get("KEEPALIVE_TIMEOUT", 15))
+# A new connection must start its first request, and a worker waits for a
+# request line, at most this long; shorter than KEEPALIVE_TIMEOUT so silent
+# or trickling clients cannot hold the server.
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", 5))
+
+# In-memory file cache used by the production handler. Files larger than
+# CACHE_MAX_FILE_BYTES are always streamed from disk.
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_MAX_FILE_BYTES = int(os.environ.get("CACHE_MAX_FILE_BYTES", 4 * 1024 * 1024))
+
+# Request instrumentation exposed to loopback clients at METRICS_PATH in the
+# Prometheus text format. Paths beyond METRICS_MAX_PATHS are folded into a
+# single "__other__" series to bound label cardinality.
+METRICS_PATH = os.environ.get("METRICS_PATH", "/__metrics")
+METRICS_MAX_PATHS = int(os.environ.get("METRICS_MAX_PATHS", 500))
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Access logging for the production handler: "sync" writes each line to
+# stderr as it happens (the stdlib behaviour), "buffered" hands lines to a
+# background thread that flushes them in batches, "off" disables it. Error
+# lines (bad requests, timeouts) follow the same setting.
+ACCESS_LOG = os.environ.get("ACCESS_LOG", "sync")
+ACCESS_LOG_FLUSH_INTERVAL = float(os.environ.get("ACCESS_LOG_FLUSH_INTERVAL", 1.0))
+
+# Sandbox mode ("on") serves only files under the allowlisted SANDBOX_ROOTS
+# instead of the whole working directory. Each root is "directory" (served
+# at /directory/) or "directory=/url/prefix/"; earlier roots win when URLs
+# collide. Dotfiles are never served and directories are never listed. The
+# route table is rescanned every SANDBOX_POLL_INTERVAL seconds.
+SANDBOX = os.environ.get("SANDBOX", "off")
+SANDBOX_ROOTS = os.environ.get("SANDBOX_ROOTS", "attached_assets,public,dist/public=/")
+SANDBOX_POLL_INTERVAL = float(os.environ.get("SANDBOX_POLL_INTERVAL", 2.0))
+
+
+CachedFile = namedtuple("CachedFile", ["body", "mtime_ns", "size"])
+# An accepted socket that has not sent anything yet.
+NewConnection = namedtuple("NewConnection", ["request", "client_address"])
+
+
+class FileCache:
+    """LRU cache of file contents bounded by the total number of cached bytes.
+
+    Entries are keyed by path and validated against the file's mtime and size,
+    so an edited file is re-read on the next request without any explicit
+    invalidation.
+    """
+
+    def __init__(self, max_bytes, max_file_bytes):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, st):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.mtime_ns != st.st_mtime_ns or entry.size != st.st_size:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry.body
+
+    def stats(self):
+        """Return ``(hits, misses, cached_bytes, entries)`` as one consistent snapshot."""
+        with self._lock:
+            return self.hits, self.misses, self.current_bytes, len(self._entries)
+
+    def put(self, path, st, body):
+        if len(body) > self.max_file_bytes or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.current_bytes -= len(old.body)
+            # size is only the staleness key; the budget counts the bytes held.
+            self._entries[path] = CachedFile(body, st.st_mtime_ns, st.st_size)
+            self.current_bytes += len(body)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted.body)
+
+
+FILE_CACHE = FileCache(CACHE_MAX_BYTES, CACHE_MAX_FILE_BYTES)
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with interpolated quantile estimates."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating inside the matching bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+                if index == len(LATENCY_BUCKETS):
+                    return lower
+                return lower + (LATENCY_BUCKETS[index] - lower) * (rank - seen) / count
+            seen += count
+        return LATENCY_BUCKETS[-1]
+
+
+class Metrics:
+    """Thread-safe request counters for the production handler."""
+
+    def __init__(self, max_paths):
+        self.max_paths = max_paths
+        self.requests = {}
+        self.bytes_sent = {}
+        self.latency = {}
+        self.connections_in_flight = 0
+        self.requests_in_flight = 0
+        self._lock = threading.Lock()
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections_in_flight += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.connections_in_flight -= 1
+
+    def request_started(self):
+        with self._lock:
+            self.requests_in_flight += 1
+
+    def request_finished(self, path, status, nbytes, seconds):
+        with self._lock:
+            self.requests_in_flight -= 1
+            if path not in self.latency and len(self.latency) >= self.max_paths:
+                path = "__other__"
+            key = (path, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent[path] = self.bytes_sent.get(path, 0) + nbytes
+            histogram = self.latency.get(path)
+            if histogram is None:
+                histogram = self.latency[path] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def render(self, file_cache):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            requests = sorted(self.requests.items())
+            bytes_sent = sorted(self.bytes_sent.items())
+            latency = []
+            for path in sorted(self.latency):
+                snapshot = LatencyHistogram()
+                snapshot.merge(self.latency[path])
+                latency.append((path, snapshot))
+            connections = self.connections_in_flight
+            in_flight = self.requests_in_flight
+        cache_hits, cache_misses, cache_bytes, cache_entries = file_cache.stats()
+
+        lines = [
+            "# HELP static_http_requests_total Requests served, by path and status code.",
+            "# TYPE static_http_requests_total counter",
+        ]
+        for (path, status), count in requests:
+            lines.append(f'static_http_requests_total{{path="{escape_label(path)}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP static_http_response_bytes_total Response body bytes sent, by path.",
+            "# TYPE static_http_response_bytes_total counter",
+        ]
+        for path, nbytes in bytes_sent:
+            lines.append(f'static_http_response_bytes_total{{path="{escape_label(path)}"}} {nbytes}')
+
+        overall = LatencyHistogram()
+        lines += [
+            "# HELP static_http_request_duration_seconds Time from request line to response sent.",
+            "# TYPE static_http_request_duration_seconds histogram",
+        ]
+        for path, histogram in latency:
+            overall.merge(histogram)
+            label = escape_label(path)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'static_http_request_duration_seconds_bucket{{path="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'static_http_request_duration_seconds_bucket{{path="{label}",le="+Inf"}} {histogram.count}')
+            lines.append(f'static_http_request_duration_seconds_sum{{path="{label}"}} {histogram.sum:.6f}')
+            lines.append(f'static_http_request_duration_seconds_count{{path="{label}"}} {histogram.count}')
+
+        lines += [
+            "# HELP static_http_request_duration_quantile_seconds Latency quantiles estimated from the histogram; path=\"*\" covers all paths.",
+            "# TYPE static_http_request_duration_quantile_seconds gauge",
+        ]
+        for path, histogram in latency + [("*", overall)]:
+            label = escape_label(path)
+            for q in (0.5, 0.95, 0.99):
+                lines.append(
+                    f'static_http_request_duration_quantile_seconds{{path="{label}",quantile="{q}"}} {histogram.quantile(q):.6f}'
+                )
+
+        lookups = cache_hits + cache_misses
+        lines += [
+            "# HELP static_file_cache_hits_total In-memory file cache hits.",
+            "# TYPE static_file_cache_hits_total counter",
+            f"static_file_cache_hits_total {cache_hits}",
+            "# HELP static_file_cache_misses_total In-memory file cache misses.",
+            "# TYPE static_file_cache_misses_total counter",
+            f"static_file_cache_misses_total {cache_misses}",
+            "# HELP static_file_cache_hit_ratio Fraction of cache lookups served from memory.",
+            "# TYPE static_file_cache_hit_ratio gauge",
+            f"static_file_cache_hit_ratio {cache_hits / lookups if lookups else 0.0:.6f}",
+            "# HELP static_file_cache_bytes Bytes currently held in the file cache.",
+            "# TYPE static_file_cache_bytes gauge",
+            f"static_file_cache_bytes {cache_bytes}",
+            "# HELP static_file_cache_entries Files currently held in the file cache.",
+            "# TYPE static_file_cache_entries gauge",
+            f"static_file_cache_entries {cache_entries}",
+            "# HELP static_http_connections_in_flight Open client connections.",
+            "# TYPE static_http_connections_in_flight gauge",
+            f"static_http_connections_in_flight {connections}",
+            "# HELP static_http_requests_in_flight Requests currently being handled.",
+            "# TYPE static_http_requests_in_flight gauge",
+            f"static_http_requests_in_flight {in_flight}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics(METRICS_MAX_PATHS)
+
+
+class BufferedLogWriter:
+    """Collects log lines on a queue and writes them from a background thread.
+
+    Request threads only pay for a queue put; the writer thread drains the
+    queue and issues one write per batch at most every ``flush_interval``.
+    """
+
+    def __init__(self, stream, flush_interval):
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+        self._thread.start()
+
+    def write(self, line):
+        self._queue.put(line)
+
+    def _run(self):
+        while True:
+            lines = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    lines.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.stream.write("".join(lines))
+            self.stream.flush()
+
+
+# Content-fingerprinted asset names such as "ohio.3f2a9c1b4d5e.svg" (written
+# by scripts/generate_state_maps.py --fingerprint) are served as immutable.
+FINGERPRINTED_NAME = re.compile(r"\.[0-9a-f]{12}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Requests asking for more ranges than this get the full representation.
+MAX_RANGES = int(os.environ.get("MAX_RANGES", 16))
+# A Range bound is plain ASCII digits; int() alone would also take "+5",
+# "1_000" or the "-5" of "bytes=--5".
+RANGE_BOUND = re.compile(r"[0-9]+")
+
+# Precompressed siblings written by scripts/compress_assets.py, in order of
+# preference when the client accepts several codings.
+PRECOMPRESSED_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+
+def make_etag(st, encoding="identity"):
+    """Strong validator derived from the file's modification time and size."""
+    if encoding == "identity":
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}-{encoding}"'
+
+
+def parse_accept_encoding(header):
+    """Parse an Accept-Encoding header into a ``{coding: qvalue}`` dict."""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def parse_range_header(header, size):
+    """Parse a ``bytes=`` Range header into inclusive ``(start, end)`` pairs.
+
+    Returns None when the header is malformed or should be ignored (the full
+    representation is sent), and an empty list when no range is satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for item in spec.split(","):
+        first, sep, last = item.strip().partition("-")
+        first, last = first.strip(), last.strip()
+        bounds = [bound for bound in (first, last) if bound]
+        if not sep or not bounds or not all(RANGE_BOUND.fullmatch(bound) for bound in bounds):
+            return None
+        if first:
+            start = int(first)
+            end = int(last) if last else None
+            if end is not None and start > end:
+                return None
+        else:
+            suffix_length = int(last)
+            start = max(size - suffix_length, 0)
+            end = size - 1
+            if suffix_length == 0:
+                continue
+        if start >= size:
+            continue
+        ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+class ResponseBody:
+    """Response payload made of byte ranges of a cached buffer or open file.
+
+    ``parts`` holds ``(offset, length)`` slices of ``source`` interleaved with
+    literal ``bytes`` chunks (the multipart/byteranges delimiters). File
+    slices go out through ``socket.sendfile`` so the kernel copies them
+    straight from the page cache; cached buffers are written without copying
+    via memoryview slices.
+    """
+
+    def __init__(self, source, parts):
+        self.source = source
+        self.parts = parts
+        self.length = sum(len(part) if isinstance(part, bytes) else part[1] for part in parts)
+
+    def send(self, sock, wfile):
+        sent = 0
+        for part in self.parts:
+            if isinstance(part, bytes):
+                wfile.write(part)
+                sent += len(part)
+                continue
+            offset, length = part
+            if isinstance(self.source, bytes):
+                wfile.write(memoryview(self.source)[offset:offset + length])
+                sent += length
+            else:
+                sent += sock.sendfile(self.source, offset, length)
+        return sent
+
+    def close(self):
+        if not isinstance(self.source, bytes):
+            self.source.close()
+
+
+Route = namedtuple("Route", ["path", "st", "siblings"])
+
+
+def parse_sandbox_roots(value):
+    """Parse SANDBOX_ROOTS into ``(directory, url_prefix)`` pairs."""
+    roots = []
+    for item in value.split(","):
+        directory, separator, prefix = item.partition("=")
+        directory = directory.strip().rstrip("/")
+        if not directory:
+            continue
+        prefix = prefix.strip().strip("/") if separator else directory
+        roots.append((directory, f"/{prefix}/" if prefix else "/"))
+    return roots
+
+
+class RouteTable:
+    """In-memory map from URL path to file for the sandbox roots.
+
+    Built by walking each root once, so a request costs one dict lookup
+    instead of path translation and stat calls, and anything outside the
+    roots (``.env``, ``.git``, ``scripts/cache``) has no route at all.
+    ``refresh`` rescans and swaps in a new dict, which request threads pick
+    up without locking.
+    """
+
+    INDEX_NAMES = ("index.html", "index.htm")
+
+    def __init__(self, roots):
+        self.roots = roots
+        self.routes = {}
+        self.refresh()
+
+    def lookup(self, url_path):
+        return self.routes.get(url_path)
+
+    def refresh(self):
+        self.routes = self.scan()
+
+    def scan(self):
+        routes = {}
+        for directory, prefix in self.roots:
+            files = {}
+            self._walk(os.path.realpath(directory), "", files)
+            for relative, (path, st) in files.items():
+                siblings = {}
+                for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+                    if relative + suffix in files:
+                        siblings[encoding] = files[relative + suffix]
+                route = Route(path, st, siblings)
+                routes.setdefault(prefix + relative, route)
+                folder, _, name = relative.rpartition("/")
+                if name in self.INDEX_NAMES:
+                    index_url = prefix + folder + "/" if folder else prefix
+                    if name == self.INDEX_NAMES[0] or index_url not in routes:
+                        routes[index_url] = route
+        return routes
+
+    def _walk(self, real_root, relative, files):
+        try:
+            entries = list(os.scandir(os.path.join(real_root, relative)))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    self._walk(real_root, entry_relative, files)
+                    continue
+                if not entry.is_file():
+                    continue
+                if entry.is_symlink():
+                    target = os.path.realpath(entry.path)
+                    if os.path.commonpath([real_root, target]) != real_root:
+                        continue
+                files[entry_relative] = (entry.path, entry.stat())
+            except OSError:
+                continue
+
+    def watch(self, interval):
+        """Rescan every ``interval`` seconds from a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+
+        threading.Thread(target=run, name="route-table", daemon=True).start()
+
+
+class StaticHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler that keeps HTTP/1.1 connections open between requests."""
+
+    protocol_version = "HTTP/1.1"
+    # Keep-alive responses go out as separate header and body writes; with
+    # Nagle's algorithm the body waits for the client's delayed ACK (~40ms)
+    # on every reused connection, so set TCP_NODELAY.
+    disable_nagle_algorithm = True
+    # Socket timeout while serving a request; PooledHTTPServer also closes
+    # keep-alive connections left idle for this long. The request line
+    # itself is read with REQUEST_TIMEOUT.
+    timeout = KEEPALIVE_TIMEOUT
+
+    log_writer = None
+    # RouteTable of the sandbox roots; None serves the working directory.
+    routes = None
+    # Set when handle() returns with the connection open but no request
+    # waiting; PooledHTTPServer then parks it instead of closing it.
+    idle = False
+
+    def setup(self):
+        super().setup()
+        METRICS.connection_opened()
+
+    def handle(self):
+        """Serve requests until the connection closes or goes idle.
+
+        Under a server with ``parks_idle_connections`` the worker only
+        serves requests that have already arrived; a keep-alive connection
+        with nothing to read is marked ``idle`` and returned to the server
+        rather than blocking the worker until the client's next request.
+        """
+        if not getattr(self.server, "parks_idle_connections", False):
+            super().handle()
+            return
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self.request_pending():
+                self.idle = True
+                return
+            self.handle_one_request()
+
+    def resume(self):
+        """Serve a parked connection that has become readable."""
+        self.idle = False
+        try:
+            self.handle()
+        finally:
+            self.finish()
+
+    def request_pending(self):
+        """Whether bytes of a next request are buffered or readable right now."""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            # Let handle_one_request hit (and handle) the same error.
+            return True
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def finish(self):
+        if self.idle:
+            return
+        try:
+            super().finish()
+        finally:
+            METRICS.connection_closed()
+
+    def parse_request(self):
+        # Called once the request line has been read, so idle keep-alive time
+        # is not counted as request latency.
+        self.connection.settimeout(self.timeout)
+        self._request_started = time.perf_counter()
+        self._bytes_sent = 0
+        METRICS.request_started()
+        return super().parse_request()
+
+    def handle_one_request(self):
+        # parse_request restores self.timeout once the line is in.
+        self.connection.settimeout(REQUEST_TIMEOUT)
+        self._request_started = None
+        self._response_status = 0
+        try:
+            super().handle_one_request()
+        finally:
+            if self._request_started is not None:
+                path = urllib.parse.urlsplit(getattr(self, "path", "") or "").path or "-"
+                METRICS.request_finished(
+                    path,
+                    self._response_status,
+                    self._bytes_sent,
+                    time.perf_counter() - self._request_started,
+                )
+
+    def send_response(self, code, message=None):
+        self._response_status = int(code)
+        super().send_response(code, message)
+
+    def log_request(self, code="-", size="-"):
+        if ACCESS_LOG != "off":
+            super().log_request(code, size)
+
+    def log_error(self, format, *args):
+        if ACCESS_LOG != "off":
+            self.log_message(format, *args)
+
+    def log_message(self, format, *args):
+        if self.log_writer is None:
+            super().log_message(format, *args)
+            return
+        self.log_writer.write(
+            f"{self.address_string()} - - [{self.log_date_time_string()}] {format % args}\n"
+        )
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path == METRICS_PATH:
+            self.send_metrics()
+        else:
+            super().do_GET()
+
+    def do_HEAD(self):
+        if urllib.parse.urlsplit(self.path).path == METRICS_PATH:
+            self.send_metrics()
+        else:
+            super().do_HEAD()
+
+    def send_metrics(self):
+        """Serve METRICS to loopback clients only."""
+        if not ipaddress.ip_address(self.client_address[0]).is_loopback:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+        body = METRICS.render(FILE_CACHE).encode("utf-8")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+            self._bytes_sent += len(body)
+
+    def send_head(self):
+        siblings = None
+        if self.routes is not None:
+            route = self.routes.lookup(urllib.parse.unquote(urllib.parse.urlsplit(self.path).path))
+            if route is None:
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+            path, st, siblings = route
+        else:
+            path = self.translate_path(self.path)
+            if os.path.isdir(path) or path.endswith("/"):
+                return super().send_head()
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+            if not stat.S_ISREG(st.st_mode):
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+
+        ctype = self.guess_type(path)
+        path, st, encoding = self.select_encoding(path, st, siblings)
+
+        etag = make_etag(st, encoding)
+        if self.is_not_modified(etag, st):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_validators(etag, st)
+            self.end_headers()
+            return None
+
+        source = FILE_CACHE.get(path, st)
+        if source is None:
+            try:
+                f = open(path, "rb")
+            except OSError:
+                self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+                return None
+            st = os.fstat(f.fileno())
+            etag = make_etag(st, encoding)
+            if st.st_size <= FILE_CACHE.max_file_bytes:
+                with f:
+                    source = f.read()
+                FILE_CACHE.put(path, st, source)
+            else:
+                source = f
+
+        ranges = None
+        if "Range" in self.headers and self.if_range_matches(etag, st):
+            ranges = parse_range_header(self.headers["Range"], st.st_size)
+            if ranges == []:
+                if not isinstance(source, bytes):
+                    source.close()
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{st.st_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+
+        if not ranges:
+            body = ResponseBody(source, [(0, st.st_size)])
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-type", ctype)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            body = ResponseBody(source, [(start, end - start + 1)])
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-type", ctype)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+        else:
+            boundary = secrets.token_hex(16)
+            parts = []
+            for start, end in ranges:
+                parts.append((
+                    f"\r\n--{boundary}\r\n"
+                    f"Content-Type: {ctype}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{st.st_size}\r\n\r\n"
+                ).encode("latin-1"))
+                parts.append((start, end - start + 1))
+            parts.append(f"\r\n--{boundary}--\r\n".encode("latin-1"))
+            body = ResponseBody(source, parts)
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-type", f"multipart/byteranges; boundary={boundary}")
+
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(body.length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_validators(etag, st)
+        self.end_headers()
+        return body
+
+    def send_validators(self, etag, st):
+        """Send the caching headers shared by 200, 206 and 304 responses."""
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+        self.send_header("Vary", "Accept-Encoding")
+        if FINGERPRINTED_NAME.search(urllib.parse.urlsplit(self.path).path):
+            # The name changes whenever the content does, so clients never
+            # need to revalidate.
+            self.send_header("Cache-Control", IMMUTABLE_CACHE_CONTROL)
+
+    def copyfile(self, source, outputfile):
+        if isinstance(source, ResponseBody):
+            self._bytes_sent += source.send(self.connection, outputfile)
+            return
+        # Directory listings and index pages from SimpleHTTPRequestHandler.
+        while True:
+            chunk = source.read(64 * 1024)
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            self._bytes_sent += len(chunk)
+
+    def select_encoding(self, path, st, siblings=None):
+        """Pick a precompressed sibling of ``path`` that the client accepts.
+
+        Returns ``(path, stat_result, content_coding)``. A sibling is only
+        used when it is at least as new as the file it was compressed from,
+        so a stale ``.gz`` never shadows a freshly regenerated asset.
+        ``siblings`` (``{coding: (path, stat_result)}`` from the route table)
+        replaces the stat calls when given.
+        """
+        accepted = parse_accept_encoding(self.headers.get("Accept-Encoding", ""))
+        candidates = sorted(
+            PRECOMPRESSED_SUFFIXES,
+            key=lambda item: -accepted.get(item[0], accepted.get("*", 0)),
+        )
+        for encoding, suffix in candidates:
+            if accepted.get(encoding, accepted.get("*", 0)) <= 0:
+                continue
+            if siblings is not None:
+                if encoding not in siblings:
+                    continue
+                sibling_path, sibling_st = siblings[encoding]
+            else:
+                sibling_path = path + suffix
+                try:
+                    sibling_st = os.stat(sibling_path)
+                except OSError:
+                    continue
+            if stat.S_ISREG(sibling_st.st_mode) and sibling_st.st_mtime_ns >= st.st_mtime_ns:
+                return sibling_path, sibling_st, encoding
+        return path, st, "identity"
+
+    def is_not_modified(self, etag, st):
+        """Evaluate If-None-Match / If-Modified-Since against the current file."""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-None-Match uses weak comparison and takes precedence over
+            # If-Modified-Since (RFC 9110, section 13.1.2).
+            if if_none_match.strip() == "*":
+                return True
+            candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return etag in candidates
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is None:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        return int(st.st_mtime) <= ims.timestamp()
+
+    def if_range_matches(self, etag, st):
+        """Return True when a Range request should be honoured (RFC 9110, 13.1.5)."""
+        if_range = self.headers.get("If-Range")
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith(('"', 'W/"')):
+            # If-Range requires a strong comparison.
+            return if_range == etag
+        try:
+            date = email.utils.parsedate_to_datetime(if_range)
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return int(st.st_mtime) == int(date.timestamp())
+
+
+class IdleConnections:
+    """Connections waiting, without a worker, for their next request.
+
+    Entries are watched by one selector thread. One that becomes readable
+    is passed to ``dispatch``; one still silent after its ``timeout`` is
+    passed to ``expire``. Entries arrive from other threads through a
+    queue, so only the selector thread touches the selector.
+    """
+
+    def __init__(self, dispatch, expire):
+        self.dispatch = dispatch
+        self.expire = expire
+        self.selector = selectors.DefaultSelector()
+        # entry -> (connection, deadline), plus a heap of (deadline, seq,
+        # entry) whose stale items (entry gone or re-parked) are skipped.
+        self.waiting = {}
+        self._deadlines = []
+        self._sequence = 0
+        self._parked = queue.SimpleQueue()
+        self._closed = False
+        self._wakeup_read, self._wakeup_write = socket.socketpair()
+        self._wakeup_read.setblocking(False)
+        self.selector.register(self._wakeup_read, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, name="idle-connections", daemon=True)
+        self._thread.start()
+
+    def park(self, connection, entry, timeout):
+        """Watch ``connection`` for ``entry`` until it is readable or ``timeout`` passes."""
+        self._parked.put((connection, entry, timeout))
+        self._wakeup()
+
+    def close(self):
+        self._closed = True
+        self._wakeup()
+        self._thread.join()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_write.send(b"\0")
+        except OSError:
+            pass
+
+    def _next_deadline(self):
+        """Drop stale heap items and return the earliest live deadline (or None)."""
+        while self._deadlines:
+            deadline, _, entry = self._deadlines[0]
+            waiting = self.waiting.get(entry)
+            if waiting is not None and waiting[1] == deadline:
+                return deadline
+            heapq.heappop(self._deadlines)
+        return None
+
+    def _run(self):
+        while not self._closed:
+            timeout = None
+            deadline = self._next_deadline()
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+            for key, _ in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self._wakeup_read.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.selector.unregister(key.fileobj)
+                del self.waiting[key.data]
+                self.dispatch(key.data)
+
+            while True:
+                try:
+                    connection, entry, timeout = self._parked.get_nowait()
+                except queue.Empty:
+                    break
+                deadline = time.monotonic() + timeout
+                self.selector.register(connection, selectors.EVENT_READ, entry)
+                self.waiting[entry] = (connection, deadline)
+                self._sequence += 1
+                heapq.heappush(self._deadlines, (deadline, self._sequence, entry))
+
+            now = time.monotonic()
+            while (deadline := self._next_deadline()) is not None and deadline <= now:
+                _, _, entry = heapq.heappop(self._deadlines)
+                connection, _ = self.waiting.pop(entry)
+                self.selector.unregister(connection)
+                self.expire(entry)
+
+        for entry, (connection, _) in list(self.waiting.items()):
+            self.selector.unregister(connection)
+            self.expire(entry)
+        self.waiting.clear()
+        self.selector.close()
+        self._wakeup_read.close()
+        self._wakeup_write.close()
+
+
+class PooledHTTPServer(http.server.HTTPServer):
+    """HTTP server that serves requests from a fixed-size thread pool.
+
+    Workers only ever run requests that have arrived: a newly accepted
+    connection waits in ``IdleConnections`` until it sends something (for
+    at most REQUEST_TIMEOUT), and between requests a keep-alive connection
+    is parked there again (for at most the handler's timeout), so neither
+    costs a thread. At most ``workers`` connections are handed to the pool
+    at once; a connection that becomes readable while all are busy joins a
+    pending queue, and each worker that finishes takes the next one from
+    it, so the selector thread never waits and keeps expiring silent
+    connections under load. At most ``max_connections`` connections are
+    accepted at once; further clients wait in the listen backlog (of
+    ``backlog`` entries) until one closes.
+    """
+
+    parks_idle_connections = True
+    # How often a blocked accept checks whether the server is shutting down.
+    accept_poll_interval = 0.5
+
+    def __init__(self, server_address, handler_class, workers, backlog, max_connections=SERVER_MAX_CONNECTIONS):
+        self.request_queue_size = backlog
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-worker")
+        self.slots = threading.BoundedSemaphore(workers)
+        self.connections = threading.BoundedSemaphore(max_connections)
+        # Readable entries waiting for a worker slot; guarded by _pending_lock
+        # together with the slot handoff.
+        self._pending = deque()
+        self._pending_lock = threading.Lock()
+        self._stopping = False
+        self.idle_connections = IdleConnections(self._dispatch, self._expire)
+        super().__init__(server_address, handler_class)
+
+    def get_request(self):
+        """Accept a connection once fewer than ``max_connections`` are open."""
+        while not self.connections.acquire(timeout=self.accept_poll_interval):
+            if self._stopping:
+                # serve_forever treats OSError as "nothing accepted".
+                raise OSError("server is shutting down")
+        try:
+            return super().get_request()
+        except OSError:
+            self.connections.release()
+            raise
+
+    def shutdown_request(self, request):
+        try:
+            super().shutdown_request(request)
+        finally:
+            self.connections.release()
+
+    def process_request(self, request, client_address):
+        self.idle_connections.park(request, NewConnection(request, client_address), REQUEST_TIMEOUT)
+
+    def park(self, handler):
+        self.idle_connections.park(handler.connection, handler, handler.timeout)
+
+    def _dispatch(self, entry):
+        # Runs on the selector thread, so it must never wait for a worker.
+        with self._pending_lock:
+            if not self.slots.acquire(blocking=False):
+                self._pending.append(entry)
+                return
+        self._submit(entry)
+
+    def _release_slot(self):
+        """Hand the finished worker's slot to the next pending entry, or free it."""
+        with self._pending_lock:
+            if not self._pending:
+                self.slots.release()
+                return
+            entry = self._pending.popleft()
+        self._submit(entry)
+
+    def _submit(self, entry):
+        if isinstance(entry, NewConnection):
+            self.pool.submit(self._process_request_in_worker, entry.request, entry.client_address)
+        else:
+            self.pool.submit(self._process_request_in_worker, entry.request, entry.client_address, entry)
+
+    def _process_request_in_worker(self, request, client_address, handler=None):
+        try:
+            if handler is None:
+                handler = self.RequestHandlerClass(request, client_address, self)
+            else:
+                handler.resume()
+            if handler.idle:
+                self.park(handler)
+                return
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self._release_slot()
+        self.shutdown_request(request)
+
+    def _expire(self, entry):
+        if isinstance(entry, NewConnection):
+            self.shutdown_request(entry.request)
+            return
+        entry.idle = False
+        try:
+            entry.finish()
+        except OSError:
+            pass
+        self.shutdown_request(entry.request)
+
+    def shutdown(self):
+        self._stopping = True
+        super().shutdown()
+
+    def server_close(self):
+        self._stopping = True
+        super().server_close()
+        self.idle_connections.close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        with self._pending_lock:
+            pending, self._pending = list(self._pending), deque()
+        for entry in pending:
+            self._expire(entry)
+
+
+class SimpleSandboxHandler(StaticHandler):
+    """StaticHandler for the single-threaded simple mode: one request per connection."""
+
+    protocol_version = "HTTP/1.0"
+
+
+def make_server():
+    if SANDBOX == "on":
+        StaticHandler.routes = RouteTable(parse_sandbox_roots(SANDBOX_ROOTS))
+        StaticHandler.routes.watch(SANDBOX_POLL_INTERVAL)
+    elif SANDBOX != "off":
+        raise SystemExit(f"Unknown SANDBOX: {SANDBOX!r} (expected 'on' or 'off')")
+    if SERVER_MODE == "production":
+        if ACCESS_LOG == "buffered":
+            StaticHandler.log_writer = BufferedLogWriter(sys.stderr, ACCESS_LOG_FLUSH_INTERVAL)
+        elif ACCESS_LOG not in ("sync", "off"):
+            raise SystemExit(f"Unknown ACCESS_LOG: {ACCESS_LOG!r} (expected 'sync', 'buffered' or 'off')")
+        return PooledHTTPServer(("", PORT), StaticHandler, SERVER_WORKERS, SERVER_BACKLOG, SERVER_MAX_CONNECTIONS)
+    if SERVER_MODE != "simple":
+        raise SystemExit(f"Unknown SERVER_MODE: {SERVER_MODE!r} (expected 'simple' or 'production')")
+    if SANDBOX == "on":
+        return socketserver.TCPServer(("", PORT), SimpleSandboxHandler)
+    return socketserver.TCPServer(("", PORT), http.server.SimpleHTTPRequestHandler)
+
+
+def main():
+    with make_server() as httpd:
+        if SERVER_MODE == "production":
+            print(f"serving at port {PORT} ({SERVER_WORKERS} workers, keep-alive {KEEPALIVE_TIMEOUT:g}s)")
+        else:
+            print("serving at port", PORT)
+        if StaticHandler.routes is not None:
+            roots = ", ".join(f"{directory} at {prefix}" for directory, prefix in StaticHandler.routes.roots)
+            print(f"sandbox: {len(StaticHandler.routes.routes)} routes from {roots}")
+        httpd.serve_forever()
+
 
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    print("serving at port", PORT)
-    httpd.serve_forever()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Python tooling for the map assets; run ``python -m scripts --help``."""
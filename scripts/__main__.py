@@ -0,0 +1,90 @@
+"""
+Entry point for the Python tooling. Run from the repository root:
+
+    python -m scripts maps [options]         generate_state_maps.py
+    python -m scripts boundaries [options]   generate_state_boundaries.py
+    python -m scripts compress [targets]     compress_assets.py
+    python -m scripts benchmark [options]    benchmark.py
+    python -m scripts serve [--port N] [--mode simple|production] [--sandbox]
+
+Only the chosen command's module is imported, so geopandas, shapely and
+matplotlib load only for the commands that use them. Before importing a
+generator, maps and boundaries check the build manifest for an identical
+earlier run whose inputs and outputs are all unchanged; if there is one,
+they exit immediately (--force, --timings and --profile always run).
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# command: (module, name recorded in the build manifest for fast checks or None)
+COMMANDS = {
+    "maps": ("generate_state_maps", "generate_state_maps"),
+    "boundaries": ("generate_state_boundaries", "generate_state_boundaries"),
+    "compress": ("compress_assets", None),
+    "benchmark": ("benchmark", None),
+    "serve": (None, None),
+}
+
+# Flags that ask for real work even when nothing changed.
+FAST_PATH_BYPASS = {"--force", "--timings", "--profile", "-h", "--help"}
+
+
+def is_up_to_date(run_name, argv):
+    if any(arg.split("=", 1)[0] in FAST_PATH_BYPASS for arg in argv):
+        return False
+    from build_manifest import BuildManifest, run_key
+    return BuildManifest().run_is_current(run_key(run_name, argv))
+
+
+def serve(argv):
+    parser = argparse.ArgumentParser(prog="python -m scripts serve", description="Run the static server (main.py).")
+    parser.add_argument("--port", type=int, help="port to listen on (default: $PORT or 8080)")
+    parser.add_argument("--mode", choices=["simple", "production"], help="SERVER_MODE (default: $SERVER_MODE or simple)")
+    parser.add_argument("--sandbox", action="store_true",
+                        help="serve only the allowlisted SANDBOX_ROOTS from an in-memory route table")
+    args = parser.parse_args(argv)
+    # main.py reads its configuration from the environment at import time.
+    if args.port is not None:
+        os.environ["PORT"] = str(args.port)
+    if args.mode is not None:
+        os.environ["SERVER_MODE"] = args.mode
+    if args.sandbox:
+        os.environ["SANDBOX"] = "on"
+    sys.path.insert(0, REPO_ROOT)
+    importlib.import_module("main").main()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m scripts", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the command (see COMMAND --help)")
+    args = parser.parse_args(argv)
+
+    # The scripts import their siblings as top-level modules.
+    sys.path.insert(0, SCRIPT_DIR)
+    # Usage messages of the command's own parser show how it was invoked.
+    sys.argv[0] = f"python -m scripts {args.command}"
+
+    if args.command == "serve":
+        return serve(args.args)
+
+    module_name, run_name = COMMANDS[args.command]
+    if run_name is not None:
+        started = time.perf_counter()
+        if is_up_to_date(run_name, args.args):
+            print(f"{args.command}: up to date ({(time.perf_counter() - started) * 1000:.0f} ms check; --force to rebuild)")
+            return
+    importlib.import_module(module_name).main(args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Benchmark the map generators and the static server.
+
+Runs offline against the cached Census state shapefile and a GeoJSON fixture
+built from it, timing each generator stage separately, then load-tests
+main.py with concurrent keep-alive clients. Results are written as JSON so
+runs can be compared with --compare.
+
+Run from the repository root:
+
+    python scripts/benchmark.py --output before.json
+    python scripts/benchmark.py --compare before.json
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# The generators and the GIS stack they use are imported by the benchmarks
+# that need them, so --help and server-only runs start without them.
+from build_manifest import atomic_write
+
+CACHE_DIR = "scripts/cache"
+FIXTURE_PATH = os.path.join(CACHE_DIR, "fixtures", "us-states.geojson")
+
+SERVER_PATHS = [
+    "/attached_assets/state_maps/metros_data.json",
+    "/client/src/data/stateBoundaries.ts",
+] + [f"/attached_assets/state_maps/{slug}.svg" for slug in ("california", "texas", "new-york", "florida", "alaska")]
+
+
+def time_stage(function, repeat):
+    """Run ``function`` ``repeat`` times; return wall/CPU statistics in seconds."""
+    wall = []
+    cpu = []
+    for _ in range(repeat):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        function()
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+    return {
+        "runs": repeat,
+        "min": min(wall),
+        "median": statistics.median(wall),
+        "mean": statistics.fmean(wall),
+        "cpu_median": statistics.median(cpu),
+    }
+
+
+def quietly(function):
+    """Wrap ``function`` so the generators' progress output is discarded."""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return run
+
+
+def build_fixture(shapefile_path, fixture_path=FIXTURE_PATH):
+    """Write the states as a GeoJSON FeatureCollection with a ``name`` property."""
+    import geopandas as gpd
+
+    if os.path.exists(fixture_path):
+        return fixture_path
+    states = gpd.read_file(shapefile_path)[["NAME", "geometry"]].rename(columns={"NAME": "name"})
+    os.makedirs(os.path.dirname(fixture_path), exist_ok=True)
+    atomic_write(fixture_path, states.to_json())
+    return fixture_path
+
+
+def benchmark_maps(shapefile_path, repeat):
+    """Time the stages of generate_state_maps.py for every state with metros."""
+    import geopandas as gpd
+    import numpy as np
+    import shapely
+
+    import generate_state_maps as maps
+
+    slugs = [slug for slug in maps.SLUG_TO_FIPS if maps.STATE_METROS.get(slug)]
+    fips_codes = [maps.SLUG_TO_FIPS[slug] for slug in slugs]
+    # Make sure the WKB cache exists so the load stage measures a warm read.
+    geometries = quietly(lambda: maps.load_state_geometries(shapefile_path, fips_codes))()
+    states = [(slug, geometries[maps.SLUG_TO_FIPS[slug]]) for slug in slugs if maps.SLUG_TO_FIPS[slug] in geometries]
+    options = maps.RENDER_OPTIONS
+    frames = {
+        slug: maps.state_frame(geometry.bounds, options["width"], options["height"], options["padding"])
+        for slug, geometry in states
+    }
+
+    def transform():
+        for slug, geometry in states:
+            min_x, min_y, scale, _, _ = frames[slug]
+            rings = np.asarray(maps.geometry_rings(geometry), dtype=object)
+            coords = shapely.get_coordinates(rings)
+            maps.transform_coordinates(coords, min_x, min_y, scale, scale, options["height"])
+
+    def encode_paths():
+        for slug, geometry in states:
+            min_x, min_y, scale, _, _ = frames[slug]
+            maps.geometry_to_svg_path(geometry, min_x, min_y, scale, scale, options["height"])
+
+    def render():
+        return [
+            (slug, maps.generate_state_svg(geometry, slug, maps.STATE_METROS[slug], **options))
+            for slug, geometry in states
+        ]
+
+    rendered = render()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        def write():
+            for slug, svg in rendered:
+                atomic_write(os.path.join(output_dir, f"{slug}.svg"), svg)
+
+        return {
+            "states": len(states),
+            "vertices": int(sum(shapely.get_num_coordinates(geometry) for _, geometry in states)),
+            "stages": {
+                "shapefile_read": time_stage(lambda: gpd.read_file(shapefile_path), repeat),
+                "geometry_cache_load": time_stage(quietly(lambda: maps.load_state_geometries(shapefile_path, fips_codes)), repeat),
+                "transform": time_stage(transform, repeat),
+                "path_encoding": time_stage(encode_paths, repeat),
+                "render": time_stage(render, repeat),
+                "write": time_stage(write, repeat),
+            },
+        }
+
+
+def benchmark_boundaries(fixture_path, repeat):
+    """Time the stages of generate_state_boundaries.py on the GeoJSON fixture."""
+    import generate_state_boundaries as boundaries
+
+    tolerance = boundaries.DEFAULT_TOLERANCE_PX
+    zoom = boundaries.DEFAULT_ZOOM
+    precision = boundaries.DEFAULT_PRECISION
+
+    states = list(boundaries.iter_state_rings(fixture_path))
+    vertex_index = boundaries.build_vertex_index(states)
+
+    def simplify():
+        return [
+            (name, [boundaries.simplify_ring(ring, vertex_index, tolerance, zoom) for ring in rings])
+            for name, rings in states
+        ]
+
+    simplified = simplify()
+
+    def encode(state_lines):
+        def run():
+            lines = []
+            for name, rings in simplified:
+                lines.extend(state_lines(boundaries.slugify(name), rings, precision))
+            return '\n'.join(lines)
+        return run
+
+    literal = encode(boundaries.literal_state_lines)()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_path = os.path.join(output_dir, "stateBoundaries.ts")
+        return {
+            "states": len(states),
+            "vertices": int(sum(len(ring) for _, rings in states for ring in rings)),
+            "stages": {
+                "parse": time_stage(lambda: list(boundaries.iter_state_rings(fixture_path)), repeat),
+                "vertex_index": time_stage(lambda: boundaries.build_vertex_index(states), repeat),
+                "simplify": time_stage(simplify, repeat),
+                "encode_literal": time_stage(encode(boundaries.literal_state_lines), repeat),
+                "encode_compact": time_stage(encode(boundaries.compact_state_lines), repeat),
+                "write": time_stage(lambda: atomic_write(output_path, literal), repeat),
+            },
+        }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server did not start listening on port {port}")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def load_test(port, paths, concurrency, duration):
+    """Hit ``paths`` round-robin from ``concurrency`` keep-alive clients for ``duration`` seconds."""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    received = [0] * concurrency
+    deadline = time.perf_counter() + duration
+
+    def client(worker):
+        # http.client reopens the connection by itself when the server
+        # closes it (HTTP/1.0 or Connection: close).
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        request_count = worker
+        while time.perf_counter() < deadline:
+            path = paths[request_count % len(paths)]
+            request_count += 1
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path, headers={"Accept-Encoding": "gzip, br"})
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                errors[worker] += 1
+                connection.close()
+                continue
+            latencies[worker].append(time.perf_counter() - start)
+            if response.status >= 400:
+                errors[worker] += 1
+            received[worker] += len(body)
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(worker,)) for worker in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = sorted(latency for worker_latencies in latencies for latency in worker_latencies)
+    return {
+        "concurrency": concurrency,
+        "duration": elapsed,
+        "requests": len(all_latencies),
+        "errors": sum(errors),
+        "bytes": sum(received),
+        "throughput_rps": len(all_latencies) / elapsed,
+        "latency_ms": {
+            name: None if value is None else value * 1000
+            for name, value in (
+                ("p50", percentile(all_latencies, 0.50)),
+                ("p90", percentile(all_latencies, 0.90)),
+                ("p99", percentile(all_latencies, 0.99)),
+                ("max", all_latencies[-1] if all_latencies else None),
+            )
+        },
+    }
+
+
+def benchmark_server(mode, concurrency, duration, paths=SERVER_PATHS):
+    """Start main.py in ``mode`` on a free port and load-test it."""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), SERVER_MODE=mode, ACCESS_LOG="off")
+    process = subprocess.Popen(
+        [sys.executable, "main.py"], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, process)
+        paths = [path for path in paths if os.path.exists(path.lstrip("/"))]
+        # One untimed pass warms the server's file cache.
+        load_test(port, paths, 1, 0.2)
+        return load_test(port, paths, concurrency, duration)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def flatten_metrics(results):
+    """Map "section.stage" names to the headline number of each measurement."""
+    metrics = {}
+    for section in ("maps", "boundaries"):
+        for stage, stats in results.get(section, {}).get("stages", {}).items():
+            metrics[f"{section}.{stage} (ms)"] = stats["median"] * 1000
+    for mode, stats in results.get("server", {}).items():
+        metrics[f"server.{mode}.throughput (req/s)"] = stats["throughput_rps"]
+        metrics[f"server.{mode}.p99 (ms)"] = stats["latency_ms"]["p99"]
+    return metrics
+
+
+def print_results(results, baseline=None):
+    current = flatten_metrics(results)
+    previous = flatten_metrics(baseline) if baseline else {}
+    width = max(map(len, current), default=0)
+    for name, value in current.items():
+        line = f"{name:<{width}}  {value:>12.3f}" if value is not None else f"{name:<{width}}  {'-':>12}"
+        before = previous.get(name)
+        if value is not None and before:
+            line += f"  (baseline {before:.3f}, {(value - before) / before:+.1%})"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=["maps", "boundaries", "server"],
+                        help="run only these benchmarks (default: all)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs per generator stage (default: %(default)s)")
+    parser.add_argument("--server-modes", nargs="+", choices=["production", "simple"], default=["production"],
+                        help="SERVER_MODE values to load-test (default: production)")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="concurrent server clients (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="seconds per server load test (default: %(default)s)")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = set(args.only or ["maps", "boundaries", "server"])
+    results = {"meta": run_metadata()}
+
+    shapefile_path = os.path.join(CACHE_DIR, "cb_2021_us_state_20m.shp")
+    if selected & {"maps", "boundaries"} and not os.path.exists(shapefile_path):
+        raise SystemExit(f"{shapefile_path} is missing; run scripts/generate_state_maps.py once to download it")
+
+    if "maps" in selected:
+        print("Benchmarking generate_state_maps.py...")
+        results["maps"] = benchmark_maps(shapefile_path, args.repeat)
+    if "boundaries" in selected:
+        print("Benchmarking generate_state_boundaries.py...")
+        results["boundaries"] = benchmark_boundaries(build_fixture(shapefile_path), args.repeat)
+    if "server" in selected:
+        results["server"] = {}
+        for mode in args.server_modes:
+            print(f"Load-testing main.py ({mode}, {args.concurrency} clients, {args.duration:g}s)...")
+            results["server"][mode] = benchmark_server(mode, args.concurrency, args.duration)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print()
+    print_results(results, baseline)
+
+    if args.output:
+        atomic_write(args.output, json.dumps(results, indent=2) + "\n")
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Build manifest shared by the map generators.
+
+Records a hash of every input that went into each generated file so later
+runs can skip outputs whose inputs have not changed, and writes outputs
+atomically (temp file + rename) so a server never sees a half-written file.
+
+It also remembers each successful generator run (its command line, input
+files and outputs) so ``python -m scripts`` can tell a run would be a no-op
+using only the standard library, without importing the generators.
+
+This module must stay free of third-party imports.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_PATH = "scripts/cache/build_manifest.json"
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def stamp_matches(path, stamp, content_hash):
+    """True when ``path`` still holds ``content_hash``.
+
+    An unchanged size and mtime is trusted without reading the file; a
+    touched file is re-hashed, so a rewrite with identical content matches.
+    """
+    try:
+        current = file_stamp(path)
+    except OSError:
+        return False
+    if current["size"] != stamp.get("size"):
+        return False
+    if current["mtime_ns"] == stamp.get("mtime_ns"):
+        return True
+    return file_sha256(path) == content_hash
+
+
+def run_key(name, argv):
+    """Key of a generator run: the generator and its exact command line."""
+    return hash_inputs(name, list(argv))
+
+
+def hash_inputs(*inputs):
+    """Stable hash of JSON-serialisable inputs (dicts are key-sorted)."""
+    encoded = json.dumps(inputs, sort_keys=True, separators=(',', ':'), default=str)
+    return sha256_bytes(encoded.encode('utf-8'))
+
+
+def atomic_write(path, content):
+    """Write ``content`` (str or bytes) to ``path`` via a temp file and rename."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates 0600 files; generated assets must stay world-readable.
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class OutputWriter:
+    """Text writer that hashes everything it writes."""
+
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+        self.changed = False
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.digest.update(data)
+        self._f.write(data)
+
+    def close(self):
+        self._f.close()
+
+
+class BuildManifest:
+    """Maps each output path to the hash of its inputs and of its content."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.outputs = {}
+        self.runs = {}
+        self.dirty = False
+        # Outputs this process found current or wrote, for record_run.
+        self.touched = set()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.outputs = data.get("outputs", {})
+            self.runs = data.get("runs", {})
+        except (OSError, ValueError):
+            self.outputs = {}
+            self.runs = {}
+
+    def is_current(self, output_path, input_hash):
+        """True when ``output_path`` exists unmodified and was built from ``input_hash``."""
+        entry = self.outputs.get(output_path)
+        if entry is None or entry.get("inputs") != input_hash:
+            return False
+        try:
+            current = file_sha256(output_path) == entry.get("content")
+        except OSError:
+            return False
+        if current:
+            self.touched.add(output_path)
+        return current
+
+    def write(self, output_path, input_hash, content):
+        """Atomically write ``content`` unless the file already holds exactly it.
+
+        Returns True when the file on disk changed.
+        """
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        content_hash = sha256_bytes(data)
+        try:
+            changed = file_sha256(output_path) != content_hash
+        except OSError:
+            changed = True
+        if changed:
+            atomic_write(output_path, data)
+        self.record(output_path, input_hash, content_hash)
+        return changed
+
+    @contextlib.contextmanager
+    def writer(self, output_path, input_hash):
+        """Stream an output to a temp file and commit it like ``write`` on success.
+
+        Yields an ``OutputWriter``; after the block its ``changed`` attribute
+        says whether the file on disk was replaced.
+        """
+        directory = os.path.dirname(output_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(output_path) + '.', suffix='.tmp')
+        out = OutputWriter(os.fdopen(fd, 'wb'))
+        try:
+            yield out
+            out.close()
+            content_hash = out.digest.hexdigest()
+            try:
+                out.changed = file_sha256(output_path) != content_hash
+            except OSError:
+                out.changed = True
+            if out.changed:
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, output_path)
+            else:
+                os.remove(tmp_path)
+            self.record(output_path, input_hash, content_hash)
+        except BaseException:
+            out.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def content_hash(self, output_path):
+        """SHA-256 of ``output_path`` as last written, or None if never built."""
+        entry = self.outputs.get(output_path)
+        return entry.get("content") if entry else None
+
+    def record(self, output_path, input_hash, content_hash):
+        self.touched.add(output_path)
+        entry = {"inputs": input_hash, "content": content_hash}
+        if self.outputs.get(output_path) != entry:
+            self.outputs[output_path] = entry
+            self.dirty = True
+
+    def forget(self, output_path):
+        if self.outputs.pop(output_path, None) is not None:
+            self.dirty = True
+
+    def record_run(self, key, argv, input_paths, output_paths):
+        """Remember a successful run: the inputs it read and the outputs it produced."""
+        entry = {
+            "argv": list(argv),
+            "inputs": {path: dict(file_stamp(path), sha256=file_sha256(path)) for path in sorted(set(input_paths))},
+            "outputs": {path: file_stamp(path) for path in sorted(set(output_paths))},
+        }
+        if self.runs.get(key) != entry:
+            self.runs[key] = entry
+            self.dirty = True
+
+    def run_is_current(self, key):
+        """True when a recorded run's inputs and outputs are all unchanged.
+
+        Uses only os.stat (and hashing for touched files), so it is cheap
+        enough to run before importing any generator.
+        """
+        entry = self.runs.get(key)
+        if entry is None:
+            return False
+        for path, stamp in entry["inputs"].items():
+            if not stamp_matches(path, stamp, stamp.get("sha256")):
+                return False
+        for path, stamp in entry["outputs"].items():
+            output = self.outputs.get(path)
+            if output is None or not stamp_matches(path, stamp, output.get("content")):
+                return False
+        return True
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {"outputs": self.outputs, "runs": self.runs}
+        atomic_write(self.path, json.dumps(data, indent=2, sort_keys=True) + "\n")
+        self.dirty = False
@@ -0,0 +1,108 @@
+"""
+Census cartographic boundary layers (states, counties, CBSAs) for the map
+generators.
+
+Downloads the 1:20m shapefiles into scripts/cache and answers
+point-in-polygon lookups for whole arrays of points through an STRtree, so
+assigning N points to M areas costs O(N log M) instead of N * M polygon
+tests.
+"""
+
+import io
+import os
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import requests
+import shapely
+
+CACHE_DIR = "scripts/cache"
+CENSUS_SHAPEFILE_URL = "https://www2.census.gov/geo/tiger/GENZ2021/shp/{name}.zip"
+
+# CONUS Albers equal-area (metres), used for distances.
+EQUAL_AREA_CRS = "EPSG:5070"
+
+
+def census_layer_name(layer):
+    """Shapefile basename for a Census layer such as "state", "county" or "cbsa"."""
+    return f"cb_2021_us_{layer}_20m"
+
+
+def download_census_shapefile(layer):
+    """Download a Census cartographic boundary layer unless it is already cached."""
+    name = census_layer_name(layer)
+    shapefile_path = os.path.join(CACHE_DIR, name + ".shp")
+
+    if os.path.exists(shapefile_path):
+        print(f"Using cached {layer} shapefile...")
+        return shapefile_path
+
+    print(f"Downloading {layer} shapefile...")
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    response = requests.get(CENSUS_SHAPEFILE_URL.format(name=name), timeout=60)
+    response.raise_for_status()
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as z:
+        z.extractall(CACHE_DIR)
+
+    return shapefile_path
+
+
+class AreaIndex:
+    """Point-in-polygon lookups over the areas of one Census layer."""
+
+    def __init__(self, areas):
+        self.areas = areas.reset_index(drop=True)
+        self.geometries = np.asarray(self.areas.geometry.values, dtype=object)
+        self.tree = shapely.STRtree(self.geometries)
+        self._projected_boundaries = None
+
+    @classmethod
+    def from_shapefile(cls, shapefile_path):
+        return cls(gpd.read_file(shapefile_path))
+
+    def __len__(self):
+        return len(self.areas)
+
+    def locate(self, lng, lat):
+        """Row of the area containing each point, or -1 where none does.
+
+        Points on a boundary shared by several areas go to the lowest row so
+        the result does not depend on tree traversal order.
+        """
+        points = shapely.points(np.asarray(lng, dtype=float), np.asarray(lat, dtype=float))
+        point_index, area_index = self.tree.query(points, predicate="intersects")
+
+        order = np.lexsort((area_index, point_index))
+        point_index = point_index[order]
+        area_index = area_index[order]
+        _, first = np.unique(point_index, return_index=True)
+
+        rows = np.full(len(points), -1, dtype=np.intp)
+        rows[point_index[first]] = area_index[first]
+        return rows
+
+    def distance_to_boundary(self, rows, lng, lat):
+        """Distance in metres from each point to the boundary of area ``rows[i]``.
+
+        Distances are measured in EQUAL_AREA_CRS; the projected boundaries
+        are computed once per index.
+        """
+        if self._projected_boundaries is None:
+            projected = self.areas.geometry.to_crs(EQUAL_AREA_CRS)
+            self._projected_boundaries = shapely.boundary(np.asarray(projected.values, dtype=object))
+        points = gpd.GeoSeries(
+            shapely.points(np.asarray(lng, dtype=float), np.asarray(lat, dtype=float)),
+            crs=self.areas.crs,
+        ).to_crs(EQUAL_AREA_CRS)
+        return shapely.distance(np.asarray(points.values, dtype=object), self._projected_boundaries[rows])
+
+    def records(self, rows, columns):
+        """Return a dict of ``columns`` for each row (None for -1)."""
+        values = self.areas[list(columns.values())].to_dict("records")
+        return [
+            None if row < 0 else {key: values[row][column] for key, column in columns.items()}
+            for row in np.asarray(rows).tolist()
+        ]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Write precompressed .gz (and .br, when the brotli module is installed)
+siblings for generated map assets so main.py can serve them directly.
+"""
+
+import argparse
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_TARGETS = [
+    "attached_assets/state_maps",
+    "client/src/data/stateBoundaries.ts",
+    "dist/public",
+]
+
+COMPRESSIBLE_EXTENSIONS = {".svg", ".json", ".ts", ".js", ".mjs", ".css", ".html", ".txt", ".xml"}
+
+# Below this size the compressed response is not meaningfully smaller once
+# headers are accounted for.
+MIN_SIZE = 256
+
+
+def iter_source_files(targets):
+    """Yield compressible files under the given files/directories."""
+    for target in targets:
+        if os.path.isfile(target):
+            candidates = [target]
+        elif os.path.isdir(target):
+            candidates = (
+                os.path.join(root, name)
+                for root, _, names in os.walk(target)
+                for name in sorted(names)
+            )
+        else:
+            continue
+        for path in candidates:
+            if os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                yield path
+
+
+def compress_gzip(data):
+    # mtime=0 keeps the output deterministic across runs.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+def write_sibling(source_path, suffix, compress, source_mtime_ns, force=False):
+    """Write ``source_path + suffix``; return compressed size or None if skipped."""
+    sibling_path = source_path + suffix
+    if not force and os.path.exists(sibling_path):
+        if os.stat(sibling_path).st_mtime_ns >= source_mtime_ns:
+            return None
+
+    with open(source_path, 'rb') as f:
+        data = f.read()
+    compressed = compress(data)
+
+    if len(compressed) >= len(data):
+        # Not worth serving; drop any stale sibling so the server falls back.
+        if os.path.exists(sibling_path):
+            os.remove(sibling_path)
+        return None
+
+    tmp_path = sibling_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp_path, sibling_path)
+    return len(compressed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS,
+                        help="files or directories to compress (default: generator outputs)")
+    parser.add_argument("--force", action="store_true",
+                        help="recompress even when siblings are up to date")
+    args = parser.parse_args(argv)
+
+    encoders = [(".gz", compress_gzip)]
+    if brotli is not None:
+        encoders.append((".br", compress_brotli))
+    else:
+        print("brotli module not installed; writing .gz siblings only")
+
+    written = 0
+    for path in iter_source_files(args.targets):
+        st = os.stat(path)
+        if st.st_size < MIN_SIZE:
+            continue
+        for suffix, compress in encoders:
+            size = write_sibling(path, suffix, compress, st.st_mtime_ns, force=args.force)
+            if size is not None:
+                print(f"Compressed: {path}{suffix} ({st.st_size} -> {size} bytes)")
+                written += 1
+
+    print(f"\nWrote {written} precompressed files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Density heatmaps of deal (funded-loan) locations.
+
+Points come from a CSV, XLSX or Parquet file and are read in fixed-size
+chunks. Each chunk is placed in states with one STRtree query and binned
+straight into per-state grid or hex cells in SVG viewport space. Only the
+cell totals survive between chunks, so memory depends on the chunk size and
+the number of cells, never on the number of rows.
+
+pandas and the spreadsheet readers are imported when points are read, so
+the command line can use the constants here without loading them.
+"""
+
+import itertools
+import math
+import os
+
+import numpy as np
+
+POINT_CHUNK_ROWS = 100_000
+DENSITY_CELLS = ("hex", "grid")
+# Width of a grid square or of a hexagon (flat side to flat side), in
+# viewport units.
+DENSITY_CELL_SIZE = 10.0
+
+# Cell opacity runs from MIN to MAX on a log scale of the state's busiest cell.
+MIN_CELL_OPACITY = 0.15
+MAX_CELL_OPACITY = 0.9
+
+SQRT3 = math.sqrt(3)
+
+
+def csv_chunks(path, columns, chunk_rows):
+    import pandas as pd
+
+    yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+
+
+def xlsx_chunks(path, columns, chunk_rows):
+    """Stream rows of the first worksheet; the first row holds the column names."""
+    import openpyxl
+    import pandas as pd
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else "" for name in next(rows, ())]
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError(f"{path} has no column {', '.join(map(repr, missing))}")
+        positions = [header.index(column) for column in columns]
+        while True:
+            batch = list(itertools.islice(rows, chunk_rows))
+            if not batch:
+                break
+            yield pd.DataFrame(
+                [[row[position] if position < len(row) else None for position in positions] for row in batch],
+                columns=columns,
+            )
+    finally:
+        workbook.close()
+
+
+def parquet_chunks(path, columns, chunk_rows):
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("Reading Parquet points needs pyarrow (pip install pyarrow)")
+
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+POINT_READERS = {
+    ".csv": csv_chunks,
+    ".txt": csv_chunks,
+    ".xlsx": xlsx_chunks,
+    ".xlsm": xlsx_chunks,
+    ".parquet": parquet_chunks,
+    ".pq": parquet_chunks,
+}
+
+
+def read_point_chunks(path, lng_column="lng", lat_column="lat", weight_column=None, chunk_rows=POINT_CHUNK_ROWS):
+    """Yield ``(lng, lat, weight)`` float arrays of at most ``chunk_rows`` points.
+
+    Values that are not numbers become NaN; ``weight`` is all ones without a
+    ``weight_column``. Compressed CSVs (``.csv.gz`` ...) are read as CSV.
+    """
+    import pandas as pd
+
+    name = path.lower()
+    for suffix in (".gz", ".bz2", ".xz", ".zst", ".zip"):
+        name = name.removesuffix(suffix)
+    extension = os.path.splitext(name)[1]
+    if extension not in POINT_READERS:
+        raise ValueError(f"Unsupported points file {path!r} (expected {', '.join(sorted(POINT_READERS))})")
+
+    columns = [lng_column, lat_column] + ([weight_column] if weight_column else [])
+    for chunk in POINT_READERS[extension](path, columns, chunk_rows):
+        lng = pd.to_numeric(chunk[lng_column], errors="coerce").to_numpy(dtype=float)
+        lat = pd.to_numeric(chunk[lat_column], errors="coerce").to_numpy(dtype=float)
+        if weight_column:
+            weight = pd.to_numeric(chunk[weight_column], errors="coerce").to_numpy(dtype=float)
+        else:
+            weight = np.ones(len(lng))
+        yield lng, lat, weight
+
+
+class DensityGrid:
+    """Per-state point counts and weight totals over fixed viewport cells.
+
+    Cells tile the ``width`` x ``height`` viewport: squares for "grid",
+    pointy-top hexagons in odd-row offset layout for "hex". Totals are
+    dense ``(states, cells)`` arrays, so adding a chunk is two bincounts.
+    """
+
+    def __init__(self, state_count, width, height, cells="hex", cell_size=DENSITY_CELL_SIZE):
+        if cells not in DENSITY_CELLS:
+            raise ValueError(f"Unknown density cells: {cells!r}")
+        self.cells = cells
+        self.cell_size = float(cell_size)
+        if cells == "grid":
+            self.columns = math.ceil(width / self.cell_size)
+            self.rows = math.ceil(height / self.cell_size)
+        else:
+            # Circumradius of a hexagon cell_size wide.
+            self.radius = self.cell_size / SQRT3
+            self.columns = math.ceil(width / self.cell_size) + 1
+            self.rows = math.ceil(height / (1.5 * self.radius)) + 1
+        self.state_count = state_count
+        self.counts = np.zeros((state_count, self.rows * self.columns), dtype=np.int64)
+        self.totals = np.zeros((state_count, self.rows * self.columns))
+
+    def cell_index(self, x, y):
+        """Flat cell index of each viewport point."""
+        if self.cells == "grid":
+            column = np.floor(x / self.cell_size)
+            row = np.floor(y / self.cell_size)
+        else:
+            # Axial coordinates, rounded through cube coordinates to the
+            # nearest hexagon centre.
+            q = (SQRT3 / 3 * x - y / 3) / self.radius
+            r = (2 / 3 * y) / self.radius
+            s = -q - r
+            rq, rr, rs = np.round(q), np.round(r), np.round(s)
+            dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+            fix_q = (dq > dr) & (dq > ds)
+            fix_r = ~fix_q & (dr > ds)
+            rq = np.where(fix_q, -rr - rs, rq)
+            rr = np.where(fix_r, -rq - rs, rr)
+            row = rr
+            column = rq + np.floor(rr / 2)
+        column = np.clip(column, 0, self.columns - 1).astype(np.int64)
+        row = np.clip(row, 0, self.rows - 1).astype(np.int64)
+        return row * self.columns + column
+
+    def add(self, states, x, y, weight):
+        """Add points in viewport coordinates to the cells of state rows ``states``."""
+        flat = np.asarray(states, dtype=np.int64) * (self.rows * self.columns) + self.cell_index(x, y)
+        size = self.counts.size
+        self.counts += np.bincount(flat, minlength=size).reshape(self.counts.shape)
+        self.totals += np.bincount(flat, weights=weight, minlength=size).reshape(self.totals.shape)
+
+    def cell_center(self, index):
+        row, column = divmod(index, self.columns)
+        if self.cells == "grid":
+            return (column + 0.5) * self.cell_size, (row + 0.5) * self.cell_size
+        q = column - (row // 2)
+        return self.radius * SQRT3 * (q + row / 2), self.radius * 1.5 * row
+
+    def cell_markup(self, index, opacity, count, total):
+        x, y = self.cell_center(index)
+        attributes = f'fill-opacity="{opacity:.2f}" class="density-cell" data-count="{count}" data-value="{total:g}"'
+        if self.cells == "grid":
+            half = self.cell_size / 2
+            return (f'    <rect x="{x - half:.2f}" y="{y - half:.2f}" width="{self.cell_size:g}" '
+                    f'height="{self.cell_size:g}" {attributes}/>')
+        corners = " ".join(
+            f"{x + self.radius * math.cos(angle):.2f},{y + self.radius * math.sin(angle):.2f}"
+            for angle in (math.pi / 6 + k * math.pi / 3 for k in range(6))
+        )
+        return f'    <polygon points="{corners}" {attributes}/>'
+
+    def overlay_svg(self, state, width, height):
+        """Heatmap SVG of one state row, in the same viewBox as its map."""
+        counts = self.counts[state]
+        totals = self.totals[state]
+        occupied = np.flatnonzero(counts)
+
+        svg_parts = []
+        svg_parts.append(f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" class="density-overlay-svg">')
+        svg_parts.append(f'  <g fill="currentColor" class="density-{self.cells}" data-points="{int(counts.sum())}">')
+        if len(occupied):
+            values = np.clip(totals[occupied], 0, None)
+            scale = np.log1p(values.max()) or 1.0
+            opacity = MIN_CELL_OPACITY + (MAX_CELL_OPACITY - MIN_CELL_OPACITY) * np.log1p(values) / scale
+            for index, cell_opacity, count, total in zip(
+                occupied.tolist(), opacity.tolist(), counts[occupied].tolist(), totals[occupied].tolist()
+            ):
+                svg_parts.append(self.cell_markup(index, cell_opacity, count, total))
+        svg_parts.append('  </g>')
+        svg_parts.append('</svg>')
+        return '\n'.join(svg_parts)
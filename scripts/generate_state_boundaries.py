@@ -1,85 +1,636 @@
-import requests
+import argparse
+import hashlib
 import json
+import os
 import re
+import sys
+import tempfile
+
+import numpy as np
+# requests and shapely are imported where they are used, so --help and
+# up-to-date runs skip them.
+
+from build_manifest import BuildManifest, file_sha256, hash_inputs, run_key
+
+GEOJSON_URL = "https://raw.githubusercontent.com/PublicaMundi/MappingAPI/master/data/geojson/us-states.json"
+OUTPUT_PATH = 'client/src/data/stateBoundaries.ts'
+SOURCE_CACHE_DIR = 'scripts/cache/sources'
+FETCH_TIMEOUT = 60
+
+# Features are decoded one at a time from chunks of this many characters, so
+# memory follows the largest feature rather than the whole document.
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Simplification targets a maximum deviation of DEFAULT_TOLERANCE_PX screen
+# pixels at Google Maps zoom DEFAULT_ZOOM, the zoom StateMarketMap shows a
+# whole state at.
+DEFAULT_TOLERANCE_PX = 3.0
+DEFAULT_ZOOM = 6
+DEFAULT_PRECISION = 5
+
+# Web Mercator is undefined at the poles; Google Maps clips to this latitude.
+MAX_MERCATOR_LAT = 85.05112878
+
 
 def slugify(name):
     """Convert state name to slug format"""
     return name.lower().replace(' ', '-')
 
-def main():
-    url = "https://raw.githubusercontent.com/PublicaMundi/MappingAPI/master/data/geojson/us-states.json"
-    
+
+def mercator_pixels(coords, zoom):
+    """Project an (N, 2) array of lng/lat pairs to Web Mercator pixels at ``zoom``."""
+    world_size = 256 * 2 ** zoom
+    lng = coords[:, 0]
+    lat = np.radians(np.clip(coords[:, 1], -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (lng + 180.0) / 360.0 * world_size
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * world_size
+    return np.column_stack([x, y])
+
+
+def douglas_peucker(points, tolerance):
+    """Return a boolean mask of the vertices Douglas-Peucker keeps; endpoints are always kept.
+
+    Distances are measured to the segment between the current endpoints, not
+    the infinite line through them, so a spike that runs past an endpoint is
+    kept when it is farther than ``tolerance``.
+    """
+    count = len(points)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        origin = points[start]
+        chord = points[end] - origin
+        offsets = points[start + 1:end] - origin
+        chord_length_sq = chord[0] * chord[0] + chord[1] * chord[1]
+        if chord_length_sq == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            # Project onto the chord, clamped to the segment.
+            t = np.clip(offsets @ chord / chord_length_sq, 0.0, 1.0)
+            nearest = offsets - t[:, None] * chord
+            distances = np.hypot(nearest[:, 0], nearest[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def feature_rings(geometry):
+    """Return the exterior rings of a GeoJSON (Multi)Polygon, largest first."""
+    import shapely
+
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return None
+    rings = [np.asarray(polygon[0], dtype=float)[:, :2] for polygon in polygons]
+    rings.sort(key=lambda ring: abs(shapely.area(shapely.polygons(ring))), reverse=True)
+    return rings
+
+
+def cached_source_paths(url):
+    """Return the (data, metadata) cache paths for a remote GeoJSON URL."""
+    url_hash = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+    name = os.path.basename(url.split('?', 1)[0]) or 'source.json'
+    data_path = os.path.join(SOURCE_CACHE_DIR, f"{url_hash}-{name}")
+    return data_path, data_path + '.meta.json'
+
+
+def fetch_source(source, offline=False, timeout=FETCH_TIMEOUT):
+    """Return a local path for ``source``, a file path or an http(s) URL.
+
+    URLs are cached under SOURCE_CACHE_DIR and revalidated with a conditional GET
+    (If-None-Match / If-Modified-Since). The body is streamed to disk. With
+    ``offline`` or when the network is unreachable, the cached copy is used.
+    """
+    if not source.startswith(('http://', 'https://')):
+        if not os.path.exists(source):
+            raise SystemExit(f"Source file not found: {source}")
+        print(f"Using local GeoJSON {source}")
+        return source
+
+    data_path, meta_path = cached_source_paths(source)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    have_cache = os.path.exists(data_path)
+
+    if offline:
+        if not have_cache:
+            raise SystemExit(f"--offline given but {source} has not been cached yet")
+        print("Using cached GeoJSON (offline)...")
+        return data_path
+
+    headers = {}
+    if have_cache:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    import requests
+
     print("Fetching US states GeoJSON...")
-    response = requests.get(url)
-    data = response.json()
-    
-    print(f"Found {len(data['features'])} states")
-    
-    output_lines = []
-    output_lines.append('export interface StateBoundary {')
-    output_lines.append('  coordinates: Array<{ lat: number; lng: number }>;')
-    output_lines.append('}')
-    output_lines.append('')
-    output_lines.append('export const STATE_BOUNDARIES: Record<string, StateBoundary> = {')
-    
-    for feature in data['features']:
+    try:
+        response = requests.get(source, headers=headers, timeout=timeout, stream=True)
+        if response.status_code == 304 and have_cache:
+            print("Cached GeoJSON is still current")
+            return data_path
+        response.raise_for_status()
+
+        os.makedirs(SOURCE_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=SOURCE_CACHE_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(tmp_path, data_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    except requests.RequestException as e:
+        if not have_cache:
+            raise
+        print(f"Warning: fetch failed ({e}); using cached GeoJSON")
+        return data_path
+
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'url': source,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }, f, indent=2)
+    return data_path
+
+
+class JSONStream:
+    """Decodes consecutive JSON values from a text file, one chunk at a time."""
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        """Append at least ``size`` more characters; False at end of file."""
+        chunk = self.f.read(max(size or 0, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed GeoJSON: expected {char!r}, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Incomplete value: read more, doubling so a huge feature
+                # is re-scanned only a logarithmic number of times.
+                if not self.fill(len(self.buffer) - self.pos):
+                    raise
+                continue
+            # A bare number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buffer) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_features(path):
+    """Yield the features of a GeoJSON FeatureCollection without loading it whole."""
+    with open(path, encoding='utf-8') as f:
+        stream = JSONStream(f)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key == 'features':
+                stream.expect('[')
+                if stream.peek() == ']':
+                    stream.pos += 1
+                else:
+                    while True:
+                        yield stream.value()
+                        separator = stream.peek()
+                        stream.pos += 1
+                        if separator == ']':
+                            break
+                        if separator != ',':
+                            raise ValueError(f"Malformed GeoJSON: unexpected {separator!r} in features")
+            else:
+                stream.value()
+            separator = stream.peek()
+            stream.pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Malformed GeoJSON: unexpected {separator!r}")
+
+
+def iter_state_rings(path, warn=False):
+    """Yield ``(name, rings)`` for each polygonal feature in the GeoJSON file."""
+    for feature in iter_features(path):
         name = feature['properties']['name']
-        slug = slugify(name)
-        geometry = feature['geometry']
-        
-        if geometry['type'] == 'Polygon':
-            coords = geometry['coordinates'][0]
-        elif geometry['type'] == 'MultiPolygon':
-            all_polygons = geometry['coordinates']
-            largest = max(all_polygons, key=lambda p: len(p[0]))
-            coords = largest[0]
-        else:
-            print(f"Unknown geometry type for {name}: {geometry['type']}")
+        rings = feature_rings(feature['geometry'])
+        if rings is None:
+            if warn:
+                print(f"Unknown geometry type for {name}: {feature['geometry']['type']}")
             continue
-        
-        simplified_coords = coords[::max(1, len(coords) // 50)]
-        if simplified_coords[-1] != coords[-1]:
-            simplified_coords.append(coords[-1])
-        
-        needs_quotes = '-' in slug or slug in ['new', 'of']
-        if needs_quotes:
-            output_lines.append(f'  "{slug}": {{')
-        else:
-            output_lines.append(f'  {slug}: {{')
-        
-        output_lines.append('    coordinates: [')
-        
-        for lng, lat in simplified_coords:
-            output_lines.append(f'      {{ lat: {lat}, lng: {lng} }},')
-        
-        output_lines.append('    ],')
-        output_lines.append('  },')
-    
-    output_lines.append('};')
-    output_lines.append('')
-    output_lines.append('export function getStateBoundary(stateSlug: string): StateBoundary | null {')
-    output_lines.append('  return STATE_BOUNDARIES[stateSlug] || null;')
-    output_lines.append('}')
-    output_lines.append('')
-    output_lines.append('export function createMaskPolygon(stateBoundary: StateBoundary): Array<Array<{ lat: number; lng: number }>> {')
-    output_lines.append('  const worldBounds = [')
-    output_lines.append('    { lat: 85, lng: -180 },')
-    output_lines.append('    { lat: 85, lng: 180 },')
-    output_lines.append('    { lat: -85, lng: 180 },')
-    output_lines.append('    { lat: -85, lng: -180 },')
-    output_lines.append('    { lat: 85, lng: -180 },')
-    output_lines.append('  ];')
-    output_lines.append('')
-    output_lines.append('  const stateHole = [...stateBoundary.coordinates].reverse();')
-    output_lines.append('')
-    output_lines.append('  return [worldBounds, stateHole];')
-    output_lines.append('}')
-    
-    output_path = 'client/src/data/stateBoundaries.ts'
-    with open(output_path, 'w') as f:
-        f.write('\n'.join(output_lines))
+        yield name, rings
+
+
+def vertex_keys(coords):
+    """Pack lng/lat pairs into complex numbers, which NumPy sorts lexicographically."""
+    keys = np.empty(len(coords), dtype=np.complex128)
+    keys.real = coords[:, 0]
+    keys.imag = coords[:, 1]
+    return keys
+
+
+def build_vertex_index(states):
+    """Index every vertex by a signature of the set of states sharing it.
+
+    Each state gets a random 64-bit tag and a vertex's signature is the XOR
+    of the tags of the states whose boundary passes through it, so two
+    vertices have equal signatures exactly when the same states share them.
+    Returns ``(sorted_keys, signatures)``: about 24 bytes per distinct
+    vertex, built from one streaming pass over the features.
+    """
+    rng = np.random.default_rng(0)
+    key_chunks = []
+    tag_chunks = []
+    for _, rings in states:
+        keys = np.unique(np.concatenate([vertex_keys(ring) for ring in rings]))
+        tag = rng.integers(1, np.iinfo(np.uint64).max, dtype=np.uint64, endpoint=True)
+        key_chunks.append(keys)
+        tag_chunks.append(np.full(len(keys), tag, dtype=np.uint64))
+
+    if not key_chunks:
+        return np.empty(0, dtype=np.complex128), np.empty(0, dtype=np.uint64)
+    keys = np.concatenate(key_chunks)
+    tags = np.concatenate(tag_chunks)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    tags = tags[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.bitwise_xor.reduceat(tags, starts)
+
+
+def simplify_ring(ring, vertex_index, tolerance_px, zoom):
+    """Simplify one closed ring so borders shared with neighbours stay identical.
+
+    The ring is cut at every vertex where the set of states sharing it
+    changes (the ends of each shared border), as looked up in the index from
+    ``build_vertex_index``. Each piece between two such locked vertices is
+    simplified on its own, always walked from the lexicographically smaller
+    endpoint, so both states sharing a border reduce it to exactly the same
+    vertices. Without an index every ring is simplified independently.
+    """
+    vertices = ring[:-1] if len(ring) > 1 and tuple(ring[0]) == tuple(ring[-1]) else ring
+    count = len(vertices)
+    if count < 4:
+        return np.vstack([vertices, vertices[:1]])
+
+    pixels = mercator_pixels(vertices, zoom)
+    if vertex_index is None:
+        locked = []
+    else:
+        sorted_keys, signatures = vertex_index
+        sharing = signatures[np.searchsorted(sorted_keys, vertex_keys(vertices))]
+        changes = (sharing != np.roll(sharing, 1)) | (sharing != np.roll(sharing, -1))
+        locked = np.flatnonzero(changes).tolist()
+    if len(locked) < 2:
+        # Unshared ring (coastline, island): anchor on the first vertex and
+        # the vertex farthest from it.
+        distances = np.hypot(*(pixels - pixels[0]).T)
+        locked = sorted({0, int(np.argmax(distances))})
+
+    keep = np.zeros(count, dtype=bool)
+    for start, end in zip(locked, locked[1:] + [locked[0] + count]):
+        indices = np.arange(start, end + 1) % count
+        if tuple(vertices[indices[-1]]) < tuple(vertices[indices[0]]):
+            indices = indices[::-1]
+        keep[indices[douglas_peucker(pixels[indices], tolerance_px)]] = True
+
+    kept = vertices[keep]
+    return np.vstack([kept, kept[:1]])
+
+
+def ring_error_px(original, simplified, zoom):
+    """Hausdorff distance in pixels between an original and simplified ring."""
+    import shapely
+
+    return shapely.hausdorff_distance(
+        shapely.linestrings(mercator_pixels(original, zoom)),
+        shapely.linestrings(mercator_pixels(simplified, zoom)),
+    )
+
+
+def ts_key(slug):
+    needs_quotes = '-' in slug or slug in ['new', 'of']
+    return f'"{slug}"' if needs_quotes else slug
+
+
+def format_ring(ring, precision, indent):
+    return [
+        f'{indent}{{ lat: {round(lat, precision)}, lng: {round(lng, precision)} }},'
+        for lng, lat in ring.tolist()
+    ]
+
+
+def encode_polyline(ring, precision):
+    """Encode a lng/lat ring with the Encoded Polyline Algorithm.
+
+    Coordinates are quantized to ``10 ** -precision`` degrees, stored as
+    lat/lng deltas from the previous vertex, zigzag-encoded and packed five
+    bits per printable character.
+    """
+    quantized = np.round(ring[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    chars = []
+    for value in deltas.ravel().tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+def literal_state_lines(slug, rings, precision):
+    """One state as a TS object literal with every vertex spelled out."""
+    lines = [f'  {ts_key(slug)}: {{']
+    lines.append('    coordinates: [')
+    lines.extend(format_ring(rings[0], precision, '      '))
+    lines.append('    ],')
+
+    if len(rings) > 1:
+        lines.append('    islands: [')
+        for island in rings[1:]:
+            lines.append('      [')
+            lines.extend(format_ring(island, precision, '        '))
+            lines.append('      ],')
+        lines.append('    ],')
+
+    lines.append('  },')
+    return lines
+
+
+def compact_state_lines(slug, rings, precision):
+    """One state as a list of encoded polyline strings, main ring first."""
+    encoded = ', '.join(json.dumps(encode_polyline(ring, precision)) for ring in rings)
+    return [f'  {ts_key(slug)}: [{encoded}],']
+
+
+def header_lines(output_format, precision):
+    lines = [
+        'export interface StateBoundary {',
+        '  coordinates: Array<{ lat: number; lng: number }>;',
+        '  islands?: Array<Array<{ lat: number; lng: number }>>;',
+        '}',
+        '',
+    ]
+    if output_format == 'literal':
+        lines.append('export const STATE_BOUNDARIES: Record<string, StateBoundary> = {')
+        return lines
+
+    lines += [
+        '// Rings use the Encoded Polyline Algorithm: coordinates quantized to',
+        f'// 1e-{precision} degrees, delta-encoded and packed into printable characters.',
+        '// States are decoded on first lookup.',
+        f'const PRECISION = 1e{precision};',
+        '',
+        'const ENCODED_BOUNDARIES: Record<string, string[]> = {',
+    ]
+    return lines
+
+
+def footer_lines(output_format):
+    lines = ['};', '']
+    if output_format == 'literal':
+        lines += [
+            'export function getStateBoundary(stateSlug: string): StateBoundary | null {',
+            '  return STATE_BOUNDARIES[stateSlug] || null;',
+            '}',
+        ]
+    else:
+        lines += [
+            'const decodedBoundaries: Record<string, StateBoundary> = {};',
+            '',
+            'function decodeRing(encoded: string): Array<{ lat: number; lng: number }> {',
+            '  const ring: Array<{ lat: number; lng: number }> = [];',
+            '  const values = [0, 0];',
+            '  let index = 0;',
+            '  while (index < encoded.length) {',
+            '    for (let axis = 0; axis < 2; axis++) {',
+            '      let result = 0;',
+            '      let factor = 1;',
+            '      let chunk: number;',
+            '      do {',
+            '        chunk = encoded.charCodeAt(index++) - 63;',
+            '        result += (chunk & 0x1f) * factor;',
+            '        factor *= 32;',
+            '      } while (chunk >= 0x20);',
+            '      values[axis] += result % 2 === 1 ? -(result + 1) / 2 : result / 2;',
+            '    }',
+            '    ring.push({ lat: values[0] / PRECISION, lng: values[1] / PRECISION });',
+            '  }',
+            '  return ring;',
+            '}',
+            '',
+            'export function getStateBoundary(stateSlug: string): StateBoundary | null {',
+            '  const cached = decodedBoundaries[stateSlug];',
+            '  if (cached) return cached;',
+            '',
+            '  const encoded = ENCODED_BOUNDARIES[stateSlug];',
+            '  if (!encoded) return null;',
+            '',
+            '  const [coordinates, ...islands] = encoded.map(decodeRing);',
+            '  const boundary: StateBoundary = islands.length ? { coordinates, islands } : { coordinates };',
+            '  decodedBoundaries[stateSlug] = boundary;',
+            '  return boundary;',
+            '}',
+        ]
+
+    lines += [
+        '',
+        'export function createMaskPolygon(stateBoundary: StateBoundary): Array<Array<{ lat: number; lng: number }>> {',
+        '  const worldBounds = [',
+        '    { lat: 85, lng: -180 },',
+        '    { lat: 85, lng: 180 },',
+        '    { lat: -85, lng: 180 },',
+        '    { lat: -85, lng: -180 },',
+        '    { lat: 85, lng: -180 },',
+        '  ];',
+        '',
+        '  const stateHoles = [stateBoundary.coordinates, ...(stateBoundary.islands ?? [])]',
+        '    .map((ring) => [...ring].reverse());',
+        '',
+        '  return [worldBounds, ...stateHoles];',
+        '}',
+    ]
+    return lines
+
+
+def print_report(report, detailed):
+    """Print the size vs error summary, optionally with one row per state."""
+    if detailed:
+        print(f"{'state':<24}{'rings':>6}{'dropped':>8}{'vertices':>16}{'bytes':>9}{'max err px':>12}")
+        for row in report:
+            vertices = f"{row['vertices_in']} -> {row['vertices_out']}"
+            print(f"{row['slug']:<24}{row['rings']:>6}{row['dropped']:>8}{vertices:>16}{row['bytes']:>9}{row['max_error_px']:>12.2f}")
+
+    vertices_in = sum(row['vertices_in'] for row in report)
+    vertices_out = sum(row['vertices_out'] for row in report)
+    total_bytes = sum(row['bytes'] for row in report)
+    max_error = max((row['max_error_px'] for row in report), default=0.0)
+    print(f"Kept {vertices_out} of {vertices_in} vertices ({total_bytes} bytes of boundary data, max error {max_error:.2f}px)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate client/src/data/stateBoundaries.ts from US state GeoJSON.")
+    parser.add_argument("--source", default=GEOJSON_URL,
+                        help="GeoJSON URL (cached under scripts/cache/sources) or local file path")
+    parser.add_argument("--offline", action="store_true",
+                        help="use the cached copy of --source without touching the network")
+    parser.add_argument("--timeout", type=float, default=FETCH_TIMEOUT,
+                        help="network timeout in seconds (default: %(default)s)")
+    parser.add_argument("--no-shared-borders", dest="shared_borders", action="store_false",
+                        help="simplify each state independently in a single streaming pass "
+                             "instead of keeping borders identical between neighbours")
+    parser.add_argument("--tolerance-px", type=float, default=DEFAULT_TOLERANCE_PX,
+                        help="maximum simplification error in screen pixels (default: %(default)s)")
+    parser.add_argument("--zoom", type=int, default=DEFAULT_ZOOM,
+                        help="Google Maps zoom level the tolerance applies at (default: %(default)s)")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION,
+                        help="decimal places kept for each coordinate (default: %(default)s)")
+    parser.add_argument("--format", choices=["literal", "compact"], default="literal",
+                        help="'literal' writes { lat, lng } object literals; 'compact' writes "
+                             "encoded polyline strings with a small decoder (default: %(default)s)")
+    parser.add_argument("--report", action="store_true",
+                        help="print a per-state size vs error table")
+    parser.add_argument("--force", action="store_true",
+                        help="regenerate even if the source and options are unchanged")
+    return parser.parse_args(argv)
+
+
+def record_run(manifest, argv, args, source_path, output_path):
+    """Remember this run so `python -m scripts boundaries` can skip a repeat.
     
-    print(f"Generated {output_path} with {len(data['features'])} states")
+    Runs against a remote source are not recorded: they must keep
+    revalidating the download.
+    """
+    if args.source.startswith(('http://', 'https://')) and not args.offline:
+        return
+    inputs = [os.path.abspath(__file__), source_path]
+    manifest.record_run(run_key("generate_state_boundaries", argv), argv, inputs, [output_path])
+    manifest.save()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parse_args(argv)
+
+    source_path = fetch_source(args.source, offline=args.offline, timeout=args.timeout)
+
+    output_path = OUTPUT_PATH
+    manifest = BuildManifest()
+    options = {
+        key: value for key, value in vars(args).items()
+        if key not in ('source', 'offline', 'timeout', 'report', 'force')
+    }
+    input_hash = hash_inputs(file_sha256(os.path.abspath(__file__)), file_sha256(source_path), options)
+    if not args.force and manifest.is_current(output_path, input_hash):
+        print(f"{output_path} is up to date")
+        record_run(manifest, argv, args, source_path, output_path)
+        return
+
+    # Shared-border mode needs to know every state's vertices before it can
+    # simplify any of them, so it makes one extra streaming pass to build the
+    # compact vertex index.
+    vertex_index = build_vertex_index(iter_state_rings(source_path)) if args.shared_borders else None
+
+    state_lines_for = compact_state_lines if args.format == 'compact' else literal_state_lines
+
+    report = []
+    with manifest.writer(output_path, input_hash) as out:
+        out.write('\n'.join(header_lines(args.format, args.precision)))
+
+        for name, rings in iter_state_rings(source_path, warn=True):
+            slug = slugify(name)
+
+            simplified_rings = []
+            max_error = 0.0
+            dropped = 0
+            for ring_index, ring in enumerate(rings):
+                simplified = simplify_ring(ring, vertex_index, args.tolerance_px, args.zoom)
+                if len(simplified) < 4 and ring_index > 0:
+                    # Island smaller than the tolerance: it would render as a speck.
+                    dropped += 1
+                    continue
+                max_error = max(max_error, ring_error_px(ring, simplified, args.zoom))
+                simplified_rings.append(simplified)
+
+            state_lines = state_lines_for(slug, simplified_rings, args.precision)
+            out.write('\n' + '\n'.join(state_lines))
+
+            report.append({
+                "slug": slug,
+                "rings": len(simplified_rings),
+                "dropped": dropped,
+                "vertices_in": sum(len(ring) for ring in rings),
+                "vertices_out": sum(len(ring) for ring in simplified_rings),
+                "bytes": sum(len(line) + 1 for line in state_lines),
+                "max_error_px": max_error,
+            })
+
+        out.write('\n' + '\n'.join(footer_lines(args.format)))
+    manifest.save()
+    record_run(manifest, argv, args, source_path, output_path)
+
+    print(f"Found {len(report)} states")
+    print_report(report, args.report)
+    if out.changed:
+        print(f"Generated {output_path} with {len(report)} states")
+    else:
+        print(f"{output_path} already matches the generated output")
+
 
 if __name__ == '__main__':
     main()
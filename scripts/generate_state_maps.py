@@ -4,333 +4,93 @@ Generate state SVG outlines with metro dots for the Top Markets section.
 Uses geopandas with US Census state boundaries.
 """
 
-import geopandas as gpd
-from shapely.geometry import Point, Polygon, MultiPolygon
-from shapely.affinity import translate, scale
+import argparse
+import cProfile
+import hashlib
+import html
 import json
 import os
-import requests
-import zipfile
-import io
+import pstats
+import re
+import sys
+
+import numpy as np
+
+from build_manifest import BuildManifest, file_sha256, hash_inputs, run_key
+from deal_density import DENSITY_CELL_SIZE, DENSITY_CELLS, POINT_CHUNK_ROWS, DensityGrid, read_point_chunks
+from marker_layout import LABEL_FONT_SIZE, cluster_radius, layout_markers, place_labels
+from projections import PROJECTIONS, project_geometry, project_points, state_transformer
+from stage_timings import TIMINGS, timed_call
+
+# geopandas, shapely and census_areas (and the worker pool) are imported by
+# the functions that use them, so --help and up-to-date checks never load
+# the GIS stack.
 
 OUTPUT_DIR = "attached_assets/state_maps"
+CACHE_DIR = "scripts/cache"
+
+# Source files whose code shapes the generated output; their hashes are part
+# of every output's input hash.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATOR_SOURCES = (
+    "generate_state_maps.py", "census_areas.py", "deal_density.py", "marker_layout.py", "projections.py",
+    "rasterize_maps.py",
+)
+
+# Default cProfile dump for --profile (inspect with python -m pstats or snakeviz).
+PROFILE_PATH = os.path.join(CACHE_DIR, "generate_state_maps.prof")
+
+# Derived geometry cache: one WKB blob with every state geometry plus a JSON
+# index of byte offsets by FIPS code, keyed on the hash of the shapefile.
+GEOMETRY_CACHE_PATH = os.path.join(CACHE_DIR, "cb_2021_us_state_20m.wkb")
+GEOMETRY_INDEX_PATH = os.path.join(CACHE_DIR, "cb_2021_us_state_20m.wkb.json")
+SHAPEFILE_COMPONENTS = (".shp", ".shx", ".dbf", ".prj")
+
+# Fingerprinted copies are named "{slug}.{first FINGERPRINT_LENGTH hex digits
+# of the SHA-256}.svg"; main.py serves names of this shape as immutable.
+FINGERPRINT_LENGTH = 12
+FINGERPRINT_MANIFEST_PATH = os.path.join(OUTPUT_DIR, "manifest.json")
+
+# Single-request bundles of every state map (--bundle).
+SPRITE_FILENAME = "states.sprite.svg"
+BUNDLE_JSON_FILENAME = "states.json"
+SVG_ROOT_PATTERN = re.compile(r'^<svg [^>]*viewBox="([^"]+)"[^>]*>\n(.*)\n</svg>$', re.S)
 
-STATE_METROS = {
-    "alabama": [
-        {"name": "Birmingham", "lat": 33.5207, "lng": -86.8025, "rank": 1},
-        {"name": "Huntsville", "lat": 34.7304, "lng": -86.5861, "rank": 2},
-        {"name": "Mobile", "lat": 30.6954, "lng": -88.0399, "rank": 3},
-        {"name": "Montgomery", "lat": 32.3792, "lng": -86.3077, "rank": 4},
-    ],
-    "alaska": [
-        {"name": "Anchorage", "lat": 61.2181, "lng": -149.9003, "rank": 1},
-        {"name": "Fairbanks", "lat": 64.8378, "lng": -147.7164, "rank": 2},
-        {"name": "Juneau", "lat": 58.3019, "lng": -134.4197, "rank": 3},
-    ],
-    "arizona": [
-        {"name": "Phoenix", "lat": 33.4484, "lng": -112.0740, "rank": 1},
-        {"name": "Tucson", "lat": 32.2226, "lng": -110.9747, "rank": 2},
-        {"name": "Scottsdale", "lat": 33.4942, "lng": -111.9261, "rank": 3},
-        {"name": "Mesa", "lat": 33.4152, "lng": -111.8315, "rank": 4},
-        {"name": "Chandler", "lat": 33.3062, "lng": -111.8413, "rank": 5},
-    ],
-    "arkansas": [
-        {"name": "Little Rock", "lat": 34.7465, "lng": -92.2896, "rank": 1},
-        {"name": "Fayetteville", "lat": 36.0626, "lng": -94.1574, "rank": 2},
-        {"name": "Fort Smith", "lat": 35.3859, "lng": -94.3985, "rank": 3},
-        {"name": "Bentonville", "lat": 36.3729, "lng": -94.2088, "rank": 4},
-    ],
-    "california": [
-        {"name": "Los Angeles", "lat": 34.0522, "lng": -118.2437, "rank": 1},
-        {"name": "San Francisco", "lat": 37.7749, "lng": -122.4194, "rank": 2},
-        {"name": "San Diego", "lat": 32.7157, "lng": -117.1611, "rank": 3},
-        {"name": "Sacramento", "lat": 38.5816, "lng": -121.4944, "rank": 4},
-        {"name": "San Jose", "lat": 37.3382, "lng": -121.8863, "rank": 5},
-        {"name": "Fresno", "lat": 36.7378, "lng": -119.7871, "rank": 6},
-    ],
-    "colorado": [
-        {"name": "Denver", "lat": 39.7392, "lng": -104.9903, "rank": 1},
-        {"name": "Colorado Springs", "lat": 38.8339, "lng": -104.8214, "rank": 2},
-        {"name": "Aurora", "lat": 39.7294, "lng": -104.8319, "rank": 3},
-        {"name": "Boulder", "lat": 40.0150, "lng": -105.2705, "rank": 4},
-        {"name": "Fort Collins", "lat": 40.5853, "lng": -105.0844, "rank": 5},
-    ],
-    "connecticut": [
-        {"name": "Hartford", "lat": 41.7658, "lng": -72.6734, "rank": 1},
-        {"name": "New Haven", "lat": 41.3083, "lng": -72.9279, "rank": 2},
-        {"name": "Stamford", "lat": 41.0534, "lng": -73.5387, "rank": 3},
-        {"name": "Bridgeport", "lat": 41.1865, "lng": -73.1952, "rank": 4},
-    ],
-    "delaware": [
-        {"name": "Wilmington", "lat": 39.7391, "lng": -75.5398, "rank": 1},
-        {"name": "Dover", "lat": 39.1582, "lng": -75.5244, "rank": 2},
-        {"name": "Newark", "lat": 39.6837, "lng": -75.7497, "rank": 3},
-    ],
-    "florida": [
-        {"name": "Miami", "lat": 25.7617, "lng": -80.1918, "rank": 1},
-        {"name": "Orlando", "lat": 28.5383, "lng": -81.3792, "rank": 2},
-        {"name": "Tampa", "lat": 27.9506, "lng": -82.4572, "rank": 3},
-        {"name": "Jacksonville", "lat": 30.3322, "lng": -81.6557, "rank": 4},
-        {"name": "Fort Lauderdale", "lat": 26.1224, "lng": -80.1373, "rank": 5},
-        {"name": "West Palm Beach", "lat": 26.7153, "lng": -80.0534, "rank": 6},
-    ],
-    "georgia": [
-        {"name": "Atlanta", "lat": 33.7490, "lng": -84.3880, "rank": 1},
-        {"name": "Savannah", "lat": 32.0809, "lng": -81.0912, "rank": 2},
-        {"name": "Augusta", "lat": 33.4735, "lng": -82.0105, "rank": 3},
-        {"name": "Columbus", "lat": 32.4610, "lng": -84.9877, "rank": 4},
-        {"name": "Athens", "lat": 33.9519, "lng": -83.3576, "rank": 5},
-    ],
-    "hawaii": [
-        {"name": "Honolulu", "lat": 21.3069, "lng": -157.8583, "rank": 1},
-        {"name": "Maui", "lat": 20.7984, "lng": -156.3319, "rank": 2},
-        {"name": "Kona", "lat": 19.6400, "lng": -155.9969, "rank": 3},
-    ],
-    "idaho": [
-        {"name": "Boise", "lat": 43.6150, "lng": -116.2023, "rank": 1},
-        {"name": "Meridian", "lat": 43.6121, "lng": -116.3915, "rank": 2},
-        {"name": "Idaho Falls", "lat": 43.4666, "lng": -112.0341, "rank": 3},
-        {"name": "Coeur d'Alene", "lat": 47.6777, "lng": -116.7805, "rank": 4},
-    ],
-    "illinois": [
-        {"name": "Chicago", "lat": 41.8781, "lng": -87.6298, "rank": 1},
-        {"name": "Aurora", "lat": 41.7606, "lng": -88.3201, "rank": 2},
-        {"name": "Naperville", "lat": 41.7508, "lng": -88.1535, "rank": 3},
-        {"name": "Springfield", "lat": 39.7817, "lng": -89.6501, "rank": 4},
-        {"name": "Rockford", "lat": 42.2711, "lng": -89.0940, "rank": 5},
-    ],
-    "indiana": [
-        {"name": "Indianapolis", "lat": 39.7684, "lng": -86.1581, "rank": 1},
-        {"name": "Fort Wayne", "lat": 41.0793, "lng": -85.1394, "rank": 2},
-        {"name": "Evansville", "lat": 37.9716, "lng": -87.5711, "rank": 3},
-        {"name": "South Bend", "lat": 41.6764, "lng": -86.2520, "rank": 4},
-        {"name": "Carmel", "lat": 39.9784, "lng": -86.1180, "rank": 5},
-    ],
-    "iowa": [
-        {"name": "Des Moines", "lat": 41.5868, "lng": -93.6250, "rank": 1},
-        {"name": "Cedar Rapids", "lat": 41.9779, "lng": -91.6656, "rank": 2},
-        {"name": "Davenport", "lat": 41.5236, "lng": -90.5776, "rank": 3},
-        {"name": "Iowa City", "lat": 41.6611, "lng": -91.5302, "rank": 4},
-    ],
-    "kansas": [
-        {"name": "Wichita", "lat": 37.6872, "lng": -97.3301, "rank": 1},
-        {"name": "Overland Park", "lat": 38.9822, "lng": -94.6708, "rank": 2},
-        {"name": "Kansas City", "lat": 39.1155, "lng": -94.6268, "rank": 3},
-        {"name": "Topeka", "lat": 39.0473, "lng": -95.6752, "rank": 4},
-    ],
-    "kentucky": [
-        {"name": "Louisville", "lat": 38.2527, "lng": -85.7585, "rank": 1},
-        {"name": "Lexington", "lat": 38.0406, "lng": -84.5037, "rank": 2},
-        {"name": "Bowling Green", "lat": 36.9685, "lng": -86.4808, "rank": 3},
-        {"name": "Covington", "lat": 39.0837, "lng": -84.5086, "rank": 4},
-    ],
-    "louisiana": [
-        {"name": "New Orleans", "lat": 29.9511, "lng": -90.0715, "rank": 1},
-        {"name": "Baton Rouge", "lat": 30.4515, "lng": -91.1871, "rank": 2},
-        {"name": "Shreveport", "lat": 32.5252, "lng": -93.7502, "rank": 3},
-        {"name": "Lafayette", "lat": 30.2241, "lng": -92.0198, "rank": 4},
-    ],
-    "maine": [
-        {"name": "Portland", "lat": 43.6591, "lng": -70.2568, "rank": 1},
-        {"name": "Lewiston", "lat": 44.1004, "lng": -70.2148, "rank": 2},
-        {"name": "Bangor", "lat": 44.8016, "lng": -68.7712, "rank": 3},
-    ],
-    "maryland": [
-        {"name": "Baltimore", "lat": 39.2904, "lng": -76.6122, "rank": 1},
-        {"name": "Columbia", "lat": 39.2037, "lng": -76.8610, "rank": 2},
-        {"name": "Silver Spring", "lat": 38.9907, "lng": -77.0261, "rank": 3},
-        {"name": "Bethesda", "lat": 38.9847, "lng": -77.0947, "rank": 4},
-    ],
-    "massachusetts": [
-        {"name": "Boston", "lat": 42.3601, "lng": -71.0589, "rank": 1},
-        {"name": "Cambridge", "lat": 42.3736, "lng": -71.1097, "rank": 2},
-        {"name": "Worcester", "lat": 42.2626, "lng": -71.8023, "rank": 3},
-        {"name": "Springfield", "lat": 42.1015, "lng": -72.5898, "rank": 4},
-    ],
-    "michigan": [
-        {"name": "Detroit", "lat": 42.3314, "lng": -83.0458, "rank": 1},
-        {"name": "Grand Rapids", "lat": 42.9634, "lng": -85.6681, "rank": 2},
-        {"name": "Ann Arbor", "lat": 42.2808, "lng": -83.7430, "rank": 3},
-        {"name": "Lansing", "lat": 42.7325, "lng": -84.5555, "rank": 4},
-        {"name": "Traverse City", "lat": 44.7631, "lng": -85.6206, "rank": 5},
-    ],
-    "minnesota": [
-        {"name": "Minneapolis", "lat": 44.9778, "lng": -93.2650, "rank": 1},
-        {"name": "St. Paul", "lat": 44.9537, "lng": -93.0900, "rank": 2},
-        {"name": "Rochester", "lat": 44.0121, "lng": -92.4802, "rank": 3},
-        {"name": "Duluth", "lat": 46.7867, "lng": -92.1005, "rank": 4},
-    ],
-    "mississippi": [
-        {"name": "Jackson", "lat": 32.2988, "lng": -90.1848, "rank": 1},
-        {"name": "Gulfport", "lat": 30.3674, "lng": -89.0928, "rank": 2},
-        {"name": "Biloxi", "lat": 30.3960, "lng": -88.8853, "rank": 3},
-        {"name": "Hattiesburg", "lat": 31.3271, "lng": -89.2903, "rank": 4},
-    ],
-    "missouri": [
-        {"name": "Kansas City", "lat": 39.0997, "lng": -94.5786, "rank": 1},
-        {"name": "St. Louis", "lat": 38.6270, "lng": -90.1994, "rank": 2},
-        {"name": "Springfield", "lat": 37.2090, "lng": -93.2923, "rank": 3},
-        {"name": "Columbia", "lat": 38.9517, "lng": -92.3341, "rank": 4},
-    ],
-    "montana": [
-        {"name": "Billings", "lat": 45.7833, "lng": -108.5007, "rank": 1},
-        {"name": "Missoula", "lat": 46.8721, "lng": -113.9940, "rank": 2},
-        {"name": "Bozeman", "lat": 45.6770, "lng": -111.0429, "rank": 3},
-        {"name": "Great Falls", "lat": 47.5002, "lng": -111.3008, "rank": 4},
-    ],
-    "nebraska": [
-        {"name": "Omaha", "lat": 41.2565, "lng": -95.9345, "rank": 1},
-        {"name": "Lincoln", "lat": 40.8258, "lng": -96.6852, "rank": 2},
-        {"name": "Bellevue", "lat": 41.1544, "lng": -95.9146, "rank": 3},
-    ],
-    "nevada": [
-        {"name": "Las Vegas", "lat": 36.1699, "lng": -115.1398, "rank": 1},
-        {"name": "Henderson", "lat": 36.0395, "lng": -114.9817, "rank": 2},
-        {"name": "Reno", "lat": 39.5296, "lng": -119.8138, "rank": 3},
-        {"name": "North Las Vegas", "lat": 36.1989, "lng": -115.1175, "rank": 4},
-        {"name": "Sparks", "lat": 39.5349, "lng": -119.7527, "rank": 5},
-    ],
-    "new-hampshire": [
-        {"name": "Manchester", "lat": 42.9956, "lng": -71.4548, "rank": 1},
-        {"name": "Nashua", "lat": 42.7654, "lng": -71.4676, "rank": 2},
-        {"name": "Concord", "lat": 43.2081, "lng": -71.5376, "rank": 3},
-    ],
-    "new-jersey": [
-        {"name": "Newark", "lat": 40.7357, "lng": -74.1724, "rank": 1},
-        {"name": "Jersey City", "lat": 40.7178, "lng": -74.0431, "rank": 2},
-        {"name": "Trenton", "lat": 40.2206, "lng": -74.7597, "rank": 3},
-        {"name": "Atlantic City", "lat": 39.3643, "lng": -74.4229, "rank": 4},
-        {"name": "Cherry Hill", "lat": 39.9348, "lng": -75.0307, "rank": 5},
-    ],
-    "new-mexico": [
-        {"name": "Albuquerque", "lat": 35.0844, "lng": -106.6504, "rank": 1},
-        {"name": "Santa Fe", "lat": 35.6870, "lng": -105.9378, "rank": 2},
-        {"name": "Las Cruces", "lat": 32.3199, "lng": -106.7637, "rank": 3},
-        {"name": "Rio Rancho", "lat": 35.2328, "lng": -106.6630, "rank": 4},
-    ],
-    "new-york": [
-        {"name": "New York City", "lat": 40.7128, "lng": -74.0060, "rank": 1},
-        {"name": "Buffalo", "lat": 42.8864, "lng": -78.8784, "rank": 2},
-        {"name": "Rochester", "lat": 43.1566, "lng": -77.6088, "rank": 3},
-        {"name": "Albany", "lat": 42.6526, "lng": -73.7562, "rank": 4},
-        {"name": "Syracuse", "lat": 43.0481, "lng": -76.1474, "rank": 5},
-    ],
-    "north-carolina": [
-        {"name": "Charlotte", "lat": 35.2271, "lng": -80.8431, "rank": 1},
-        {"name": "Raleigh", "lat": 35.7796, "lng": -78.6382, "rank": 2},
-        {"name": "Durham", "lat": 35.9940, "lng": -78.8986, "rank": 3},
-        {"name": "Greensboro", "lat": 36.0726, "lng": -79.7920, "rank": 4},
-        {"name": "Winston-Salem", "lat": 36.0999, "lng": -80.2442, "rank": 5},
-        {"name": "Asheville", "lat": 35.5951, "lng": -82.5515, "rank": 6},
-    ],
-    "north-dakota": [
-        {"name": "Fargo", "lat": 46.8772, "lng": -96.7898, "rank": 1},
-        {"name": "Bismarck", "lat": 46.8083, "lng": -100.7837, "rank": 2},
-        {"name": "Grand Forks", "lat": 47.9253, "lng": -97.0329, "rank": 3},
-    ],
-    "ohio": [
-        {"name": "Columbus", "lat": 39.9612, "lng": -82.9988, "rank": 1},
-        {"name": "Cleveland", "lat": 41.4993, "lng": -81.6944, "rank": 2},
-        {"name": "Cincinnati", "lat": 39.1031, "lng": -84.5120, "rank": 3},
-        {"name": "Toledo", "lat": 41.6528, "lng": -83.5379, "rank": 4},
-        {"name": "Akron", "lat": 41.0814, "lng": -81.5190, "rank": 5},
-    ],
-    "oklahoma": [
-        {"name": "Oklahoma City", "lat": 35.4676, "lng": -97.5164, "rank": 1},
-        {"name": "Tulsa", "lat": 36.1540, "lng": -95.9928, "rank": 2},
-        {"name": "Norman", "lat": 35.2226, "lng": -97.4395, "rank": 3},
-        {"name": "Edmond", "lat": 35.6528, "lng": -97.4781, "rank": 4},
-    ],
-    "oregon": [
-        {"name": "Portland", "lat": 45.5152, "lng": -122.6784, "rank": 1},
-        {"name": "Salem", "lat": 44.9429, "lng": -123.0351, "rank": 2},
-        {"name": "Eugene", "lat": 44.0521, "lng": -123.0868, "rank": 3},
-        {"name": "Bend", "lat": 44.0582, "lng": -121.3153, "rank": 4},
-    ],
-    "pennsylvania": [
-        {"name": "Philadelphia", "lat": 39.9526, "lng": -75.1652, "rank": 1},
-        {"name": "Pittsburgh", "lat": 40.4406, "lng": -79.9959, "rank": 2},
-        {"name": "Allentown", "lat": 40.6084, "lng": -75.4902, "rank": 3},
-        {"name": "Harrisburg", "lat": 40.2732, "lng": -76.8867, "rank": 4},
-        {"name": "Lancaster", "lat": 40.0379, "lng": -76.3055, "rank": 5},
-    ],
-    "rhode-island": [
-        {"name": "Providence", "lat": 41.8240, "lng": -71.4128, "rank": 1},
-        {"name": "Warwick", "lat": 41.7001, "lng": -71.4162, "rank": 2},
-        {"name": "Newport", "lat": 41.4901, "lng": -71.3128, "rank": 3},
-    ],
-    "south-carolina": [
-        {"name": "Charleston", "lat": 32.7765, "lng": -79.9311, "rank": 1},
-        {"name": "Columbia", "lat": 34.0007, "lng": -81.0348, "rank": 2},
-        {"name": "Greenville", "lat": 34.8526, "lng": -82.3940, "rank": 3},
-        {"name": "Myrtle Beach", "lat": 33.6891, "lng": -78.8867, "rank": 4},
-    ],
-    "south-dakota": [
-        {"name": "Sioux Falls", "lat": 43.5446, "lng": -96.7311, "rank": 1},
-        {"name": "Rapid City", "lat": 44.0805, "lng": -103.2310, "rank": 2},
-        {"name": "Aberdeen", "lat": 45.4647, "lng": -98.4865, "rank": 3},
-    ],
-    "tennessee": [
-        {"name": "Nashville", "lat": 36.1627, "lng": -86.7816, "rank": 1},
-        {"name": "Memphis", "lat": 35.1495, "lng": -90.0490, "rank": 2},
-        {"name": "Knoxville", "lat": 35.9606, "lng": -83.9207, "rank": 3},
-        {"name": "Chattanooga", "lat": 35.0456, "lng": -85.3097, "rank": 4},
-        {"name": "Clarksville", "lat": 36.5298, "lng": -87.3595, "rank": 5},
-    ],
-    "texas": [
-        {"name": "Houston", "lat": 29.7604, "lng": -95.3698, "rank": 1},
-        {"name": "Dallas", "lat": 32.7767, "lng": -96.7970, "rank": 2},
-        {"name": "Austin", "lat": 30.2672, "lng": -97.7431, "rank": 3},
-        {"name": "San Antonio", "lat": 29.4241, "lng": -98.4936, "rank": 4},
-        {"name": "Fort Worth", "lat": 32.7555, "lng": -97.3308, "rank": 5},
-        {"name": "El Paso", "lat": 31.7619, "lng": -106.4850, "rank": 6},
-    ],
-    "utah": [
-        {"name": "Salt Lake City", "lat": 40.7608, "lng": -111.8910, "rank": 1},
-        {"name": "Provo", "lat": 40.2338, "lng": -111.6585, "rank": 2},
-        {"name": "Ogden", "lat": 41.2230, "lng": -111.9738, "rank": 3},
-        {"name": "St. George", "lat": 37.0965, "lng": -113.5684, "rank": 4},
-    ],
-    "vermont": [
-        {"name": "Burlington", "lat": 44.4759, "lng": -73.2121, "rank": 1},
-        {"name": "South Burlington", "lat": 44.4669, "lng": -73.1710, "rank": 2},
-        {"name": "Montpelier", "lat": 44.2601, "lng": -72.5754, "rank": 3},
-    ],
-    "virginia": [
-        {"name": "Virginia Beach", "lat": 36.8529, "lng": -75.9780, "rank": 1},
-        {"name": "Norfolk", "lat": 36.8508, "lng": -76.2859, "rank": 2},
-        {"name": "Richmond", "lat": 37.5407, "lng": -77.4360, "rank": 3},
-        {"name": "Arlington", "lat": 38.8816, "lng": -77.0910, "rank": 4},
-        {"name": "Roanoke", "lat": 37.2710, "lng": -79.9414, "rank": 5},
-    ],
-    "washington": [
-        {"name": "Seattle", "lat": 47.6062, "lng": -122.3321, "rank": 1},
-        {"name": "Tacoma", "lat": 47.2529, "lng": -122.4443, "rank": 2},
-        {"name": "Spokane", "lat": 47.6588, "lng": -117.4260, "rank": 3},
-        {"name": "Bellevue", "lat": 47.6101, "lng": -122.2015, "rank": 4},
-        {"name": "Vancouver", "lat": 45.6387, "lng": -122.6615, "rank": 5},
-    ],
-    "west-virginia": [
-        {"name": "Charleston", "lat": 38.3498, "lng": -81.6326, "rank": 1},
-        {"name": "Huntington", "lat": 38.4192, "lng": -82.4452, "rank": 2},
-        {"name": "Morgantown", "lat": 39.6295, "lng": -79.9559, "rank": 3},
-    ],
-    "wisconsin": [
-        {"name": "Milwaukee", "lat": 43.0389, "lng": -87.9065, "rank": 1},
-        {"name": "Madison", "lat": 43.0731, "lng": -89.4012, "rank": 2},
-        {"name": "Green Bay", "lat": 44.5133, "lng": -88.0133, "rank": 3},
-        {"name": "Kenosha", "lat": 42.5847, "lng": -87.8212, "rank": 4},
-    ],
-    "wyoming": [
-        {"name": "Cheyenne", "lat": 41.1400, "lng": -104.8202, "rank": 1},
-        {"name": "Casper", "lat": 42.8501, "lng": -106.3252, "rank": 2},
-        {"name": "Jackson", "lat": 43.4799, "lng": -110.7624, "rank": 3},
-    ],
-    "district-of-columbia": [
-        {"name": "Washington", "lat": 38.9072, "lng": -77.0369, "rank": 1},
-    ],
+# Keyword arguments passed to generate_state_svg for every state. They are
+# part of each output's input hash in the build manifest.
+RENDER_OPTIONS = {"width": 400, "height": 300, "padding": 20}
+# --projection adds "projection" to the options of every map, raster and
+# overlay so they keep sharing one frame; without it maps are drawn in raw
+# longitude/latitude as before.
+
+# Every metro must fall inside its own state. The 1:20m boundaries are
+# generalized, so a metro outside its state but within this distance of the
+# border (Columbus GA, Grand Forks ND, ...) is reported without failing.
+BORDER_TOLERANCE_KM = 2.0
+
+# Bitmap renders of each state map (--raster), one file per scale and format.
+RASTER_DIR = os.path.join(OUTPUT_DIR, "raster")
+RASTER_FILENAME = "{slug}@{scale}x.{format}"
+
+# County / CBSA placement of each metro (--counties, --cbsa). Columns map the
+# keys written to METRO_AREAS_FILENAME to Census shapefile attributes.
+METRO_AREAS_FILENAME = "metro_areas.json"
+COUNTY_OVERLAY_FILENAME = "{slug}-counties.svg"
+AREA_COLUMNS = {
+    "county": {"geoid": "GEOID", "name": "NAME"},
+    "cbsa": {"geoid": "GEOID", "name": "NAME"},
 }
 
+# Per-state heatmaps of the deal locations in a points file (--points).
+DENSITY_OVERLAY_FILENAME = "{slug}-density.svg"
+
+# Metros drawn on each state map. They live in a data file rather than in
+# GENERATOR_SOURCES, so editing one state's metros only invalidates the
+# outputs whose input hash includes that state's entries.
+STATE_METROS_PATH = os.path.join(SCRIPT_DIR, "state_metros.json")
+with open(STATE_METROS_PATH) as f:
+    STATE_METROS = json.load(f)
+
 SLUG_TO_FIPS = {
     "alabama": "01", "alaska": "02", "arizona": "04", "arkansas": "05",
     "california": "06", "colorado": "08", "connecticut": "09", "delaware": "10",
@@ -366,63 +126,182 @@ STATE_NAMES = {
 
 def download_states_shapefile():
     """Download US states shapefile from Census Bureau."""
-    url = "https://www2.census.gov/geo/tiger/GENZ2021/shp/cb_2021_us_state_20m.zip"
-    cache_dir = "scripts/cache"
-    shapefile_path = os.path.join(cache_dir, "cb_2021_us_state_20m.shp")
+    from census_areas import download_census_shapefile
+    
+    return download_census_shapefile("state")
+
+
+def shapefile_components(shapefile_path):
+    """Existing files among the shapefile and its sidecars that affect its geometries."""
+    base, _ = os.path.splitext(shapefile_path)
+    return [base + ext for ext in SHAPEFILE_COMPONENTS if os.path.exists(base + ext)]
+
+
+def shapefile_hash(shapefile_path):
+    """Hash the shapefile and the sidecar files that affect its geometries."""
+    digest = hashlib.sha256()
+    for component in shapefile_components(shapefile_path):
+        digest.update(os.path.splitext(component)[1].encode())
+        with open(component, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build_geometry_cache(shapefile_path, source_hash):
+    """Read the shapefile once and write the WKB blob and its index."""
+    import geopandas as gpd
+    import shapely
+    
+    print("Building geometry cache from shapefile...")
+    with TIMINGS.stage("shapefile_read"):
+        states_gdf = gpd.read_file(shapefile_path)
     
-    if os.path.exists(shapefile_path):
-        print("Using cached shapefile...")
-        return shapefile_path
+    wkb_blobs = shapely.to_wkb(states_gdf.geometry.values, output_dimension=2)
+    geometries = {}
+    offset = 0
+    for fips, blob in zip(states_gdf['STATEFP'], wkb_blobs):
+        geometries[fips] = [offset, len(blob)]
+        offset += len(blob)
     
-    print("Downloading states shapefile...")
-    os.makedirs(cache_dir, exist_ok=True)
+    index = {
+        "source_hash": source_hash,
+        "crs": states_gdf.crs.to_wkt() if states_gdf.crs is not None else None,
+        "blob_size": offset,
+        "geometries": geometries,
+    }
     
-    response = requests.get(url, timeout=60)
-    response.raise_for_status()
+    tmp_path = GEOMETRY_CACHE_PATH + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        for blob in wkb_blobs:
+            f.write(blob)
+    os.replace(tmp_path, GEOMETRY_CACHE_PATH)
     
-    with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-        z.extractall(cache_dir)
+    # The index is written last so a valid index always describes a complete blob.
+    tmp_path = GEOMETRY_INDEX_PATH + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, GEOMETRY_INDEX_PATH)
     
-    return shapefile_path
+    return index
 
 
-def geometry_to_svg_path(geometry, min_x, min_y, scale_x, scale_y, height):
-    """Convert a shapely geometry to SVG path string."""
-    paths = []
+def read_geometry_index(source_hash):
+    """Return the cached index if it matches ``source_hash``, else None."""
+    try:
+        with open(GEOMETRY_INDEX_PATH) as f:
+            index = json.load(f)
+        blob_size = os.path.getsize(GEOMETRY_CACHE_PATH)
+    except (OSError, ValueError):
+        return None
+    if index.get("source_hash") != source_hash or index.get("blob_size") != blob_size:
+        return None
+    return index
+
+
+def load_state_geometries(shapefile_path, fips_codes):
+    """Load geometries for ``fips_codes`` as a {fips: geometry} dict.
+    
+    Served from the WKB cache when it matches the current shapefile; the cache
+    is rebuilt from the shapefile whenever its hash changes.
+    """
+    import shapely
+    
+    source_hash = shapefile_hash(shapefile_path)
+    index = read_geometry_index(source_hash)
+    if index is None:
+        index = build_geometry_cache(shapefile_path, source_hash)
+    else:
+        print("Using cached geometries...")
     
+    with TIMINGS.stage("fips_filter"):
+        wanted = [fips for fips in fips_codes if fips in index["geometries"]]
+        blobs = []
+        with open(GEOMETRY_CACHE_PATH, 'rb') as f:
+            for fips in wanted:
+                offset, length = index["geometries"][fips]
+                f.seek(offset)
+                blobs.append(f.read(length))
+        
+        return dict(zip(wanted, shapely.from_wkb(blobs)))
+
+
+def geometry_rings(geometry):
+    """Return every ring of a (Multi)Polygon: each exterior followed by its holes."""
     if geometry.geom_type == 'Polygon':
         polygons = [geometry]
     elif geometry.geom_type == 'MultiPolygon':
         polygons = list(geometry.geoms)
     else:
-        return ""
+        return []
     
+    rings = []
     for polygon in polygons:
-        exterior = polygon.exterior.coords
-        path_parts = []
-        for i, (x, y) in enumerate(exterior):
-            svg_x = (x - min_x) * scale_x
-            svg_y = height - (y - min_y) * scale_y
-            if i == 0:
-                path_parts.append(f"M {svg_x:.2f} {svg_y:.2f}")
-            else:
-                path_parts.append(f"L {svg_x:.2f} {svg_y:.2f}")
-        path_parts.append("Z")
-        paths.append(" ".join(path_parts))
+        rings.append(polygon.exterior)
+        rings.extend(polygon.interiors)
+    return rings
+
+
+def transform_coordinates(coords, min_x, min_y, scale_x, scale_y, height):
+    """Transform an (N, 2) array of lng/lat pairs to SVG coordinates in one pass."""
+    svg = np.empty_like(coords, dtype=float)
+    svg[:, 0] = (coords[:, 0] - min_x) * scale_x
+    svg[:, 1] = height - (coords[:, 1] - min_y) * scale_y
+    return svg
+
+
+def format_ring_path(svg_coords):
+    """Format one ring as an ``M x y L x y ... Z`` subpath with a single % call."""
+    template = "M %.2f %.2f" + " L %.2f %.2f" * (len(svg_coords) - 1) + " Z"
+    return template % tuple(svg_coords.ravel().tolist())
+
+
+def geometry_to_svg_path(geometry, min_x, min_y, scale_x, scale_y, height):
+    """Convert a shapely geometry to SVG path string.
+    
+    Every ring, including interior holes, becomes its own subpath. Vertices of
+    all rings are pulled out and transformed as one array.
+    """
+    import shapely
+    
+    rings = geometry_rings(geometry)
+    if not rings:
+        return ""
     
-    return " ".join(paths)
+    coords, ring_index = shapely.get_coordinates(np.asarray(rings, dtype=object), return_index=True)
+    svg_coords = transform_coordinates(coords, min_x, min_y, scale_x, scale_y, height)
+    
+    boundaries = np.flatnonzero(np.diff(ring_index)) + 1
+    return " ".join(
+        format_ring_path(ring_coords)
+        for ring_coords in np.split(svg_coords, boundaries)
+        if len(ring_coords)
+    )
 
 
-def transform_point(lng, lat, min_x, min_y, scale_x, scale_y, height):
-    """Transform lat/lng to SVG coordinates."""
-    svg_x = (lng - min_x) * scale_x
-    svg_y = height - (lat - min_y) * scale_y
-    return svg_x, svg_y
+def state_projection(state_geometry, state_slug, metros, projection):
+    """Project a state and its metros for drawing.
+    
+    Returns ``(geometry, metro_coords)``; ``metro_coords`` is an (N, 2)
+    array. With ``projection`` None both stay in longitude/latitude,
+    otherwise they are moved into the state's CRS (see ``projections``) with
+    one cached transformer.
+    """
+    metro_coords = np.array([[metro['lng'], metro['lat']] for metro in metros], dtype=float).reshape(-1, 2)
+    if projection is None:
+        return state_geometry, metro_coords
+    
+    transformer = state_transformer(projection, SLUG_TO_FIPS.get(state_slug), state_geometry)
+    return project_geometry(state_geometry, transformer), project_points(metro_coords, transformer)
 
 
-def generate_state_svg(state_geometry, state_slug, metros, width=400, height=300, padding=20):
-    """Generate an SVG for a state with metro dots (raw SVG string)."""
-    bounds = state_geometry.bounds
+def state_frame(bounds, width, height, padding):
+    """Fit ``bounds`` into the SVG viewport.
+    
+    Returns ``(min_x, min_y, scale, shift_x, shift_y)``: coordinates go
+    through ``transform_coordinates`` with ``scale`` and are then translated
+    by the shift, so overlays drawn with the same frame line up with the
+    state outline.
+    """
     min_x, min_y, max_x, max_y = bounds
     
     geo_width = max_x - min_x
@@ -441,6 +320,120 @@ def generate_state_svg(state_geometry, state_slug, metros, width=400, height=300
     offset_x = (width - scaled_width) / 2
     offset_y = (height - scaled_height) / 2
     
+    shift_x = offset_x - padding * scale_x / scale
+    shift_y = -(offset_y - padding * scale_y / scale)
+    
+    return min_x, min_y, scale, shift_x, shift_y
+
+
+def metro_dot_radius(rank):
+    return max(8 - (rank - 1) * 1.2, 4)
+
+
+def metro_markers(metros, metro_svg, width, height, declutter=False):
+    """Place the metro markers of a map in viewport coordinates.
+    
+    Returns ``(markers, labels)``. Each marker is ``(members, x, y, radius,
+    true_x, true_y)``: the indices of the metros it stands for, where it is
+    drawn and where its metros actually are. Without ``declutter`` every
+    metro is its own marker at its true position and nothing is labelled.
+    With it, dense groups become one cluster marker, other overlapping
+    markers are nudged apart, and ``labels`` holds ``(marker index, text,
+    (x, y, text_anchor))`` for each marker whose name label fits.
+    """
+    radii = np.array([metro_dot_radius(metro['rank']) for metro in metros], dtype=float)
+    if not declutter:
+        markers = [
+            ([index], svg_x, svg_y, radius, svg_x, svg_y)
+            for index, ((svg_x, svg_y), radius) in enumerate(zip(metro_svg.tolist(), radii.tolist()))
+        ]
+        return markers, []
+    
+    ranks = np.array([metro['rank'] for metro in metros], dtype=float)
+    bounds = (0, 0, width, height)
+    groups, positions = layout_markers(metro_svg, radii, ranks, bounds)
+    group_radii = [cluster_radius(radii[members[0]], len(members)) for members in groups]
+    
+    markers = []
+    texts = []
+    for members, (svg_x, svg_y), dot_radius in zip(groups, positions.tolist(), group_radii):
+        true_x, true_y = metro_svg[members].mean(axis=0).tolist()
+        markers.append((list(members), svg_x, svg_y, dot_radius, true_x, true_y))
+        lead = metros[members[0]]
+        texts.append(lead['name'] if len(members) == 1 else f"{lead['name']} +{len(members) - 1}")
+    
+    order = sorted(range(len(groups)), key=lambda index: (metros[groups[index][0]]['rank'], index))
+    placements = place_labels(positions, group_radii, texts, order, bounds)
+    labels = [
+        (index, text, placement)
+        for index, (text, placement) in enumerate(zip(texts, placements))
+        if placement is not None
+    ]
+    return markers, labels
+
+
+def metro_markup(metros, markers, labels):
+    """SVG lines for the markers and labels from ``metro_markers``.
+    
+    A marker drawn away from its metros gets a leader line back to their
+    true position; cluster markers carry their member count.
+    """
+    svg_parts = []
+    for members, svg_x, svg_y, dot_radius, true_x, true_y in markers:
+        lead = metros[members[0]]
+        if np.hypot(svg_x - true_x, svg_y - true_y) > 0.5:
+            svg_parts.append(f'  <line x1="{true_x:.2f}" y1="{true_y:.2f}" x2="{svg_x:.2f}" y2="{svg_y:.2f}" stroke="currentColor" stroke-width="1" opacity="0.5" class="metro-leader"/>')
+        
+        svg_parts.append(f'  <circle cx="{svg_x:.2f}" cy="{svg_y:.2f}" r="{dot_radius + 4:.1f}" fill="currentColor" opacity="0.2" class="metro-pulse rank-{lead["rank"]}"/>')
+        
+        if len(members) == 1:
+            svg_parts.append(f'  <circle cx="{svg_x:.2f}" cy="{svg_y:.2f}" r="{dot_radius:.1f}" fill="currentColor" opacity="0.9" class="metro-dot rank-{lead["rank"]}" data-city="{lead["name"]}" data-rank="{lead["rank"]}"/>')
+        else:
+            cities = html.escape(", ".join(metros[index]['name'] for index in members))
+            svg_parts.append(f'  <circle cx="{svg_x:.2f}" cy="{svg_y:.2f}" r="{dot_radius:.1f}" fill="currentColor" opacity="0.9" class="metro-cluster rank-{lead["rank"]}" data-cities="{cities}" data-count="{len(members)}"/>')
+            svg_parts.append(f'  <text x="{svg_x:.2f}" y="{svg_y:.2f}" text-anchor="middle" dominant-baseline="central" font-size="{LABEL_FONT_SIZE}" fill="white" class="metro-cluster-count">{len(members)}</text>')
+    
+    for index, text, (label_x, label_y, anchor) in labels:
+        rank = metros[markers[index][0][0]]['rank']
+        svg_parts.append(f'  <text x="{label_x:.2f}" y="{label_y:.2f}" text-anchor="{anchor}" font-size="{LABEL_FONT_SIZE}" fill="currentColor" class="metro-label rank-{rank}">{html.escape(text)}</text>')
+    
+    return svg_parts
+
+
+def state_scene(state_geometry, state_slug, metros, width=400, height=300, padding=20, declutter=False,
+                projection=None):
+    """Lay out one state map; both the SVG and the raster renderer draw from this.
+    
+    Returns ``(geometry, frame, markers, labels)``: the state outline in the
+    map's CRS (see ``state_projection``), its ``state_frame`` and the metro
+    markers and labels from ``metro_markers``, in viewport coordinates.
+    """
+    state_geometry, metro_coords = state_projection(state_geometry, state_slug, metros, projection)
+    frame = state_frame(state_geometry.bounds, width, height, padding)
+    min_x, min_y, scale, shift_x, shift_y = frame
+    
+    metro_svg = transform_coordinates(metro_coords, min_x, min_y, scale, scale, height)
+    metro_svg += (shift_x, shift_y)
+    
+    markers, labels = metro_markers(metros, metro_svg, width, height, declutter)
+    return state_geometry, frame, markers, labels
+
+
+def generate_state_svg(state_geometry, state_slug, metros, width=400, height=300, padding=20, declutter=False,
+                       projection=None):
+    """Generate an SVG for a state with metro dots (raw SVG string).
+    
+    With ``declutter``, overlapping dots are clustered or nudged apart and
+    labelled (see ``metro_markers``). ``projection`` ("albers" or
+    "conformal") draws the state in a projected CRS instead of raw degrees.
+    """
+    state_geometry, frame, markers, labels = state_scene(
+        state_geometry, state_slug, metros, width, height, padding, declutter, projection
+    )
+    min_x, min_y, scale, shift_x, shift_y = frame
+    scale_x = scale
+    scale_y = scale
+    
     state_path = geometry_to_svg_path(
         state_geometry, 
         min_x, min_y, 
@@ -448,76 +441,845 @@ def generate_state_svg(state_geometry, state_slug, metros, width=400, height=300
         height
     )
     
-    shift_x = offset_x - padding * scale_x / scale
-    shift_y = -(offset_y - padding * scale_y / scale)
-    
     svg_parts = []
     svg_parts.append(f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" class="state-outline-svg">')
     
     svg_parts.append(f'  <path d="{state_path}" fill="none" stroke="currentColor" stroke-width="2" opacity="0.8" class="state-boundary" transform="translate({shift_x:.2f}, {shift_y:.2f})"/>')
     
-    for metro in metros:
-        svg_x, svg_y = transform_point(
-            metro['lng'], metro['lat'],
-            min_x, min_y,
-            scale_x, scale_y,
-            height
-        )
+    svg_parts.extend(metro_markup(metros, markers, labels))
+    
+    svg_parts.append('</svg>')
+    
+    return '\n'.join(svg_parts)
+
+
+def generate_county_overlay_svg(state_geometry, state_slug, counties, width=400, height=300, padding=20,
+                                projection=None):
+    """Generate county outlines in the same frame as the state's map.
+    
+    ``counties`` is a list of ``(geoid, name, geometry, metro_names)``;
+    counties containing one of the state's metros get the ``has-metro`` class.
+    With ``projection`` the counties go through the state's transformer.
+    """
+    geometries = [geometry for _, _, geometry, _ in counties]
+    if projection is not None:
+        transformer = state_transformer(projection, SLUG_TO_FIPS.get(state_slug), state_geometry)
+        state_geometry = project_geometry(state_geometry, transformer)
+        geometries = project_geometry(np.asarray(geometries, dtype=object), transformer)
+    min_x, min_y, scale, shift_x, shift_y = state_frame(state_geometry.bounds, width, height, padding)
+    
+    svg_parts = []
+    svg_parts.append(f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" class="county-overlay-svg">')
+    svg_parts.append(f'  <g fill="none" stroke="currentColor" stroke-width="0.75" opacity="0.4" transform="translate({shift_x:.2f}, {shift_y:.2f})">')
+    
+    for (geoid, name, _, metro_names), geometry in zip(counties, geometries):
+        county_path = geometry_to_svg_path(geometry, min_x, min_y, scale, scale, height)
+        if not county_path:
+            continue
+        if metro_names:
+            metros_attr = html.escape(", ".join(metro_names))
+            svg_parts.append(f'    <path d="{county_path}" class="county-boundary has-metro" data-geoid="{geoid}" data-name="{html.escape(name)}" data-metros="{metros_attr}"/>')
+        else:
+            svg_parts.append(f'    <path d="{county_path}" class="county-boundary" data-geoid="{geoid}" data-name="{html.escape(name)}"/>')
+    
+    svg_parts.append('  </g>')
+    svg_parts.append('</svg>')
+    
+    return '\n'.join(svg_parts)
+
+
+def raster_scene(state_geometry, state_slug, metros, width=400, height=300, padding=20, declutter=False,
+                 projection=None):
+    """Return the ``state_scene`` as ``rasterize_maps.render_raster`` arguments.
+    
+    Rings, dots, leader lines, cluster counts and labels are all in viewport
+    coordinates (the outline's translate transform is already applied), at
+    exactly the positions ``generate_state_svg`` draws them.
+    """
+    import shapely
+    
+    state_geometry, frame, markers, labels = state_scene(
+        state_geometry, state_slug, metros, width, height, padding, declutter, projection
+    )
+    min_x, min_y, scale, shift_x, shift_y = frame
+    
+    rings = geometry_rings(state_geometry)
+    ring_coords = []
+    if rings:
+        coords, ring_index = shapely.get_coordinates(np.asarray(rings, dtype=object), return_index=True)
+        svg_coords = transform_coordinates(coords, min_x, min_y, scale, scale, height)
+        svg_coords += (shift_x, shift_y)
+        boundaries = np.flatnonzero(np.diff(ring_index)) + 1
+        ring_coords = [ring for ring in np.split(svg_coords, boundaries) if len(ring)]
+    
+    dots = [(svg_x, svg_y, dot_radius) for _, svg_x, svg_y, dot_radius, _, _ in markers]
+    leaders = [
+        ((true_x, true_y), (svg_x, svg_y))
+        for _, svg_x, svg_y, _, true_x, true_y in markers
+        if np.hypot(svg_x - true_x, svg_y - true_y) > 0.5
+    ]
+    counts = [(svg_x, svg_y, str(len(members))) for members, svg_x, svg_y, _, _, _ in markers if len(members) > 1]
+    texts = [(label_x, label_y, text, anchor) for _, text, (label_x, label_y, anchor) in labels]
+    return ring_coords, dots, leaders, counts, texts
+
+
+def render_raster_task(task):
+    """Worker entry point: rasterize one ``(slug, geometry, metros, options, targets, color)`` task."""
+    # matplotlib is only imported by runs (and workers) that produce rasters.
+    from rasterize_maps import rasterize
+    
+    state_slug, geometry, metros, options, targets, color = task
+    rings, dots, leaders, counts, texts = raster_scene(geometry, state_slug, metros, **options)
+    return state_slug, rasterize(
+        rings, dots, options["width"], options["height"], targets, color, leaders=leaders, counts=counts, labels=texts
+    )
+
+
+def render_state(task):
+    """Worker entry point: render one ``(slug, geometry, metros, options)`` task."""
+    state_slug, geometry, metros, options = task
+    return state_slug, generate_state_svg(geometry, state_slug, metros, **options)
+
+
+def render_county_overlay(task):
+    """Worker entry point: render one ``(slug, state geometry, counties, options)`` task."""
+    state_slug, geometry, counties, options = task
+    return state_slug, generate_county_overlay_svg(geometry, state_slug, counties, **options)
+
+
+def map_tasks(function, tasks, jobs=1):
+    """``map`` over ``jobs`` worker processes, preserving task order."""
+    from concurrent.futures import ProcessPoolExecutor
+    
+    if jobs == 1 or len(tasks) <= 1:
+        yield from map(function, tasks)
+        return
+    
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        yield from pool.map(function, tasks, chunksize=chunksize)
+
+
+def render_states(tasks, jobs=1, render=render_state, stage="render"):
+    """Render tasks in order, spreading them over ``jobs`` worker processes.
+    
+    Results come back in task order whatever the job count, so the output
+    files are identical to a serial run. With timings enabled, each task's
+    time is measured in the process that ran it and recorded under
+    ``stage`` for its state.
+    """
+    if not TIMINGS.enabled:
+        yield from map_tasks(render, tasks, jobs)
+        return
+    
+    for (state_slug, result), wall, cpu in map_tasks(timed_call(render), tasks, jobs):
+        TIMINGS.record(stage, wall, cpu, state_slug)
+        yield state_slug, result
+
+
+def validate_metros(state_geometries, crs, tolerance_km=BORDER_TOLERANCE_KM):
+    """Check that every metro lies inside its own state; return the error count.
+    
+    All metros are placed with one STRtree query over the state polygons and
+    their distance to their own state's border is measured in an equal-area
+    projection, so the check stays vectorized for any number of points.
+    Outliers are printed; an outlier further than ``tolerance_km`` from its
+    border is an error. ``state_geometries`` maps FIPS codes to geometries
+    in ``crs`` and should cover every state.
+    """
+    import geopandas as gpd
+    
+    from census_areas import AreaIndex
+    
+    states = gpd.GeoDataFrame(
+        {"STATEFP": list(state_geometries)},
+        geometry=list(state_geometries.values()),
+        crs=crs,
+    )
+    index = AreaIndex(states)
+    state_fips = states["STATEFP"].to_numpy()
+    
+    metros = [
+        (slug, metro) for slug, state_metros in STATE_METROS.items() if slug in SLUG_TO_FIPS
+        for metro in state_metros
+    ]
+    expected = np.array([SLUG_TO_FIPS[slug] for slug, _ in metros])
+    lng = np.array([metro['lng'] for _, metro in metros], dtype=float)
+    lat = np.array([metro['lat'] for _, metro in metros], dtype=float)
+    
+    sorter = np.argsort(state_fips)
+    expected_rows = sorter[np.searchsorted(state_fips, expected, sorter=sorter).clip(max=len(state_fips) - 1)]
+    missing = state_fips[expected_rows] != expected
+    expected_rows[missing] = 0
+    
+    found_rows = index.locate(lng, lat)
+    found = np.where(found_rows >= 0, state_fips[found_rows], "")
+    distance_km = index.distance_to_boundary(expected_rows, lng, lat) / 1000
+    
+    outliers = (found != expected) | missing
+    errors = outliers & ((distance_km > tolerance_km) | missing)
+    
+    for i in np.flatnonzero(outliers).tolist():
+        slug, metro = metros[i]
+        location = STATE_NAMES.get(found[i], "no state") if found[i] else "no state"
+        level = "Error" if errors[i] else "Warning"
+        print(f"{level}: {metro['name']} ({slug}) is in {location}, {distance_km[i]:.2f} km outside the border")
+    
+    near_border = np.count_nonzero(~outliers & (distance_km <= tolerance_km))
+    print(f"Validated {len(metros)} metros: {np.count_nonzero(outliers)} outside their state "
+          f"({np.count_nonzero(errors)} beyond {tolerance_km:g} km), {near_border} within {tolerance_km:g} km of a border")
+    return int(np.count_nonzero(errors))
+
+
+def assign_metro_areas(indexes):
+    """Place every metro in STATE_METROS in its county and/or CBSA.
+    
+    ``indexes`` maps a layer ("county", "cbsa") to its ``AreaIndex``. All
+    metros are looked up in one STRtree query per layer. Returns
+    ``{slug: [{"name": ..., layer: {"geoid": ..., "name": ...} or None}]}``.
+    """
+    metros = [(slug, metro) for slug, state_metros in STATE_METROS.items() for metro in state_metros]
+    lng = np.array([metro['lng'] for _, metro in metros], dtype=float)
+    lat = np.array([metro['lat'] for _, metro in metros], dtype=float)
+    
+    placements = {
+        layer: index.records(index.locate(lng, lat), AREA_COLUMNS[layer])
+        for layer, index in indexes.items()
+    }
+    
+    metro_areas = {slug: [] for slug in STATE_METROS}
+    for i, (slug, metro) in enumerate(metros):
+        entry = {"name": metro['name']}
+        for layer, records in placements.items():
+            entry[layer] = records[i]
+        metro_areas[slug].append(entry)
+    return metro_areas
+
+
+def frame_options(args):
+    """RENDER_OPTIONS plus the options every layer of a map must agree on."""
+    if args.projection:
+        return dict(RENDER_OPTIONS, projection=args.projection)
+    return RENDER_OPTIONS
+
+
+def map_options(args):
+    """``frame_options`` plus the marker layout: what a map and its rasters are drawn with."""
+    if args.declutter:
+        return dict(frame_options(args), declutter=True)
+    return frame_options(args)
+
+
+def write_raster_outputs(manifest, args, generator_hash, shapefile_path, source_hash, state_geometries, jobs):
+    """Write PNG/WebP renders of every state map into RASTER_DIR.
+    
+    Each ``(scale, format)`` file has its own manifest entry, so only stale
+    ones are rendered; ``state_geometries`` is reused and extended as
+    needed. Returns the number of files written.
+    """
+    import rasterize_maps
+    
+    formats = list(rasterize_maps.RASTER_FORMATS) if args.raster == "all" else [args.raster]
+    scales = args.raster_scales or list(rasterize_maps.RASTER_SCALES)
+    color = args.raster_color or rasterize_maps.RASTER_COLOR
+    options = map_options(args)
+    
+    stale = []
+    for state_slug, fips in SLUG_TO_FIPS.items():
+        metros = STATE_METROS.get(state_slug)
+        if not metros:
+            continue
+        targets = {}
+        for scale in scales:
+            for image_format in formats:
+                filename = RASTER_FILENAME.format(slug=state_slug, scale=scale, format=image_format)
+                output_path = os.path.join(RASTER_DIR, filename)
+                input_hash = hash_inputs(generator_hash, source_hash, fips, metros, options, scale, image_format, color)
+                if args.force or not manifest.is_current(output_path, input_hash):
+                    targets[(scale, image_format)] = (output_path, input_hash)
+        if targets:
+            stale.append((state_slug, fips, metros, targets))
+    
+    if not stale:
+        return 0
+    
+    missing = [fips for _, fips, _, _ in stale if fips not in state_geometries]
+    if missing:
+        state_geometries.update(load_state_geometries(shapefile_path, missing))
+    
+    tasks = []
+    outputs = {}
+    for state_slug, fips, metros, targets in stale:
+        geometry = state_geometries.get(fips)
+        if geometry is None:
+            print(f"Warning: No geometry found for {state_slug} (FIPS: {fips})")
+            continue
+        tasks.append((state_slug, geometry, metros, options, list(targets), color))
+        outputs[state_slug] = targets
+    
+    written_count = 0
+    for state_slug, encoded in render_states(tasks, jobs, render=render_raster_task, stage="raster"):
+        for target, data in encoded.items():
+            output_path, input_hash = outputs[state_slug][target]
+            with TIMINGS.stage("raster_write", state_slug):
+                if manifest.write(output_path, input_hash, data):
+                    written_count += 1
+    print(f"Rasterized {len(tasks)} states at {', '.join(f'{scale}x' for scale in scales)} ({', '.join(formats)})")
+    return written_count
+
+
+def write_area_outputs(manifest, args, generator_hash, shapefile_path, source_hash, jobs):
+    """Write METRO_AREAS_FILENAME and, with --counties, per-state county overlays.
+    
+    Returns ``(generated_overlays, filenames)`` where ``filenames`` maps
+    fingerprint manifest keys to the files written.
+    """
+    from census_areas import AreaIndex, download_census_shapefile
+    
+    layers = []
+    if args.counties:
+        layers.append("county")
+    if args.cbsa:
+        layers.append("cbsa")
+    layer_paths = {layer: download_census_shapefile(layer) for layer in layers}
+    layer_hashes = {layer: shapefile_hash(path) for layer, path in layer_paths.items()}
+    indexes = {}
+    
+    def area_index(layer):
+        if layer not in indexes:
+            indexes[layer] = AreaIndex.from_shapefile(layer_paths[layer])
+            print(f"Indexed {len(indexes[layer])} {layer} areas")
+        return indexes[layer]
+    
+    options = frame_options(args)
+    filenames = {"metro_areas": METRO_AREAS_FILENAME}
+    metro_areas_path = os.path.join(OUTPUT_DIR, METRO_AREAS_FILENAME)
+    metro_areas_hash = hash_inputs(generator_hash, layer_hashes, STATE_METROS)
+    metro_areas = None
+    if args.force or not manifest.is_current(metro_areas_path, metro_areas_hash):
+        metro_areas = assign_metro_areas({layer: area_index(layer) for layer in layers})
+        if manifest.write(metro_areas_path, metro_areas_hash, json.dumps(metro_areas, indent=2) + "\n"):
+            print(f"Metro areas saved to {metro_areas_path}")
+    
+    if "county" not in layers:
+        return 0, filenames
+    
+    stale = []
+    for state_slug, fips in SLUG_TO_FIPS.items():
+        metros = STATE_METROS.get(state_slug)
+        if not metros:
+            continue
+        filename = COUNTY_OVERLAY_FILENAME.format(slug=state_slug)
+        filenames[("counties", state_slug)] = filename
+        output_path = os.path.join(OUTPUT_DIR, filename)
+        input_hash = hash_inputs(generator_hash, source_hash, layer_hashes["county"], fips, metros, options)
+        if args.force or not manifest.is_current(output_path, input_hash):
+            stale.append((state_slug, fips, output_path, input_hash))
+    
+    if not stale:
+        return 0, filenames
+    
+    if metro_areas is None:
+        metro_areas = assign_metro_areas({"county": area_index("county")})
+    counties = area_index("county").areas
+    counties_by_state = dict(tuple(counties.groupby("STATEFP", sort=False)))
+    state_geometries = load_state_geometries(shapefile_path, [fips for _, fips, _, _ in stale])
+    
+    tasks = []
+    outputs = {}
+    for state_slug, fips, output_path, input_hash in stale:
+        state_counties = counties_by_state.get(fips)
+        if fips not in state_geometries or state_counties is None:
+            print(f"Warning: No county geometries found for {state_slug} (FIPS: {fips})")
+            continue
         
-        svg_x += shift_x
-        svg_y += shift_y
+        metros_by_county = {}
+        for entry in metro_areas[state_slug]:
+            if entry["county"] is not None:
+                metros_by_county.setdefault(entry["county"]["geoid"], []).append(entry["name"])
         
-        dot_radius = 8 - (metro['rank'] - 1) * 1.2
-        dot_radius = max(dot_radius, 4)
+        state_counties = state_counties.sort_values("GEOID")
+        county_rows = [
+            (geoid, name, geometry, metros_by_county.get(geoid, []))
+            for geoid, name, geometry in zip(state_counties["GEOID"], state_counties["NAME"], state_counties.geometry)
+        ]
+        tasks.append((state_slug, state_geometries[fips], county_rows, options))
+        outputs[state_slug] = (output_path, input_hash)
+    
+    generated_count = 0
+    for state_slug, svg_content in render_states(tasks, jobs, render=render_county_overlay, stage="county_overlay"):
+        output_path, input_hash = outputs[state_slug]
+        with TIMINGS.stage("county_overlay_write", state_slug):
+            written = manifest.write(output_path, input_hash, svg_content)
+        if written:
+            print(f"Generated: {os.path.basename(output_path)}")
+            generated_count += 1
+    return generated_count, filenames
+
+
+def density_frames(state_geometries, state_slugs, options):
+    """Frame of each state's map as arrays ``(min_x, min_y, scale, shift_x, shift_y)``.
+    
+    Rows follow ``state_slugs``; with a projection, ``transformers`` holds
+    each state's transformer (None otherwise).
+    """
+    frames = []
+    transformers = []
+    for state_slug in state_slugs:
+        geometry = state_geometries[SLUG_TO_FIPS[state_slug]]
+        if options.get("projection"):
+            transformer = state_transformer(options["projection"], SLUG_TO_FIPS[state_slug], geometry)
+            geometry = project_geometry(geometry, transformer)
+            transformers.append(transformer)
+        else:
+            transformers.append(None)
+        frames.append(state_frame(geometry.bounds, options["width"], options["height"], options["padding"]))
+    return tuple(np.array(column, dtype=float) for column in zip(*frames)), transformers
+
+
+def bin_points(args, state_geometries, state_slugs, options):
+    """Read ``args.points`` chunk by chunk into a ``DensityGrid`` over ``state_slugs``.
+    
+    Each chunk is placed in states with one STRtree query, then moved into
+    the viewport frame of its state (projected per state when a projection
+    is set) and added to the grid, after which it is dropped.
+    """
+    import geopandas as gpd
+    
+    from census_areas import AreaIndex
+    
+    states = gpd.GeoDataFrame(
+        {"slug": state_slugs},
+        geometry=[state_geometries[SLUG_TO_FIPS[slug]] for slug in state_slugs],
+    )
+    index = AreaIndex(states)
+    (min_x, min_y, scale, shift_x, shift_y), transformers = density_frames(state_geometries, state_slugs, options)
+    grid = DensityGrid(len(state_slugs), options["width"], options["height"], args.density_cells, args.density_cell_size)
+    
+    read_count = 0
+    invalid_count = 0
+    outside_count = 0
+    for lng, lat, weight in read_point_chunks(
+        args.points, args.points_lng_column, args.points_lat_column, args.points_weight_column, args.points_chunk_rows,
+    ):
+        read_count += len(lng)
+        valid = np.isfinite(lng) & np.isfinite(lat) & np.isfinite(weight)
+        invalid_count += int(np.count_nonzero(~valid))
+        lng, lat, weight = lng[valid], lat[valid], weight[valid]
         
-        svg_parts.append(f'  <circle cx="{svg_x:.2f}" cy="{svg_y:.2f}" r="{dot_radius + 4:.1f}" fill="currentColor" opacity="0.2" class="metro-pulse rank-{metro["rank"]}"/>')
+        rows = index.locate(lng, lat)
+        inside = rows >= 0
+        outside_count += int(np.count_nonzero(~inside))
+        rows, coords, weight = rows[inside], np.column_stack([lng[inside], lat[inside]]), weight[inside]
         
-        svg_parts.append(f'  <circle cx="{svg_x:.2f}" cy="{svg_y:.2f}" r="{dot_radius:.1f}" fill="currentColor" opacity="0.9" class="metro-dot rank-{metro["rank"]}" data-city="{metro["name"]}" data-rank="{metro["rank"]}"/>')
+        if options.get("projection"):
+            for row in np.unique(rows).tolist():
+                members = rows == row
+                coords[members] = project_points(coords[members], transformers[row])
+        
+        svg = transform_coordinates(coords, min_x[rows], min_y[rows], scale[rows], scale[rows], options["height"])
+        svg[:, 0] += shift_x[rows]
+        svg[:, 1] += shift_y[rows]
+        grid.add(rows, svg[:, 0], svg[:, 1], weight)
     
-    svg_parts.append('</svg>')
+    print(f"Binned {read_count - invalid_count - outside_count:,} of {read_count:,} points "
+          f"({outside_count:,} outside every state, {invalid_count:,} without valid coordinates)")
+    return grid
+
+
+def write_density_outputs(manifest, args, generator_hash, shapefile_path, source_hash, state_geometries):
+    """Write a DENSITY_OVERLAY_FILENAME heatmap of ``args.points`` for every state.
     
-    return '\n'.join(svg_parts)
+    The points file is only read when some overlay is stale; every state is
+    then binned in that one pass. ``state_geometries`` is reused and
+    extended as needed. Returns ``(generated_overlays, filenames)``.
+    """
+    options = frame_options(args)
+    points_hash = hash_inputs(
+        file_sha256(args.points), args.points_lng_column, args.points_lat_column, args.points_weight_column,
+    )
+    state_slugs = list(SLUG_TO_FIPS)
+    
+    filenames = {}
+    stale = {}
+    for state_slug in state_slugs:
+        filename = DENSITY_OVERLAY_FILENAME.format(slug=state_slug)
+        filenames[("density", state_slug)] = filename
+        output_path = os.path.join(OUTPUT_DIR, filename)
+        input_hash = hash_inputs(
+            generator_hash, source_hash, points_hash, SLUG_TO_FIPS[state_slug], options,
+            args.density_cells, args.density_cell_size,
+        )
+        if args.force or not manifest.is_current(output_path, input_hash):
+            stale[state_slug] = (output_path, input_hash)
+    
+    if not stale:
+        return 0, filenames
+    
+    missing = [fips for fips in SLUG_TO_FIPS.values() if fips not in state_geometries]
+    if missing:
+        state_geometries.update(load_state_geometries(shapefile_path, missing))
+    state_slugs = [slug for slug in state_slugs if SLUG_TO_FIPS[slug] in state_geometries]
+    
+    try:
+        grid = bin_points(args, state_geometries, state_slugs, options)
+    except ValueError as error:
+        raise SystemExit(f"Cannot read points: {error}")
+    
+    generated_count = 0
+    for row, state_slug in enumerate(state_slugs):
+        if state_slug not in stale:
+            continue
+        output_path, input_hash = stale[state_slug]
+        svg_content = grid.overlay_svg(row, options["width"], options["height"])
+        with TIMINGS.stage("density_write", state_slug):
+            written = manifest.write(output_path, input_hash, svg_content)
+        if written:
+            print(f"Generated: {os.path.basename(output_path)} ({int(grid.counts[row].sum())} points)")
+            generated_count += 1
+    return generated_count, filenames
+
 
+def read_state_svg_parts(state_slug):
+    """Split a generated ``{slug}.svg`` into its viewBox and inner markup."""
+    with open(os.path.join(OUTPUT_DIR, f"{state_slug}.svg")) as f:
+        match = SVG_ROOT_PATTERN.match(f.read())
+    if match is None:
+        raise ValueError(f"Unexpected SVG structure in {state_slug}.svg")
+    return match.group(1), match.group(2)
 
-def main():
+
+def write_bundles(manifest, state_slugs, kinds):
+    """Write all state maps as one sprite and/or one JSON blob.
+    
+    The bundles are assembled from the per-state files on disk (which stay in
+    place for deep links), so states skipped as up to date are not
+    re-rendered. Returns {kind: filename} for the bundles written.
+    """
+    state_paths = [os.path.join(OUTPUT_DIR, f"{slug}.svg") for slug in state_slugs]
+    input_hash = hash_inputs([(path, manifest.content_hash(path)) for path in state_paths])
+    targets = {"sprite": SPRITE_FILENAME, "bundle": BUNDLE_JSON_FILENAME}
+    written = {}
+    parts = None
+    
+    for kind in kinds:
+        filename = targets[kind]
+        output_path = os.path.join(OUTPUT_DIR, filename)
+        written[kind] = filename
+        if manifest.is_current(output_path, input_hash):
+            continue
+        if parts is None:
+            parts = {slug: read_state_svg_parts(slug) for slug in state_slugs}
+        
+        if kind == "sprite":
+            lines = ['<svg xmlns="http://www.w3.org/2000/svg" style="display: none">']
+            for slug, (view_box, inner) in parts.items():
+                lines.append(f'<symbol id="state-{slug}" viewBox="{view_box}" class="state-outline-svg">')
+                lines.append(inner)
+                lines.append('</symbol>')
+            lines.append('</svg>')
+            content = '\n'.join(lines)
+        else:
+            bundle = {slug: {"viewBox": view_box, "content": inner} for slug, (view_box, inner) in parts.items()}
+            content = json.dumps(bundle, separators=(',', ':'))
+        
+        manifest.write(output_path, input_hash, content)
+        print(f"Bundled {len(state_slugs)} states into {filename}")
+    
+    return written
+
+
+def fingerprinted_name(filename, content_hash):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{content_hash[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def write_fingerprinted_assets(manifest, filenames):
+    """Write content-addressed copies of ``filenames`` plus manifest.json.
+    
+    ``filenames`` maps a manifest key (a state slug, "metros_data", "sprite",
+    "bundle", "metro_areas" or a ``(group, slug)`` pair such as
+    ``("counties", slug)``) to a file in OUTPUT_DIR. Fingerprints come from the content hashes the build
+    manifest already holds, so up-to-date outputs are not re-read. Each copy
+    is itself a manifest output (its input hash is its content hash), so a
+    deleted or edited copy makes the run stale and is rewritten. Copies left
+    over from earlier builds are removed together with their .br/.gz
+    siblings from compress_assets.py.
+    """
+    fingerprinted = {}
+    for key, filename in filenames.items():
+        source_path = os.path.join(OUTPUT_DIR, filename)
+        content_hash = manifest.content_hash(source_path)
+        if content_hash is None:
+            continue
+        name = fingerprinted_name(filename, content_hash)
+        target_path = os.path.join(OUTPUT_DIR, name)
+        if not manifest.is_current(target_path, content_hash):
+            with open(source_path, 'rb') as f:
+                manifest.write(target_path, content_hash, f.read())
+        fingerprinted[key] = name
+    
+    current = set(fingerprinted.values())
+    pattern = re.compile(r"\.[0-9a-f]{%d}\.(svg|json)(\.br|\.gz)?$" % FINGERPRINT_LENGTH)
+    for name in os.listdir(OUTPUT_DIR):
+        match = pattern.search(name)
+        # A sibling goes with its copy: "ohio.<hash>.svg.br" stays while
+        # "ohio.<hash>.svg" is current.
+        if match and name.removesuffix(match.group(2) or "") not in current:
+            os.remove(os.path.join(OUTPUT_DIR, name))
+            manifest.forget(os.path.join(OUTPUT_DIR, name))
+    
+    asset_manifest = {"states": {}}
+    for key, name in fingerprinted.items():
+        if isinstance(key, tuple):
+            group, slug = key
+            asset_manifest.setdefault(group, {})[slug] = name
+        elif key in SLUG_TO_FIPS:
+            asset_manifest["states"][key] = name
+        else:
+            asset_manifest[key] = name
+    manifest.write(
+        FINGERPRINT_MANIFEST_PATH,
+        hash_inputs(asset_manifest),
+        json.dumps(asset_manifest, indent=2, sort_keys=True) + "\n",
+    )
+    return asset_manifest
+
+
+def job_count(value):
+    """argparse type for --jobs: a non-negative int, 0 meaning one per CPU."""
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if jobs < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {jobs}")
+    return jobs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-j", "--jobs", type=job_count, default=1,
+                        help="render states in N worker processes (0 = one per CPU)")
+    parser.add_argument("--force", action="store_true",
+                        help="regenerate every output even if its inputs are unchanged")
+    parser.add_argument("--bundle", choices=["sprite", "json", "all"],
+                        help=f"also bundle every state into {SPRITE_FILENAME} (<symbol> per state), "
+                             f"{BUNDLE_JSON_FILENAME} (markup keyed by slug) or both")
+    parser.add_argument("--fingerprint", action="store_true",
+                        help="also write content-hashed copies of each output and manifest.json")
+    parser.add_argument("--counties", action="store_true",
+                        help="place metros in Census counties and write per-state county overlays "
+                             f"({COUNTY_OVERLAY_FILENAME.format(slug='{slug}')})")
+    parser.add_argument("--cbsa", action="store_true",
+                        help=f"place metros in Census CBSAs (written to {METRO_AREAS_FILENAME})")
+    parser.add_argument("--declutter", action="store_true",
+                        help="cluster or nudge overlapping metro dots and add non-overlapping labels")
+    parser.add_argument("--projection", choices=PROJECTIONS,
+                        help="draw states projected: equal-area Albers (Alaska/Hawaii/CONUS) or a "
+                             "Lambert conformal conic fitted to each state; default is raw lon/lat")
+    parser.add_argument("--raster", choices=["png", "webp", "all"],
+                        help=f"also render each state map to bitmaps in {RASTER_DIR}")
+    parser.add_argument("--raster-scales", type=int, nargs="+", metavar="SCALE",
+                        help="device pixel ratios to rasterize at (default: 1 2 3)")
+    parser.add_argument("--raster-color",
+                        help="outline and dot colour for bitmaps (default: the site's primary colour)")
+    parser.add_argument("--points", metavar="FILE",
+                        help="CSV, XLSX or Parquet file of deal locations; writes a per-state density "
+                             f"heatmap ({DENSITY_OVERLAY_FILENAME.format(slug='{slug}')})")
+    parser.add_argument("--points-lng-column", default="lng",
+                        help="longitude column of --points (default: lng)")
+    parser.add_argument("--points-lat-column", default="lat",
+                        help="latitude column of --points (default: lat)")
+    parser.add_argument("--points-weight-column",
+                        help="column summed per cell instead of counting points (e.g. loan amount)")
+    parser.add_argument("--points-chunk-rows", type=int, default=POINT_CHUNK_ROWS,
+                        help=f"rows of --points read at a time (default: {POINT_CHUNK_ROWS})")
+    parser.add_argument("--density-cells", choices=DENSITY_CELLS, default=DENSITY_CELLS[0],
+                        help="bin --points into hexagons or grid squares (default: hex)")
+    parser.add_argument("--density-cell-size", type=float, default=DENSITY_CELL_SIZE,
+                        help=f"cell width in viewport units (default: {DENSITY_CELL_SIZE:g})")
+    parser.add_argument("--border-tolerance-km", type=float, default=BORDER_TOLERANCE_KM,
+                        help="metros outside their state by more than this fail the build (default: %(default)s)")
+    parser.add_argument("--skip-validation", action="store_true",
+                        help="do not check that each metro lies inside its state")
+    parser.add_argument("--timings", nargs="?", const="", metavar="JSON",
+                        help="report wall/CPU time per stage and per state and tracemalloc peak memory "
+                             "per stage (memory tracing slows the run); optionally save them as JSON")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_PATH, metavar="FILE",
+                        help=f"run under cProfile and dump the stats (default: {PROFILE_PATH}); "
+                             "worker processes are not profiled, so combine with -j 1")
+    return parser.parse_args(argv)
+
+
+def build_maps(args, argv):
+    from census_areas import census_layer_name
+    
+    jobs = args.jobs or os.cpu_count() or 1
+    if args.points and not os.path.isfile(args.points):
+        raise SystemExit(f"Points file not found: {args.points}")
+    
     os.makedirs(OUTPUT_DIR, exist_ok=True)
+    manifest = BuildManifest()
     
-    shapefile_path = download_states_shapefile()
-    states_gdf = gpd.read_file(shapefile_path)
+    with TIMINGS.stage("download"):
+        shapefile_path = download_states_shapefile()
     
-    print(f"Loaded {len(states_gdf)} states/territories")
+    with TIMINGS.stage("manifest_check"):
+        # Any change to this script's code or its helper modules invalidates
+        # every output; unchanged results are still not rewritten. Metros are
+        # hashed per state, so editing one only re-renders that state.
+        generator_hash = hash_inputs([file_sha256(os.path.join(SCRIPT_DIR, name)) for name in GENERATOR_SOURCES])
+        source_hash = shapefile_hash(shapefile_path)
+        render_options = map_options(args)
+        
+        stale = []
+        up_to_date_count = 0
+        
+        for state_slug, fips in SLUG_TO_FIPS.items():
+            metros = STATE_METROS.get(state_slug, [])
+            
+            if not metros:
+                print(f"Warning: No metros defined for {state_slug}")
+                continue
+            
+            output_path = os.path.join(OUTPUT_DIR, f"{state_slug}.svg")
+            input_hash = hash_inputs(generator_hash, source_hash, fips, metros, render_options)
+            if not args.force and manifest.is_current(output_path, input_hash):
+                up_to_date_count += 1
+                continue
+            
+            stale.append((state_slug, fips, metros, output_path, input_hash))
     
-    generated_count = 0
+    state_geometries = {}
+    if stale and not args.skip_validation:
+        # Validation needs every state polygon; rendering reuses them.
+        state_geometries = load_state_geometries(shapefile_path, list(STATE_NAMES))
+        crs = read_geometry_index(source_hash)["crs"]
+        with TIMINGS.stage("validate"):
+            error_count = validate_metros(state_geometries, crs, args.border_tolerance_km)
+        if error_count:
+            raise SystemExit(f"{error_count} metros fall outside their state; fix STATE_METROS or pass --skip-validation")
+    elif stale:
+        state_geometries = load_state_geometries(shapefile_path, [fips for _, fips, _, _, _ in stale])
+    if stale:
+        print(f"Loaded {len(state_geometries)} state geometries")
     
-    for state_slug, fips in SLUG_TO_FIPS.items():
-        state_row = states_gdf[states_gdf['STATEFP'] == fips]
+    tasks = []
+    outputs = {}
+    
+    for state_slug, fips, metros, output_path, input_hash in stale:
+        geometry = state_geometries.get(fips)
         
-        if state_row.empty:
+        if geometry is None:
             print(f"Warning: No geometry found for {state_slug} (FIPS: {fips})")
             continue
         
-        geometry = state_row.iloc[0].geometry
-        metros = STATE_METROS.get(state_slug, [])
+        tasks.append((state_slug, geometry, metros, render_options))
+        outputs[state_slug] = (output_path, input_hash)
+    
+    generated_count = 0
+    
+    try:
+        for state_slug, svg_content in render_states(tasks, jobs):
+            output_path, input_hash = outputs[state_slug]
+            with TIMINGS.stage("write", state_slug):
+                written = manifest.write(output_path, input_hash, svg_content)
+            if written:
+                print(f"Generated: {state_slug}.svg ({len(STATE_METROS[state_slug])} metros)")
+                generated_count += 1
+            else:
+                up_to_date_count += 1
         
-        if not metros:
-            print(f"Warning: No metros defined for {state_slug}")
-            continue
+        metros_json_path = os.path.join(OUTPUT_DIR, "metros_data.json")
+        metros_json = json.dumps(STATE_METROS, indent=2)
+        with TIMINGS.stage("write"):
+            metros_changed = manifest.write(metros_json_path, hash_inputs(STATE_METROS), metros_json)
         
-        svg_content = generate_state_svg(geometry, state_slug, metros)
+        state_slugs = [
+            slug for slug in SLUG_TO_FIPS
+            if STATE_METROS.get(slug) and manifest.content_hash(os.path.join(OUTPUT_DIR, f"{slug}.svg"))
+        ]
         
-        output_path = os.path.join(OUTPUT_DIR, f"{state_slug}.svg")
-        with open(output_path, 'w') as f:
-            f.write(svg_content)
+        if args.raster:
+            raster_count = write_raster_outputs(manifest, args, generator_hash, shapefile_path, source_hash, state_geometries, jobs)
+            print(f"Wrote {raster_count} raster images")
         
-        print(f"Generated: {state_slug}.svg ({len(metros)} metros)")
-        generated_count += 1
+        area_files = {}
+        if args.counties or args.cbsa:
+            with TIMINGS.stage("areas"):
+                overlay_count, area_files = write_area_outputs(manifest, args, generator_hash, shapefile_path, source_hash, jobs)
+            if overlay_count:
+                print(f"Generated {overlay_count} county overlays")
+        
+        density_files = {}
+        if args.points:
+            with TIMINGS.stage("density"):
+                density_count, density_files = write_density_outputs(
+                    manifest, args, generator_hash, shapefile_path, source_hash, state_geometries,
+                )
+            if density_count:
+                print(f"Generated {density_count} density overlays")
+        
+        bundles = {}
+        if args.bundle:
+            kinds = ["sprite", "bundle"] if args.bundle == "all" else ["sprite" if args.bundle == "sprite" else "bundle"]
+            with TIMINGS.stage("bundle"):
+                bundles = write_bundles(manifest, state_slugs, kinds)
+        
+        if args.fingerprint:
+            filenames = {slug: f"{slug}.svg" for slug in state_slugs}
+            filenames["metros_data"] = "metros_data.json"
+            filenames.update(bundles)
+            filenames.update(area_files)
+            filenames.update(density_files)
+            with TIMINGS.stage("fingerprint"):
+                asset_manifest = write_fingerprinted_assets(manifest, filenames)
+            print(f"Fingerprinted {len(asset_manifest['states'])} state SVGs into {FINGERPRINT_MANIFEST_PATH}")
+        
+        # Lets `python -m scripts maps` skip an identical run without
+        # importing this module.
+        run_inputs = [os.path.join(SCRIPT_DIR, name) for name in GENERATOR_SOURCES] + [STATE_METROS_PATH]
+        run_inputs += shapefile_components(shapefile_path)
+        for layer, enabled in (("county", args.counties), ("cbsa", args.cbsa)):
+            if enabled:
+                run_inputs += shapefile_components(os.path.join(CACHE_DIR, census_layer_name(layer) + ".shp"))
+        if args.points:
+            run_inputs.append(args.points)
+        manifest.record_run(run_key("generate_state_maps", argv), argv, run_inputs, manifest.touched)
+    finally:
+        with TIMINGS.stage("manifest_save"):
+            manifest.save()
+    
+    print(f"\nGenerated {generated_count} state SVGs ({up_to_date_count} up to date)")
+    if metros_changed:
+        print(f"Metros data saved to {metros_json_path}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parse_args(argv)
     
-    metros_json_path = os.path.join(OUTPUT_DIR, "metros_data.json")
-    with open(metros_json_path, 'w') as f:
-        json.dump(STATE_METROS, f, indent=2)
+    if args.timings is not None:
+        TIMINGS.enable()
+    profiler = None
+    if args.profile:
+        if args.jobs != 1:
+            print("Note: --profile only covers the main process; pass -j 1 to profile rendering")
+        profiler = cProfile.Profile()
+        profiler.enable()
     
-    print(f"\nGenerated {generated_count} state SVGs")
-    print(f"Metros data saved to {metros_json_path}")
+    try:
+        build_maps(args, argv)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(os.path.dirname(args.profile) or '.', exist_ok=True)
+            profiler.dump_stats(args.profile)
+            print(f"\nProfile saved to {args.profile}; top functions by cumulative time:")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        if args.timings is not None:
+            TIMINGS.report(args.timings or None)
 
 
 if __name__ == "__main__":
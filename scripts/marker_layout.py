@@ -0,0 +1,289 @@
+"""
+Collision-free placement of map markers and their labels.
+
+Markers are circles in SVG viewport coordinates. Overlaps are found with a
+uniform grid (points sorted by cell, neighbouring cells matched with
+searchsorted), so every pass is O(n log n + k) for k touching pairs rather
+than O(n^2). Dense groups are merged into cluster markers by greedy leader
+clustering with a bounded radius, the remaining overlaps are nudged apart,
+and labels are placed greedily in rank order around their markers.
+"""
+
+import numpy as np
+
+# Markers within CLUSTER_DISTANCE of a more important marker (the leader)
+# join its group; groups of at least CLUSTER_MIN_SIZE markers are drawn as a
+# single cluster marker instead of being nudged apart. The distance bounds a
+# cluster's extent, so dense regions split into several clusters rather than
+# chaining into one.
+CLUSTER_DISTANCE = 24.0
+CLUSTER_MIN_SIZE = 6
+NUDGE_ITERATIONS = 50
+MARKER_GAP = 2.0
+
+LABEL_FONT_SIZE = 10
+# Average glyph advance of the UI sans-serif as a fraction of the font size.
+LABEL_CHAR_WIDTH = 0.6
+LABEL_PADDING = 2.0
+
+# Candidate label positions around a marker, in order of preference:
+# (dx, dy) direction and the SVG text-anchor that goes with it.
+LABEL_POSITIONS = (
+    (1, 0, "start"),
+    (-1, 0, "end"),
+    (0, -1, "middle"),
+    (0, 1, "middle"),
+    (1, -1, "start"),
+    (-1, -1, "end"),
+    (1, 1, "start"),
+    (-1, 1, "end"),
+)
+
+# Neighbour cells compared with each cell. Only half the neighbourhood is
+# needed because every pair of adjacent cells is visited from one side.
+HALF_NEIGHBOURHOOD = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def overlapping_pairs(xy, radii, gap=0.0):
+    """Return index arrays ``(i, j)``, ``i < j``, of circles closer than touching.
+
+    Two circles overlap when their centres are less than
+    ``radii[i] + radii[j] + gap`` apart.
+    """
+    xy = np.asarray(xy, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    count = len(xy)
+    empty = np.empty(0, dtype=np.intp)
+    if count < 2:
+        return empty, empty
+
+    cell_size = max(2 * radii.max() + gap, 1e-9)
+    cells = np.floor(xy / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    # Pad by one cell on each side so neighbour keys never wrap.
+    rows = cells[:, 1].max() + 3
+    keys = (cells[:, 0] + 1) * rows + cells[:, 1] + 1
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    first = []
+    second = []
+    for dx, dy in HALF_NEIGHBOURHOOD:
+        target = keys + dx * rows + dy
+        lo = np.searchsorted(sorted_keys, target, side='left')
+        hi = np.searchsorted(sorted_keys, target, side='right')
+        counts = hi - lo
+        total = counts.sum()
+        if not total:
+            continue
+        i = np.repeat(np.arange(count), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(lo, counts) + offsets]
+        if dx == 0 and dy == 0:
+            keep = i < j
+            i, j = i[keep], j[keep]
+        first.append(i)
+        second.append(j)
+
+    if not first:
+        return empty, empty
+    i = np.concatenate(first)
+    j = np.concatenate(second)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+
+    distance = np.hypot(*(xy[j] - xy[i]).T)
+    close = distance < radii[i] + radii[j] + gap
+    return i[close], j[close]
+
+
+def leader_clusters(xy, ranks, distance=CLUSTER_DISTANCE):
+    """Label each marker with the index of its cluster leader.
+
+    Markers are visited in rank order (lowest rank first, ties by index);
+    each one not yet taken becomes a leader and takes every free marker
+    closer than ``distance`` to it. No member is further than ``distance``
+    from its leader, however densely the markers are packed.
+    """
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    count = len(xy)
+    i, j = overlapping_pairs(xy, np.full(count, distance / 2))
+
+    # Neighbour lists in CSR form: neighbours[starts[k]:starts[k + 1]].
+    first = np.concatenate([i, j])
+    neighbours = np.concatenate([j, i])
+    order = np.argsort(first, kind='stable')
+    first, neighbours = first[order], neighbours[order]
+    starts = np.searchsorted(first, np.arange(count + 1))
+
+    labels = np.full(count, -1, dtype=np.intp)
+    for leader in np.lexsort((np.arange(count), np.asarray(ranks, dtype=float))).tolist():
+        if labels[leader] >= 0:
+            continue
+        labels[leader] = leader
+        candidates = neighbours[starts[leader]:starts[leader + 1]]
+        labels[candidates[labels[candidates] < 0]] = leader
+    return labels
+
+
+def nudge_markers(xy, radii, weights, bounds, gap=MARKER_GAP, iterations=NUDGE_ITERATIONS):
+    """Push overlapping markers apart, keeping them inside ``bounds``.
+
+    Each overlapping pair is separated along the line between its centres.
+    The marker with the larger weight takes the larger share of the move, so
+    low-weight (important) markers stay closest to their true position.
+    ``bounds`` is ``(min_x, min_y, max_x, max_y)``.
+    """
+    position = np.array(xy, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    min_x, min_y, max_x, max_y = bounds
+
+    for _ in range(iterations):
+        i, j = overlapping_pairs(position, radii, gap)
+        if not len(i):
+            break
+
+        delta = position[j] - position[i]
+        distance = np.hypot(*delta.T)
+        coincident = distance < 1e-9
+        if coincident.any():
+            # Spread exactly coincident markers around the golden angle so
+            # they do not all move along the same line.
+            angle = (i[coincident] + j[coincident]) * 2.399963229728653
+            delta[coincident] = np.column_stack([np.cos(angle), np.sin(angle)])
+            distance[coincident] = 1.0
+        direction = delta / distance[:, None]
+        overlap = radii[i] + radii[j] + gap - np.where(coincident, 0.0, distance)
+        share_i = weights[i] / (weights[i] + weights[j])
+
+        move = np.zeros_like(position)
+        np.add.at(move, i, -direction * (overlap * share_i)[:, None])
+        np.add.at(move, j, direction * (overlap * (1 - share_i))[:, None])
+        position += move
+
+        position[:, 0] = np.clip(position[:, 0], min_x + radii, max_x - radii)
+        position[:, 1] = np.clip(position[:, 1], min_y + radii, max_y - radii)
+
+    return position
+
+
+class BoxGrid:
+    """Uniform grid of axis-aligned boxes for overlap queries."""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = []
+
+    def _cells(self, box):
+        x0, y0, x1, y1 = (int(np.floor(v / self.cell_size)) for v in box)
+        return ((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1))
+
+    def collides(self, box):
+        x0, y0, x1, y1 = box
+        for cell in self._cells(box):
+            for index in self.cells.get(cell, ()):
+                bx0, by0, bx1, by1 = self.boxes[index]
+                if x0 < bx1 and bx0 < x1 and y0 < by1 and by0 < y1:
+                    return True
+        return False
+
+    def add(self, box):
+        index = len(self.boxes)
+        self.boxes.append(box)
+        for cell in self._cells(box):
+            self.cells.setdefault(cell, []).append(index)
+
+
+def label_size(text, font_size=LABEL_FONT_SIZE):
+    return len(text) * font_size * LABEL_CHAR_WIDTH, font_size
+
+
+def place_labels(xy, radii, texts, order, bounds, font_size=LABEL_FONT_SIZE):
+    """Greedily place one label per marker without overlapping markers or labels.
+
+    Markers are visited in ``order``; each takes the first free position in
+    LABEL_POSITIONS. Returns a list with ``(x, y, text_anchor)`` for each
+    marker, or None where no position was free.
+    """
+    min_x, min_y, max_x, max_y = bounds
+    grid = BoxGrid(cell_size=font_size * 2)
+    for (x, y), r in zip(np.asarray(xy, dtype=float).tolist(), np.asarray(radii, dtype=float).tolist()):
+        grid.add((x - r, y - r, x + r, y + r))
+
+    placements = [None] * len(texts)
+    for index in order:
+        x, y = (float(v) for v in xy[index])
+        reach = float(radii[index]) + LABEL_PADDING
+        width, height = label_size(texts[index], font_size)
+        for dx, dy, anchor in LABEL_POSITIONS:
+            # (left, top) of the label box for this candidate position.
+            left = x + dx * reach - {"start": 0.0, "middle": width / 2, "end": width}[anchor]
+            top = y + dy * reach - height / 2 + dy * height / 2
+            box = (left, top, left + width, top + height)
+            if box[0] < min_x or box[1] < min_y or box[2] > max_x or box[3] > max_y:
+                continue
+            if grid.collides(box):
+                continue
+            grid.add(box)
+            # SVG text is positioned by its baseline; approximate it as 80%
+            # of the way down the box.
+            placements[index] = (x + dx * reach, top + height * 0.8, anchor)
+            break
+    return placements
+
+
+def layout_markers(xy, radii, ranks, bounds, cluster_min_size=CLUSTER_MIN_SIZE, cluster_distance=CLUSTER_DISTANCE):
+    """Resolve marker overlaps.
+
+    Returns ``(groups, positions)``: ``groups`` lists the marker indices drawn
+    as one symbol (a single index for a plain marker, several for a
+    cluster, most important first), and ``positions`` holds the (x, y) each
+    group is drawn at. Clusters sit at the centroid of their members; then
+    every group is nudged apart from the others.
+    """
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    radii = np.asarray(radii, dtype=float)
+    ranks = np.asarray(ranks, dtype=float)
+    count = len(xy)
+
+    labels = leader_clusters(xy, ranks, cluster_distance)
+    _, inverse, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    clustered = sizes[inverse] >= cluster_min_size
+
+    groups = []
+    anchors = []
+    group_radii = []
+    group_ranks = []
+    members_by_label = {}
+    for index in range(count):
+        if clustered[index]:
+            members_by_label.setdefault(labels[index], []).append(index)
+        else:
+            groups.append([index])
+    for members in members_by_label.values():
+        members.sort(key=lambda index: (ranks[index], index))
+        groups.append(members)
+    groups.sort(key=lambda members: members[0])
+
+    for members in groups:
+        lead = members[0]
+        anchors.append(xy[members].mean(axis=0))
+        group_radii.append(cluster_radius(radii[lead], len(members)))
+        group_ranks.append(ranks[lead])
+
+    positions = nudge_markers(
+        np.array(anchors).reshape(-1, 2),
+        np.array(group_radii),
+        np.array(group_ranks),
+        bounds,
+    )
+    return groups, positions
+
+
+def cluster_radius(radius, size):
+    """Radius of a marker standing in for ``size`` markers."""
+    if size == 1:
+        return radius
+    return radius + 2 * np.log2(size)
@@ -0,0 +1,92 @@
+"""
+Map projections for the state renders.
+
+The Census layers are NAD83 longitude/latitude; drawing those degrees with
+one scale on both axes stretches northern states east-west. A projection
+maps each state into metres first, either with a shared equal-area Albers
+CRS or with a Lambert conformal conic fitted to the state. pyproj
+Transformers are cached per CRS pair, so all states that share a CRS, and
+every batch of points, reuse one transformer.
+
+pyproj and shapely are imported on first use, so reading PROJECTIONS (for
+the command line) does not load them.
+"""
+
+import functools
+
+import numpy as np
+
+# CRS of the Census cartographic boundary shapefiles.
+SOURCE_CRS = "EPSG:4269"
+
+PROJECTIONS = ("albers", "conformal")
+
+# Equal-area CRS by state FIPS code; the CONUS Albers covers everything else.
+ALBERS_CRS = {
+    "02": "EPSG:3338",  # NAD83 / Alaska Albers
+    "15": "ESRI:102007",  # Hawaii Albers Equal Area Conic
+}
+CONUS_ALBERS_CRS = "EPSG:5070"
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(source_crs, target_crs):
+    """Transformer between two CRS definitions, built once per pair and process."""
+    from pyproj import Transformer
+
+    return Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+
+def conformal_crs(geometry):
+    """Lambert conformal conic fitted to ``geometry`` (NAD83 lon/lat).
+
+    Standard parallels sit at 1/6 and 5/6 of the latitude span, which keeps
+    scale error small across the state. Parameters are rounded so repeated
+    calls for a state produce the same definition (and cached transformer).
+    """
+    import shapely
+
+    coords = shapely.get_coordinates(geometry)
+    lng = coords[:, 0]
+    if lng.max() - lng.min() > 180:
+        # Crosses the antimeridian (Alaska's Aleutians): measure the
+        # longitude range continuously.
+        lng = np.where(lng > 0, lng - 360, lng)
+    min_lat, max_lat = coords[:, 1].min(), coords[:, 1].max()
+    span = max_lat - min_lat
+    lon_0 = (lng.min() + lng.max()) / 2
+    if lon_0 < -180:
+        lon_0 += 360
+    return (
+        f"+proj=lcc +lat_1={min_lat + span / 6:.2f} +lat_2={max_lat - span / 6:.2f} "
+        f"+lat_0={(min_lat + max_lat) / 2:.2f} +lon_0={lon_0:.2f} +datum=NAD83 +units=m +no_defs"
+    )
+
+
+def state_crs(projection, fips, geometry):
+    """Target CRS for one state under ``projection`` ("albers" or "conformal")."""
+    if projection == "albers":
+        return ALBERS_CRS.get(fips, CONUS_ALBERS_CRS)
+    if projection == "conformal":
+        return conformal_crs(geometry)
+    raise ValueError(f"Unknown projection: {projection!r} (expected one of {', '.join(PROJECTIONS)})")
+
+
+def state_transformer(projection, fips, geometry):
+    return get_transformer(SOURCE_CRS, state_crs(projection, fips, geometry))
+
+
+def project_points(coords, transformer):
+    """Project an (N, 2) array of lon/lat pairs in one call."""
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if not len(coords):
+        return coords
+    x, y = transformer.transform(coords[:, 0], coords[:, 1])
+    return np.column_stack([x, y])
+
+
+def project_geometry(geometry, transformer):
+    """Project every vertex of a shapely geometry (or array of them) at once."""
+    import shapely
+
+    return shapely.transform(geometry, lambda coords: project_points(coords, transformer))
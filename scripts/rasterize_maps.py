@@ -0,0 +1,118 @@
+"""
+Bitmap (PNG / WebP) renders of the state maps.
+
+Low-end devices can show a small bitmap instead of parsing a large SVG
+path. Maps are drawn with matplotlib's Agg backend from the same scene
+(outline, markers, leader lines and labels, in viewport space) that
+generate_state_svg writes, with one viewport unit drawn as ``scale``
+device pixels, so shapes sit at the SVG's positions and sizes. Pixels
+will not match a browser's render exactly: antialiasing differs, and text
+is set in matplotlib's default sans-serif rather than the page's font.
+"""
+
+import io
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PatchCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle, PathPatch
+from matplotlib.path import Path
+from PIL import Image
+
+from marker_layout import LABEL_FONT_SIZE
+
+# The site's --primary colour (hsl(45 90% 50%)); SVGs use currentColor but a
+# bitmap needs a concrete one.
+RASTER_COLOR = "#f2b90d"
+RASTER_SCALES = (1, 2, 3)
+RASTER_FORMATS = ("png", "webp")
+
+# One viewport unit is one point, so stroke widths match the SVG's and each
+# unit becomes ``scale`` device pixels.
+POINTS_PER_INCH = 72
+
+# SVG text-anchor to matplotlib horizontal alignment.
+TEXT_ANCHORS = {"start": "left", "middle": "center", "end": "right"}
+
+
+def rings_to_path(rings):
+    """Join closed rings into one matplotlib Path of subpaths."""
+    vertices = np.concatenate(rings)
+    codes = np.full(len(vertices), Path.LINETO, dtype=Path.code_type)
+    starts = np.cumsum([0] + [len(ring) for ring in rings[:-1]])
+    ends = starts + [len(ring) - 1 for ring in rings]
+    codes[starts] = Path.MOVETO
+    codes[ends] = Path.CLOSEPOLY
+    return Path(vertices, codes)
+
+
+def render_raster(rings, dots, width, height, scale, color=RASTER_COLOR, leaders=(), counts=(), labels=()):
+    """Draw the state outline and metro markers; returns an RGBA PIL image.
+
+    ``rings`` are (N, 2) arrays, ``dots`` ``(x, y, radius)`` tuples,
+    ``leaders`` ``((x1, y1), (x2, y2))`` segments, ``counts`` ``(x, y, text)``
+    cluster counts and ``labels`` ``(x, y, text, text_anchor)``, all in
+    viewport coordinates (y down, as in the SVG).
+    """
+    figure = Figure(figsize=(width / POINTS_PER_INCH, height / POINTS_PER_INCH), dpi=POINTS_PER_INCH * scale)
+    canvas = FigureCanvasAgg(figure)
+    figure.patch.set_alpha(0)
+
+    axes = figure.add_axes((0, 0, 1, 1))
+    axes.set_xlim(0, width)
+    axes.set_ylim(height, 0)
+    axes.set_axis_off()
+
+    if rings:
+        axes.add_patch(PathPatch(
+            rings_to_path(rings), fill=False, edgecolor=color, linewidth=2, alpha=0.8, joinstyle='round',
+        ))
+    if leaders:
+        axes.add_collection(LineCollection(leaders, colors=color, linewidths=1, alpha=0.5))
+    if dots:
+        axes.add_collection(PatchCollection(
+            [Circle((x, y), radius + 4) for x, y, radius in dots],
+            facecolor=color, edgecolor='none', alpha=0.2,
+        ))
+        axes.add_collection(PatchCollection(
+            [Circle((x, y), radius) for x, y, radius in dots],
+            facecolor=color, edgecolor='none', alpha=0.9,
+        ))
+    for x, y, text in counts:
+        axes.text(x, y, text, fontsize=LABEL_FONT_SIZE, color='white', ha='center', va='center')
+    for x, y, text, anchor in labels:
+        axes.text(x, y, text, fontsize=LABEL_FONT_SIZE, color=color, ha=TEXT_ANCHORS[anchor], va='baseline')
+
+    canvas.draw()
+    size = canvas.get_width_height()
+    return Image.frombuffer("RGBA", size, bytes(canvas.buffer_rgba()), "raw", "RGBA", 0, 1)
+
+
+def encode_image(image, image_format):
+    """Encode an image as PNG or lossless WebP bytes."""
+    buffer = io.BytesIO()
+    if image_format == "png":
+        image.save(buffer, format="PNG", optimize=True)
+    elif image_format == "webp":
+        # For lossless WebP, quality is compression effort: method 6 at full
+        # effort is ~60x slower than this for ~5% smaller files.
+        image.save(buffer, format="WEBP", lossless=True, quality=50, method=4)
+    else:
+        raise ValueError(f"Unsupported raster format: {image_format}")
+    return buffer.getvalue()
+
+
+def rasterize(rings, dots, width, height, targets, color=RASTER_COLOR, leaders=(), counts=(), labels=()):
+    """Encode the map for each ``(scale, format)`` in ``targets``.
+
+    Each scale is drawn once however many formats it is encoded in.
+    Returns ``{(scale, format): bytes}``.
+    """
+    encoded = {}
+    images = {}
+    for scale, image_format in targets:
+        if scale not in images:
+            images[scale] = render_raster(rings, dots, width, height, scale, color, leaders, counts, labels)
+        encoded[(scale, image_format)] = encode_image(images[scale], image_format)
+    return encoded
@@ -0,0 +1,135 @@
+"""
+Opt-in stage timing for the map generators.
+
+Code wraps its stages in ``TIMINGS.stage(name)`` (optionally per state).
+While timing is disabled, which is the default, a stage costs one attribute
+check. When enabled, each stage records wall and CPU time, and, with memory
+tracing, the tracemalloc peak reached inside it.
+
+tracemalloc keeps a single process-wide peak, which each stage resets on
+entry. Before resetting, the peak so far is folded into every stage still
+open and into a run-wide maximum, so nested stages do not hide their
+parents' (or the run's) peaks.
+"""
+
+import contextlib
+import functools
+import json
+import time
+import tracemalloc
+
+
+class StageTimings:
+    """Wall/CPU time and peak memory per stage, overall and per state."""
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.stages = {}
+        self.states = {}
+        self._started = None
+        # Peaks of the open stages, innermost last, and of the whole run.
+        self._open_peaks = []
+        self._run_peak = 0
+
+    def enable(self, trace_memory=True):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._started = (time.perf_counter(), time.process_time())
+
+    @contextlib.contextmanager
+    def stage(self, name, state=None):
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            self._fold_peak()
+            tracemalloc.reset_peak()
+            self._open_peaks.append(0)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            peak = None
+            if self.trace_memory:
+                self._fold_peak()
+                peak = self._open_peaks.pop()
+            self.record(name, time.perf_counter() - wall_start, time.process_time() - cpu_start, state, peak)
+
+    def _fold_peak(self):
+        """Fold the tracemalloc peak since the last reset into the open stages and the run."""
+        peak = tracemalloc.get_traced_memory()[1]
+        self._open_peaks = [max(open_peak, peak) for open_peak in self._open_peaks]
+        self._run_peak = max(self._run_peak, peak)
+
+    def record(self, name, wall, cpu, state=None, peak_bytes=None):
+        totals = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_bytes": None})
+        totals["calls"] += 1
+        totals["wall"] += wall
+        totals["cpu"] += cpu
+        if peak_bytes is not None:
+            totals["peak_bytes"] = max(totals["peak_bytes"] or 0, peak_bytes)
+        if state is not None:
+            per_state = self.states.setdefault(state, {})
+            entry = per_state.setdefault(name, {"wall": 0.0, "cpu": 0.0})
+            entry["wall"] += wall
+            entry["cpu"] += cpu
+
+    def as_dict(self):
+        total = None
+        if self._started is not None:
+            wall_start, cpu_start = self._started
+            total = {"wall": time.perf_counter() - wall_start, "cpu": time.process_time() - cpu_start}
+            if self.trace_memory:
+                self._fold_peak()
+                total["peak_bytes"] = self._run_peak
+        return {"total": total, "stages": self.stages, "states": self.states}
+
+    def report(self, json_path=None):
+        """Print the stage and per-state tables; also write JSON to ``json_path``."""
+        data = self.as_dict()
+        print("\nStage                     calls    wall ms     cpu ms   peak MB")
+        for name, totals in self.stages.items():
+            peak = f"{totals['peak_bytes'] / 1e6:9.1f}" if totals["peak_bytes"] is not None else f"{'-':>9}"
+            print(f"{name:<24} {totals['calls']:>6} {totals['wall'] * 1000:>10.1f} {totals['cpu'] * 1000:>10.1f} {peak}")
+        if data["total"] is not None:
+            print(f"{'total':<24} {'':>6} {data['total']['wall'] * 1000:>10.1f} {data['total']['cpu'] * 1000:>10.1f}")
+
+        if self.states:
+            stage_names = sorted({name for per_state in self.states.values() for name in per_state})
+            print("\nState                   " + "".join(f"{name + ' ms':>14}" for name in stage_names))
+            slowest = sorted(self.states.items(), key=lambda item: -sum(entry["wall"] for entry in item[1].values()))
+            for state, per_state in slowest:
+                cells = "".join(
+                    f"{per_state[name]['wall'] * 1000:>14.2f}" if name in per_state else f"{'-':>14}"
+                    for name in stage_names
+                )
+                print(f"{state:<24}{cells}")
+
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            print(f"\nTimings saved to {json_path}")
+
+
+TIMINGS = StageTimings()
+
+
+def run_timed(function, task):
+    """Call ``function(task)`` and return ``(result, wall, cpu)``.
+
+    Used to time work done in worker processes, whose own TIMINGS are not
+    visible to the parent.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = function(task)
+    return result, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+def timed_call(function):
+    """Bind ``run_timed`` to ``function`` as a picklable one-argument callable."""
+    return functools.partial(run_timed, function)
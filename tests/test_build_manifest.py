@@ -0,0 +1,94 @@
+"""
+Tests for scripts/build_manifest.py.
+"""
+
+import os
+
+import pytest
+
+from build_manifest import BuildManifest, hash_inputs, run_key
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return BuildManifest(str(tmp_path / "manifest.json"))
+
+
+def test_hash_inputs_is_key_order_independent():
+    assert hash_inputs({"a": 1, "b": [2, 3]}) == hash_inputs({"b": [2, 3], "a": 1})
+    assert hash_inputs({"a": 1}) != hash_inputs({"a": 2})
+
+
+def test_is_current(manifest, tmp_path):
+    output = str(tmp_path / "out" / "ohio.svg")
+    assert not manifest.is_current(output, "inputs-1")
+
+    assert manifest.write(output, "inputs-1", "<svg/>")
+    assert manifest.is_current(output, "inputs-1")
+    assert not manifest.is_current(output, "inputs-2")
+
+    # An output edited or deleted behind the manifest's back is stale.
+    with open(output, "w") as f:
+        f.write("<svg></svg>")
+    assert not manifest.is_current(output, "inputs-1")
+    os.remove(output)
+    assert not manifest.is_current(output, "inputs-1")
+
+
+def test_write_skips_identical_content(manifest, tmp_path):
+    output = str(tmp_path / "ohio.svg")
+    assert manifest.write(output, "inputs-1", "<svg/>")
+    mtime_ns = os.stat(output).st_mtime_ns
+    assert not manifest.write(output, "inputs-2", "<svg/>")
+    assert os.stat(output).st_mtime_ns == mtime_ns
+    assert manifest.is_current(output, "inputs-2")
+
+
+def test_writer_commits_atomically(manifest, tmp_path):
+    output = str(tmp_path / "states.ts")
+    with manifest.writer(output, "inputs-1") as out:
+        out.write("export const a = 1;\n")
+        # Nothing is visible at the final path until the block finishes.
+        assert not os.path.exists(output)
+    assert out.changed
+    assert oct(os.stat(output).st_mode & 0o777) == "0o644"
+    assert manifest.is_current(output, "inputs-1")
+
+    with manifest.writer(output, "inputs-1") as out:
+        out.write("export const a = 1;\n")
+    assert not out.changed
+
+    with pytest.raises(RuntimeError):
+        with manifest.writer(output, "inputs-2") as out:
+            out.write("export const a = 2;\n")
+            raise RuntimeError("generator failed")
+    with open(output) as f:
+        assert f.read() == "export const a = 1;\n"
+    assert sorted(os.listdir(tmp_path)) == ["states.ts"]
+    assert manifest.is_current(output, "inputs-1")
+
+
+def test_run_is_current(manifest, tmp_path):
+    source = tmp_path / "source.json"
+    source.write_text("{}")
+    output = str(tmp_path / "ohio.svg")
+    manifest.write(output, "inputs-1", "<svg/>")
+    key = run_key("generate_state_maps", ["--declutter"])
+    assert not manifest.run_is_current(key)
+
+    manifest.record_run(key, ["--declutter"], [str(source)], [output])
+    manifest.save()
+    reloaded = BuildManifest(manifest.path)
+    assert reloaded.run_is_current(key)
+    assert not reloaded.run_is_current(run_key("generate_state_maps", []))
+
+    # Rewriting an input with the same bytes keeps the run current;
+    # changing it, or removing an output, does not.
+    source.write_text("{}")
+    os.utime(source, ns=(0, 0))
+    assert reloaded.run_is_current(key)
+    source.write_text('{"a": 1}')
+    assert not reloaded.run_is_current(key)
+    source.write_text("{}")
+    os.remove(output)
+    assert not reloaded.run_is_current(key)
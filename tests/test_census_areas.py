@@ -0,0 +1,41 @@
+"""
+Tests for scripts/census_areas.py.
+"""
+
+import geopandas as gpd
+import shapely
+
+from census_areas import AreaIndex
+
+
+def area_index(boxes):
+    return AreaIndex(gpd.GeoDataFrame(
+        {"GEOID": [geoid for geoid, _ in boxes], "NAME": [f"Area {geoid}" for geoid, _ in boxes]},
+        geometry=[box for _, box in boxes],
+        crs="EPSG:4269",
+    ))
+
+
+def test_locate_points_in_areas():
+    index = area_index([("a", shapely.box(0, 0, 1, 1)), ("b", shapely.box(2, 0, 3, 1))])
+    assert index.locate([0.5, 2.5, 0.25], [0.5, 0.5, 0.75]).tolist() == [0, 1, 0]
+
+
+def test_locate_point_outside_every_area():
+    index = area_index([("a", shapely.box(0, 0, 1, 1))])
+    rows = index.locate([5.0, 0.5], [5.0, 0.5])
+    assert rows.tolist() == [-1, 0]
+    assert index.records(rows, {"geoid": "GEOID"}) == [None, {"geoid": "a"}]
+
+
+def test_locate_overlaps_go_to_the_lowest_row():
+    index = area_index([
+        ("wide", shapely.box(0, 0, 4, 4)),
+        ("left", shapely.box(0, 0, 2, 4)),
+        ("right", shapely.box(2, 0, 4, 4)),
+    ])
+    # Inside both halves, and on the border they share.
+    assert index.locate([1.0, 2.0, 3.0], [1.0, 2.0, 3.0]).tolist() == [0, 0, 0]
+
+    halves = area_index([("left", shapely.box(0, 0, 2, 4)), ("right", shapely.box(2, 0, 4, 4))])
+    assert halves.locate([2.0, 3.0], [2.0, 2.0]).tolist() == [0, 1]
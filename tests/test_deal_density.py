@@ -0,0 +1,34 @@
+"""
+Tests for scripts/deal_density.py.
+"""
+
+import numpy as np
+
+from deal_density import DensityGrid, read_point_chunks
+
+
+def test_hex_cell_centers_map_to_their_own_index():
+    grid = DensityGrid(1, 400, 300, cells="hex", cell_size=10)
+    indexes = np.arange(grid.rows * grid.columns)
+    x, y = grid.cell_center(indexes)
+    assert (grid.cell_index(x, y) == indexes).all()
+
+
+def test_grid_cells_cover_the_viewport():
+    grid = DensityGrid(2, 400, 300, cells="grid", cell_size=30)
+    assert (grid.rows, grid.columns) == (10, 14)
+    grid.add([0, 1, 1], np.array([5.0, 395.0, 399.0]), np.array([5.0, 295.0, 299.0]), np.array([1.0, 2.0, 3.0]))
+    assert grid.counts[0, 0] == 1
+    assert grid.counts[1, 9 * 14 + 13] == 2 and grid.totals[1, 9 * 14 + 13] == 5.0
+
+
+def test_read_point_chunks_csv(tmp_path):
+    path = tmp_path / "deals.csv"
+    path.write_text("lng,lat,amount,name\n-82.9,40.0,250000,a\n-84.5,39.1,x,b\n-81.7,41.5,100000,c\n")
+    chunks = list(read_point_chunks(str(path), weight_column="amount", chunk_rows=2))
+    assert [len(lng) for lng, lat, weight in chunks] == [2, 1]
+    lng, lat, weight = (np.concatenate(values) for values in zip(*chunks))
+    assert lng.tolist() == [-82.9, -84.5, -81.7]
+    assert lat.tolist() == [40.0, 39.1, 41.5]
+    # Values that are not numbers come back as NaN.
+    assert weight[0] == 250000 and np.isnan(weight[1]) and weight[2] == 100000
@@ -0,0 +1,140 @@
+"""
+Tests for scripts/generate_state_boundaries.py.
+"""
+
+import io
+import json
+
+import numpy as np
+import pytest
+
+from generate_state_boundaries import (
+    DEFAULT_TOLERANCE_PX,
+    DEFAULT_ZOOM,
+    JSONStream,
+    build_vertex_index,
+    douglas_peucker,
+    encode_polyline,
+    iter_features,
+    simplify_ring,
+)
+
+
+def test_douglas_peucker_drops_points_within_tolerance():
+    points = np.array([[0.0, 0.0], [5.0, 0.5], [10.0, -0.5], [15.0, 0.2], [20.0, 0.0]])
+    assert douglas_peucker(points, 1.0).tolist() == [True, False, False, False, True]
+
+
+def test_douglas_peucker_keeps_spike_past_an_endpoint():
+    # The middle point lies on the line through the endpoints but 20 units
+    # beyond the segment between them.
+    points = np.array([[0.0, 0.0], [-20.0, 0.0], [10.0, 0.0]])
+    assert douglas_peucker(points, 1.0).tolist() == [True, True, True]
+
+
+def test_douglas_peucker_closed_chord():
+    points = np.array([[0.0, 0.0], [3.0, 4.0], [0.5, 0.0], [0.0, 0.0]])
+    assert douglas_peucker(points, 1.0).tolist() == [True, True, False, True]
+
+
+def wiggly_border(count=200):
+    """A north-south border near 0 degrees with sub-pixel and larger wiggles."""
+    lat = np.linspace(30.0, 32.0, count)
+    lng = 0.2 * np.sin(lat * 20) + 0.001 * np.cos(lat * 900)
+    return np.column_stack([lng, lat])
+
+
+def closed(ring):
+    return np.vstack([ring, ring[:1]])
+
+
+def test_shared_border_simplifies_identically():
+    border = wiggly_border()
+    # West state: down the border, then round its own coast; east state
+    # walks the border the other way.
+    west = closed(np.vstack([border[::-1], [[-1.0, 30.0], [-1.5, 31.0], [-1.0, 32.0]]]))
+    east = closed(np.vstack([border, [[1.0, 32.0], [1.2, 31.0], [1.0, 30.0]]]))
+    states = [("West", [west]), ("East", [east])]
+    vertex_index = build_vertex_index(states)
+
+    border_keys = {tuple(point) for point in border.tolist()}
+    kept = []
+    for _, (ring,) in states:
+        simplified = simplify_ring(ring, vertex_index, DEFAULT_TOLERANCE_PX, DEFAULT_ZOOM)
+        assert len(simplified) < len(ring)
+        kept.append({tuple(point) for point in simplified.tolist()} & border_keys)
+
+    assert kept[0] == kept[1]
+    assert 2 < len(kept[0]) < len(border_keys)
+    # The border's ends, where the sharing changes, are always kept.
+    assert {tuple(border[0]), tuple(border[-1])} <= kept[0]
+
+
+def test_vertex_index_signatures():
+    a = closed(np.array([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]]))
+    b = closed(np.array([[1.0, 0.0], [2.0, 0.0], [2.0, 1.0], [1.0, 1.0]]))
+    keys, signatures = build_vertex_index([("A", [a]), ("B", [b])])
+    assert len(keys) == 6
+    by_vertex = dict(zip(zip(keys.real.tolist(), keys.imag.tolist()), signatures.tolist()))
+    # Vertices on the shared edge carry one signature, each state's own
+    # vertices another.
+    assert by_vertex[(1.0, 0.0)] == by_vertex[(1.0, 1.0)]
+    assert by_vertex[(0.0, 0.0)] == by_vertex[(0.0, 1.0)] != by_vertex[(1.0, 0.0)]
+    assert by_vertex[(2.0, 0.0)] == by_vertex[(2.0, 1.0)] != by_vertex[(0.0, 0.0)]
+
+
+def decode_polyline(encoded, precision):
+    """Reference decoder: the lng/lat ring an encoded polyline describes."""
+    values = []
+    value = shift = 0
+    for char in encoded:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    lat_lng = np.cumsum(np.array(values).reshape(-1, 2), axis=0) / 10 ** precision
+    return lat_lng[:, ::-1]
+
+
+def test_encode_polyline_reference():
+    # The example from the Encoded Polyline Algorithm Format documentation.
+    ring = np.array([[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]])
+    assert encode_polyline(ring, 5) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+@pytest.mark.parametrize("precision", [3, 5, 6])
+def test_encode_polyline_round_trip(precision):
+    rng = np.random.default_rng(precision)
+    ring = np.column_stack([rng.uniform(-180, 180, 200), rng.uniform(-90, 90, 200)])
+    ring = np.vstack([ring, ring[:1]])
+    decoded = decode_polyline(encode_polyline(ring, precision), precision)
+    np.testing.assert_allclose(decoded, np.round(ring, precision), atol=10 ** -precision / 2)
+
+
+VALUES = [12345, "split \"string\" é", {"type": "Feature", "coordinates": [[-84.82, 39.1], [1.5e10, -0.0]]}, [], True, 7]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 64])
+def test_json_stream_chunk_boundaries(chunk_size):
+    text = "  \n".join(json.dumps(value) for value in VALUES)
+    stream = JSONStream(io.StringIO(text), chunk_size=chunk_size)
+    assert [stream.value() for _ in VALUES] == VALUES
+    assert stream.peek() == ""
+
+
+def test_json_stream_truncated_value():
+    stream = JSONStream(io.StringIO('{"features": [1, 2'), chunk_size=4)
+    with pytest.raises(json.JSONDecodeError):
+        stream.value()
+
+
+def test_iter_features(tmp_path):
+    features = [{"type": "Feature", "properties": {"name": name}, "geometry": None} for name in ("Ohio", "Utah")]
+    path = tmp_path / "states.json"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features, "bbox": [0, 0, 1, 1]}))
+    assert list(iter_features(path)) == features
+
+    path.write_text('{"type": "FeatureCollection", "features": []}')
+    assert list(iter_features(path)) == []
@@ -0,0 +1,213 @@
+"""
+Tests for scripts/generate_state_maps.py.
+"""
+
+import json
+import os
+from xml.etree import ElementTree
+
+import geopandas as gpd
+import pytest
+import shapely
+
+import generate_state_maps
+from build_manifest import BuildManifest
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "state_maps"
+    directory.mkdir()
+    monkeypatch.setattr(generate_state_maps, "OUTPUT_DIR", str(directory))
+    monkeypatch.setattr(generate_state_maps, "FINGERPRINT_MANIFEST_PATH", str(directory / "manifest.json"))
+    return directory
+
+
+def test_fingerprinting_prunes_stale_copies_and_siblings(output_dir, tmp_path):
+    manifest = BuildManifest(str(tmp_path / "build_manifest.json"))
+    source = str(output_dir / "ohio.svg")
+
+    manifest.write(source, "inputs-1", "<svg>1</svg>")
+    old = generate_state_maps.write_fingerprinted_assets(manifest, {"ohio": "ohio.svg"})["states"]["ohio"]
+    for suffix in (".br", ".gz"):
+        # As written by compress_assets.py, with or without a manifest entry.
+        (output_dir / (old + suffix)).write_bytes(b"compressed")
+    manifest.write(str(output_dir / (old + ".br")), "inputs-1", b"compressed")
+
+    manifest.write(source, "inputs-2", "<svg>2</svg>")
+    new = generate_state_maps.write_fingerprinted_assets(manifest, {"ohio": "ohio.svg"})["states"]["ohio"]
+    (output_dir / (new + ".gz")).write_bytes(b"compressed")
+    generate_state_maps.write_fingerprinted_assets(manifest, {"ohio": "ohio.svg"})
+
+    assert new != old
+    assert sorted(os.listdir(output_dir)) == sorted(["manifest.json", "ohio.svg", new, new + ".gz"])
+    assert not any(path.startswith(str(output_dir / old)) for path in manifest.outputs)
+    assert manifest.is_current(str(output_dir / new), manifest.content_hash(source))
+
+
+def test_jobs_must_not_be_negative(capsys):
+    assert generate_state_maps.parse_args(["-j", "0"]).jobs == 0
+    assert generate_state_maps.parse_args(["--jobs", "4"]).jobs == 4
+    for value in ("-2", "two"):
+        with pytest.raises(SystemExit) as exc:
+            generate_state_maps.parse_args(["--jobs", value])
+        assert exc.value.code == 2
+        assert "--jobs" in capsys.readouterr().err
+
+
+def test_svg_path_includes_holes():
+    polygon = shapely.Polygon([(0, 0), (10, 0), (10, 10), (0, 10)], holes=[[(4, 4), (6, 4), (6, 6), (4, 6)]])
+    path = generate_state_maps.geometry_to_svg_path(polygon, 0, 0, 2, 2, 20)
+    assert path == (
+        "M 0.00 20.00 L 20.00 20.00 L 20.00 0.00 L 0.00 0.00 L 0.00 20.00 Z "
+        "M 8.00 12.00 L 12.00 12.00 L 12.00 8.00 L 8.00 8.00 L 8.00 12.00 Z"
+    )
+
+    # The outline is stroked, not filled, so the hole shows whichever way
+    # its ring winds.
+    svg = generate_state_maps.generate_state_svg(polygon, "ohio", [])
+    boundary = next(line for line in svg.splitlines() if 'class="state-boundary"' in line)
+    assert boundary.count("M ") == 2
+    assert 'fill="none"' in boundary
+
+
+def test_missing_points_file_exits(tmp_path):
+    args = generate_state_maps.parse_args(["--points", str(tmp_path / "deals.csv")])
+    with pytest.raises(SystemExit, match="Points file not found"):
+        generate_state_maps.build_maps(args, [])
+
+
+# Two rectangular states in NAD83 lon/lat.
+STATE_BOXES = {"39": shapely.box(-84.8, 38.4, -80.5, 42.0), "49": shapely.box(-114.0, 37.0, -109.0, 42.0)}
+
+
+def metro(name, lng, lat):
+    return {"name": name, "lat": lat, "lng": lng, "rank": 1}
+
+
+def test_metros_just_outside_their_state_only_warn(monkeypatch, capsys):
+    monkeypatch.setattr(generate_state_maps, "STATE_METROS", {
+        "ohio": [metro("Columbus", -83.0, 40.0), metro("Toledo", -84.81, 41.6)],
+        "utah": [metro("Provo", -111.7, 40.2)],
+        # Not a state this script draws, so not validated.
+        "atlantis": [metro("Poseidonia", 0.0, 0.0)],
+    })
+    assert generate_state_maps.validate_metros(STATE_BOXES, "EPSG:4269", tolerance_km=5) == 0
+    out = capsys.readouterr().out
+    assert "Warning: Toledo (ohio) is in no state" in out
+    assert "Validated 3 metros: 1 outside their state (0 beyond 5 km)" in out
+
+
+def test_metros_beyond_tolerance_or_without_a_state_are_errors(monkeypatch, capsys):
+    monkeypatch.setattr(generate_state_maps, "STATE_METROS", {
+        # In Utah, hundreds of kilometres from Ohio.
+        "ohio": [metro("Columbus", -83.0, 40.0), metro("Salt Lake City", -111.9, 40.76)],
+        # Texas has no geometry at all.
+        "texas": [metro("Austin", -97.74, 30.27)],
+    })
+    assert generate_state_maps.validate_metros(STATE_BOXES, "EPSG:4269", tolerance_km=5) == 2
+    out = capsys.readouterr().out
+    assert "Error: Salt Lake City (ohio) is in Utah" in out
+    assert "Error: Austin (texas) is in no state" in out
+
+
+def test_build_exits_when_validation_fails(monkeypatch, output_dir, tmp_path):
+    monkeypatch.setattr(generate_state_maps, "STATE_METROS", {"ohio": [metro("Salt Lake City", -111.9, 40.76)]})
+    monkeypatch.setattr(generate_state_maps, "download_states_shapefile", lambda: "states.shp")
+    monkeypatch.setattr(generate_state_maps, "shapefile_hash", lambda path: "source")
+    monkeypatch.setattr(generate_state_maps, "load_state_geometries", lambda path, fips_codes: dict(STATE_BOXES))
+    monkeypatch.setattr(generate_state_maps, "read_geometry_index", lambda source_hash: {"crs": "EPSG:4269"})
+    monkeypatch.setattr(generate_state_maps, "BuildManifest", lambda: BuildManifest(str(tmp_path / "build.json")))
+    with pytest.raises(SystemExit, match="1 metros fall outside their state") as exc:
+        generate_state_maps.build_maps(generate_state_maps.parse_args([]), [])
+    assert exc.value.code != 0
+    assert os.listdir(output_dir) == []
+
+
+def test_assign_metro_areas(monkeypatch):
+    from census_areas import AreaIndex
+
+    monkeypatch.setattr(generate_state_maps, "STATE_METROS", {
+        "ohio": [metro("Columbus", -83.0, 40.0), metro("Lake Erie", -82.0, 42.5)],
+        "utah": [],
+    })
+    counties = AreaIndex(gpd.GeoDataFrame(
+        {"GEOID": ["39049"], "NAME": ["Franklin"]}, geometry=[shapely.box(-83.5, 39.5, -82.5, 40.5)], crs="EPSG:4269",
+    ))
+    assert generate_state_maps.assign_metro_areas({"county": counties}) == {
+        "ohio": [
+            {"name": "Columbus", "county": {"geoid": "39049", "name": "Franklin"}},
+            {"name": "Lake Erie", "county": None},
+        ],
+        "utah": [],
+    }
+
+
+@pytest.fixture
+def geometry_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_state_maps, "GEOMETRY_CACHE_PATH", str(tmp_path / "states.wkb"))
+    monkeypatch.setattr(generate_state_maps, "GEOMETRY_INDEX_PATH", str(tmp_path / "states.wkb.json"))
+    return tmp_path
+
+
+def write_states(path, geometries):
+    gpd.GeoDataFrame(
+        {"STATEFP": list(geometries)}, geometry=list(geometries.values()), crs="EPSG:4269",
+    ).to_file(path)
+
+
+def test_geometry_cache_follows_the_shapefile_hash(geometry_cache, capsys):
+    shapefile_path = str(geometry_cache / "states.shp")
+    write_states(shapefile_path, STATE_BOXES)
+
+    first = generate_state_maps.load_state_geometries(shapefile_path, ["39", "49", "99"])
+    assert "Building geometry cache" in capsys.readouterr().out
+    assert set(first) == {"39", "49"} and first["39"].equals(STATE_BOXES["39"])
+
+    again = generate_state_maps.load_state_geometries(shapefile_path, ["49"])
+    assert "Using cached geometries" in capsys.readouterr().out
+    assert again["49"].equals(STATE_BOXES["49"])
+
+    moved = shapely.box(-85.0, 38.0, -80.0, 42.5)
+    write_states(shapefile_path, {"39": moved})
+    rebuilt = generate_state_maps.load_state_geometries(shapefile_path, ["39", "49"])
+    assert "Building geometry cache" in capsys.readouterr().out
+    assert list(rebuilt) == ["39"] and rebuilt["39"].equals(moved)
+
+    # A blob that no longer matches its index is not trusted either.
+    with open(generate_state_maps.GEOMETRY_CACHE_PATH, "ab") as f:
+        f.write(b"\0")
+    generate_state_maps.load_state_geometries(shapefile_path, ["39"])
+    assert "Building geometry cache" in capsys.readouterr().out
+
+
+def state_svg(inner):
+    return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 300" class="state-outline-svg">\n{inner}\n</svg>'
+
+
+def test_bundles_hold_every_state_and_follow_their_svgs(output_dir, tmp_path, capsys):
+    manifest = BuildManifest(str(tmp_path / "build_manifest.json"))
+    for slug in ("ohio", "utah"):
+        manifest.write(str(output_dir / f"{slug}.svg"), slug, state_svg(f'  <path d="M 0 0" class="{slug}"/>'))
+
+    written = generate_state_maps.write_bundles(manifest, ["ohio", "utah"], ["sprite", "bundle"])
+    assert written == {"sprite": "states.sprite.svg", "bundle": "states.json"}
+    sprite = ElementTree.parse(output_dir / "states.sprite.svg").getroot()
+    symbols = sprite.findall("{http://www.w3.org/2000/svg}symbol")
+    assert [symbol.get("id") for symbol in symbols] == ["state-ohio", "state-utah"]
+    assert all(symbol.get("viewBox") == "0 0 400 300" for symbol in symbols)
+    assert symbols[1][0].get("class") == "utah"
+    bundle = json.loads((output_dir / "states.json").read_text())
+    assert bundle == {
+        slug: {"viewBox": "0 0 400 300", "content": f'  <path d="M 0 0" class="{slug}"/>'} for slug in ("ohio", "utah")
+    }
+    assert capsys.readouterr().out.count("Bundled 2 states") == 2
+
+    generate_state_maps.write_bundles(manifest, ["ohio", "utah"], ["sprite", "bundle"])
+    assert "Bundled" not in capsys.readouterr().out
+
+    manifest.write(str(output_dir / "utah.svg"), "utah-2", state_svg('  <circle r="4"/>'))
+    generate_state_maps.write_bundles(manifest, ["ohio", "utah"], ["sprite", "bundle"])
+    assert capsys.readouterr().out.count("Bundled 2 states") == 2
+    assert json.loads((output_dir / "states.json").read_text())["utah"]["content"] == '  <circle r="4"/>'
+    assert '<circle r="4"/>' in (output_dir / "states.sprite.svg").read_text()
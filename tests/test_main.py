@@ -0,0 +1,396 @@
+"""
+Tests for the static server in main.py.
+"""
+
+import email.utils
+import functools
+import http.client
+import os
+import re
+import socket
+import threading
+import time
+
+import pytest
+
+import main
+
+SIZE = 1000
+
+
+def make_handler(**headers):
+    """A StaticHandler with request ``headers`` and no connection behind it."""
+    handler = main.StaticHandler.__new__(main.StaticHandler)
+    handler.headers = http.client.HTTPMessage()
+    for name, value in headers.items():
+        handler.headers[name.replace("_", "-")] = value
+    return handler
+
+
+@pytest.fixture
+def asset(tmp_path):
+    path = tmp_path / "ohio.svg"
+    path.write_text("<svg/>")
+    return path
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-499", [(0, 499)]),
+    ("bytes=0-0,-1", [(0, 0), (999, 999)]),
+    # Suffix ranges count back from the end, clamped to the whole file.
+    ("bytes=-500", [(500, 999)]),
+    ("bytes=-5000", [(0, 999)]),
+    # Open-ended ranges, and last positions past the end, stop at the end.
+    ("bytes=900-", [(900, 999)]),
+    ("bytes=900-5000", [(900, 999)]),
+    (" Bytes = 10-19 ", [(10, 19)]),
+])
+def test_range_satisfiable(header, expected):
+    assert main.parse_range_header(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0", "bytes=1000-,-0"])
+def test_range_unsatisfiable(header):
+    assert main.parse_range_header(header, SIZE) == []
+
+
+def test_range_drops_unsatisfiable_parts():
+    assert main.parse_range_header("bytes=2000-,0-9", SIZE) == [(0, 9)]
+
+
+@pytest.mark.parametrize("header", [
+    "items=0-1", "bytes=", "bytes=5", "bytes=5-1", "bytes=a-b", "bytes=0-1,x", "bytes=-",
+    # Only plain digits are bounds: no signs, underscores or non-ASCII digits.
+    "bytes=--5", "bytes=+5-10", "bytes=0-+9", "bytes=1_000-", "bytes=-1_0", "bytes=\u0661-2",
+])
+def test_range_malformed_is_ignored(header):
+    assert main.parse_range_header(header, SIZE) is None
+
+
+def test_range_count_limit():
+    at_limit = "bytes=" + ",".join(f"{i * 10}-{i * 10 + 4}" for i in range(main.MAX_RANGES))
+    over_limit = at_limit + ",990-994"
+    assert len(main.parse_range_header(at_limit, SIZE)) == main.MAX_RANGES
+    assert main.parse_range_header(over_limit, SIZE) is None
+
+
+def test_if_range_uses_strong_comparison(asset):
+    st = os.stat(asset)
+    etag = main.make_etag(st)
+    assert make_handler().if_range_matches(etag, st)
+    assert make_handler(If_Range=etag).if_range_matches(etag, st)
+    assert not make_handler(If_Range=f"W/{etag}").if_range_matches(etag, st)
+    assert not make_handler(If_Range='"other"').if_range_matches(etag, st)
+
+
+def test_if_range_date(asset):
+    st = os.stat(asset)
+    etag = main.make_etag(st)
+    modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+    earlier = email.utils.formatdate(st.st_mtime - 60, usegmt=True)
+    assert make_handler(If_Range=modified).if_range_matches(etag, st)
+    assert not make_handler(If_Range=earlier).if_range_matches(etag, st)
+    assert not make_handler(If_Range="not a date").if_range_matches(etag, st)
+
+
+def test_if_none_match(asset):
+    st = os.stat(asset)
+    etag = main.make_etag(st)
+    assert make_handler(If_None_Match="*").is_not_modified(etag, st)
+    assert make_handler(If_None_Match=f'"other", {etag}').is_not_modified(etag, st)
+    # If-None-Match uses weak comparison.
+    assert make_handler(If_None_Match=f"W/{etag}").is_not_modified(etag, st)
+    assert not make_handler(If_None_Match='"other"').is_not_modified(etag, st)
+
+
+def test_if_none_match_overrides_if_modified_since(asset):
+    st = os.stat(asset)
+    etag = main.make_etag(st)
+    later = email.utils.formatdate(st.st_mtime + 60, usegmt=True)
+    assert make_handler(If_Modified_Since=later).is_not_modified(etag, st)
+    assert not make_handler(If_None_Match='"other"', If_Modified_Since=later).is_not_modified(etag, st)
+
+
+def test_file_cache_budget_counts_bytes_held(tmp_path):
+    path = tmp_path / "ohio.svg"
+    path.write_bytes(b"x" * 100)
+    st = os.stat(path)
+    cache = main.FileCache(max_bytes=50, max_file_bytes=50)
+    # A body smaller than the file on disk (it changed after the stat, or
+    # it is a compressed sibling) is budgeted at its own length.
+    cache.put(str(path), st, b"y" * 30)
+    assert cache.stats()[2:] == (30, 1)
+    assert cache.get(str(path), st) == b"y" * 30
+    cache.put(str(path), st, b"z" * 40)
+    assert cache.stats()[2:] == (40, 1)
+    cache.put(str(tmp_path / "utah.svg"), st, b"w" * 20)
+    # Over budget: the least recently used entry goes.
+    assert cache.stats()[2:] == (20, 1)
+    assert cache.get(str(path), st) is None
+
+
+def test_latency_quantiles_interpolate_within_buckets():
+    histogram = main.LatencyHistogram()
+    assert histogram.quantile(0.5) == 0.0
+    # A value on a bucket bound counts in that bucket (le is inclusive).
+    for seconds in (0.0007, 0.001, 0.002, 0.0025):
+        histogram.observe(seconds)
+    assert histogram.counts[:3] == [0, 2, 2]
+    assert histogram.quantile(0.25) == pytest.approx(0.00075)
+    assert histogram.quantile(0.5) == pytest.approx(0.001)
+    assert histogram.quantile(0.75) == pytest.approx(0.00175)
+    assert histogram.quantile(1.0) == pytest.approx(0.0025)
+    # Past the last bound there is nothing to interpolate towards.
+    histogram.observe(60)
+    assert histogram.quantile(1.0) == main.LATENCY_BUCKETS[-1]
+
+
+def test_metrics_render_prometheus_text():
+    metrics = main.Metrics(max_paths=2)
+    for _ in range(3):
+        metrics.request_started()
+    metrics.request_finished("/ohio.svg", 200, 6, 0.002)
+    metrics.request_finished('/a"b', 404, 0, 0.0002)
+    # Paths past max_paths are folded into one series.
+    metrics.request_finished("/utah.svg", 200, 9, 0.02)
+    lines = metrics.render(main.FileCache(1000, 100)).splitlines()
+
+    assert "# TYPE static_http_requests_total counter" in lines
+    assert "# TYPE static_http_request_duration_seconds histogram" in lines
+    assert 'static_http_requests_total{path="/ohio.svg",status="200"} 1' in lines
+    assert 'static_http_requests_total{path="/a\\"b",status="404"} 1' in lines
+    assert 'static_http_requests_total{path="__other__",status="200"} 1' in lines
+    assert 'static_http_response_bytes_total{path="__other__"} 9' in lines
+    assert 'static_http_request_duration_seconds_bucket{path="/ohio.svg",le="0.001"} 0' in lines
+    assert 'static_http_request_duration_seconds_bucket{path="/ohio.svg",le="0.0025"} 1' in lines
+    assert 'static_http_request_duration_seconds_bucket{path="/ohio.svg",le="+Inf"} 1' in lines
+    assert 'static_http_request_duration_seconds_count{path="/ohio.svg"} 1' in lines
+    assert 'static_http_request_duration_quantile_seconds{path="*",quantile="0.5"} 0.001750' in lines
+    assert "static_file_cache_hit_ratio 0.000000" in lines
+    assert "static_http_requests_in_flight 0" in lines
+    # Every sample belongs to a family with HELP and TYPE lines.
+    helped = {line.split()[2] for line in lines if line.startswith("# HELP ")}
+    typed = {line.split()[2] for line in lines if line.startswith("# TYPE ")}
+    assert helped == typed
+    for line in lines:
+        if not line.startswith("#"):
+            name = re.match(r"\w+", line).group()
+            assert name in typed or name.rsplit("_", 1)[0] in typed
+
+
+def test_accept_encoding_qvalues():
+    assert main.parse_accept_encoding("gzip, br;q=0.8, identity;q=0, *;Q=0.1, zstd;q=x") == {
+        "gzip": 1.0, "br": 0.8, "identity": 0.0, "*": 0.1, "zstd": 0.0,
+    }
+    assert main.parse_accept_encoding("") == {}
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, br", "br"),
+    ("gzip, br;q=0", "gzip"),
+    ("*;q=0.5, gzip;q=0", "br"),
+    ("*;q=0", "identity"),
+    ("br;q=0, gzip;q=0", "identity"),
+])
+def test_select_encoding_skips_q0_codings(asset, accept, expected):
+    for suffix in (".gz", ".br"):
+        sibling = f"{asset}{suffix}"
+        with open(sibling, "wb") as f:
+            f.write(b"compressed")
+        os.utime(sibling, ns=(os.stat(asset).st_atime_ns, os.stat(asset).st_mtime_ns))
+    st = os.stat(asset)
+    _, _, encoding = make_handler(Accept_Encoding=accept).select_encoding(str(asset), st)
+    assert encoding == expected
+
+
+def test_error_lines_follow_access_log(monkeypatch, capsys):
+    lines = []
+    handler = make_handler()
+    handler.client_address = ("127.0.0.1", 50000)
+    handler.requestline = "GET /ohio.svg HTTP/1.1"
+    handler.log_writer = type("Writer", (), {"write": staticmethod(lines.append)})()
+    monkeypatch.setattr(main, "ACCESS_LOG", "buffered")
+    handler.log_error("Request timed out: %r", "timeout")
+    handler.log_request(200, 6)
+    assert len(lines) == 2
+    assert lines[0].startswith("127.0.0.1 - - [") and lines[0].endswith("Request timed out: 'timeout'\n")
+    assert capsys.readouterr().err == ""
+
+    monkeypatch.setattr(main, "ACCESS_LOG", "off")
+    handler.log_error("code %d, message %s", 400, "Bad request")
+    handler.log_request(400, 0)
+    assert len(lines) == 2
+    assert capsys.readouterr().err == ""
+
+
+@pytest.fixture
+def start_pooled_server(tmp_path, monkeypatch):
+    """Start one-worker PooledHTTPServers on free ports, serving ``tmp_path``."""
+    monkeypatch.setattr(main, "REQUEST_TIMEOUT", 0.5)
+    monkeypatch.setattr(main.StaticHandler, "log_message", lambda self, *args: None)
+    (tmp_path / "ohio.svg").write_text("<svg/>")
+    servers = []
+
+    def start(**options):
+        options.setdefault("workers", 1)
+        options.setdefault("backlog", 8)
+        handler = functools.partial(main.StaticHandler, directory=str(tmp_path))
+        server = main.PooledHTTPServer(("127.0.0.1", 0), handler, **options)
+        server.accept_poll_interval = 0.05
+        thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def pooled_server(start_pooled_server):
+    return start_pooled_server()
+
+
+def test_silent_connections_do_not_hold_workers(pooled_server):
+    address = pooled_server.server_address
+    silent = [socket.create_connection(address) for _ in range(4)]
+    started = time.monotonic()
+    client = http.client.HTTPConnection(*address, timeout=5)
+    client.request("GET", "/ohio.svg")
+    response = client.getresponse()
+    assert response.status == 200
+    assert response.read() == b"<svg/>"
+    assert time.monotonic() - started < 0.4
+    client.close()
+
+    # A connection that never sends a request is closed after REQUEST_TIMEOUT.
+    silent[0].settimeout(5)
+    assert silent[0].recv(1) == b""
+    assert time.monotonic() - started < 2
+    for connection in silent:
+        connection.close()
+
+
+def test_timeouts_fire_while_workers_are_busy(pooled_server, monkeypatch):
+    release = threading.Event()
+    do_get = main.StaticHandler.do_GET
+
+    def stalling_get(handler):
+        if handler.path == "/stall":
+            release.wait(10)
+        do_get(handler)
+
+    monkeypatch.setattr(main.StaticHandler, "do_GET", stalling_get)
+    address = pooled_server.server_address
+    stalled = http.client.HTTPConnection(*address, timeout=5)
+    stalled.request("GET", "/stall")
+    time.sleep(0.1)
+    # Readable while the only worker is busy: this waits for the worker ...
+    waiting = http.client.HTTPConnection(*address, timeout=5)
+    waiting.request("GET", "/ohio.svg")
+    time.sleep(0.1)
+    # ... and must not stop silent connections from timing out meanwhile.
+    started = time.monotonic()
+    silent = socket.create_connection(address)
+    silent.settimeout(5)
+    assert silent.recv(1) == b""
+    assert time.monotonic() - started < 2
+
+    release.set()
+    assert stalled.getresponse().status == 404
+    response = waiting.getresponse()
+    assert response.status == 200
+    assert response.read() == b"<svg/>"
+    for connection in (stalled, waiting, silent):
+        connection.close()
+
+
+def test_connections_beyond_the_cap_wait_to_be_accepted(start_pooled_server):
+    server = start_pooled_server(max_connections=1)
+    address = server.server_address
+    silent = socket.create_connection(address)
+    time.sleep(0.1)
+    started = time.monotonic()
+    client = http.client.HTTPConnection(*address, timeout=5)
+    client.request("GET", "/ohio.svg")
+    # Only accepted once the silent connection hits REQUEST_TIMEOUT.
+    assert client.getresponse().status == 200
+    assert time.monotonic() - started >= 0.3
+    client.close()
+    silent.close()
+
+
+def test_parse_sandbox_roots():
+    assert main.parse_sandbox_roots("attached_assets, public/ ,dist/public=/,data=/files/,") == [
+        ("attached_assets", "/attached_assets/"),
+        ("public", "/public/"),
+        ("dist/public", "/"),
+        ("data", "/files/"),
+    ]
+
+
+@pytest.fixture
+def sandbox(tmp_path, monkeypatch):
+    """Sandbox routes for ``tmp_path/site/public`` served at /assets/."""
+    site = tmp_path / "site"
+    public = site / "public"
+    (public / "docs").mkdir(parents=True)
+    (public / ".git").mkdir()
+    (site / "private").mkdir()
+    (public / "ohio.svg").write_text("<svg/>")
+    (public / "ohio.svg.gz").write_bytes(b"compressed")
+    (public / "new york.svg").write_text("<svg>ny</svg>")
+    (public / "docs" / "index.html").write_text("<p>docs</p>")
+    (public / ".env").write_text("SECRET=1")
+    (public / ".git" / "config").write_text("[core]")
+    (site / "secret.txt").write_text("secret")
+    (site / "private" / "key.pem").write_text("key")
+    os.symlink(public / "ohio.svg", public / "inner-link.svg")
+    os.symlink(site / "secret.txt", public / "outer-link.svg")
+    os.symlink(site / "private", public / "private")
+    routes = main.RouteTable([(str(public), "/assets/")])
+    monkeypatch.setattr(main.StaticHandler, "routes", routes)
+    return routes
+
+
+def test_route_table_skips_dotfiles_and_escaping_symlinks(sandbox):
+    assert sorted(sandbox.routes) == [
+        "/assets/docs/",
+        "/assets/docs/index.html",
+        "/assets/inner-link.svg",
+        "/assets/new york.svg",
+        "/assets/ohio.svg",
+        "/assets/ohio.svg.gz",
+    ]
+    assert set(sandbox.lookup("/assets/ohio.svg").siblings) == {"gzip"}
+    assert sandbox.lookup("/assets/docs/") == sandbox.lookup("/assets/docs/index.html")
+
+
+@pytest.mark.parametrize("url, status", [
+    ("/assets/ohio.svg", 200),
+    ("/assets/ohio.svg?v=1", 200),
+    ("/assets/new%20york.svg", 200),
+    ("/assets/docs/", 200),
+    ("/assets/inner-link.svg", 200),
+    ("/assets/new+york.svg", 404),
+    ("/assets/OHIO.svg", 404),
+    ("/assets/ohio.svg/", 404),
+    ("/assets/./ohio.svg", 404),
+    ("/assets//ohio.svg", 404),
+    ("/assets/docs", 404),
+    ("/assets/.env", 404),
+    ("/assets/.git/config", 404),
+    ("/assets/outer-link.svg", 404),
+    ("/assets/private/key.pem", 404),
+    ("/assets/%2e%2e/secret.txt", 404),
+    ("/assets/../secret.txt", 404),
+])
+def test_sandbox_serves_only_exact_routes(sandbox, pooled_server, url, status):
+    client = http.client.HTTPConnection(*pooled_server.server_address, timeout=5)
+    client.request("GET", url)
+    response = client.getresponse()
+    response.read()
+    client.close()
+    assert response.status == status
@@ -0,0 +1,58 @@
+"""
+Tests for scripts/marker_layout.py.
+"""
+
+import numpy as np
+
+from marker_layout import CLUSTER_DISTANCE, cluster_radius, layout_markers, leader_clusters
+
+BOUNDS = (0, 0, 400, 300)
+
+
+def test_leader_clusters_do_not_chain():
+    # Thirty markers 5 units apart: single-linkage would join all of them.
+    xy = np.column_stack([np.arange(30) * 5.0 + 20, np.full(30, 150.0)])
+    ranks = np.arange(30) % 4 + 1
+    labels = leader_clusters(xy, ranks, CLUSTER_DISTANCE)
+
+    leaders = np.unique(labels)
+    assert len(leaders) > 1
+    assert (labels[leaders] == leaders).all()
+    assert np.hypot(*(xy - xy[labels]).T).max() < CLUSTER_DISTANCE
+    # Markers are visited in rank order, so no member outranks its leader.
+    assert (ranks[labels] <= ranks).all()
+
+
+def test_leader_clusters_prefer_important_markers():
+    xy = np.array([[100.0, 100.0], [110.0, 100.0], [120.0, 100.0]])
+    assert leader_clusters(xy, [3, 1, 2], CLUSTER_DISTANCE).tolist() == [1, 1, 1]
+
+
+def test_dense_group_becomes_one_cluster_at_its_centroid():
+    rng = np.random.default_rng(0)
+    blob = rng.normal(0, 3, (8, 2)) + (300, 80)
+    xy = np.vstack([blob, [[60.0, 220.0]]])
+    radii = np.full(len(xy), 6.0)
+    ranks = np.array([2, 3, 1, 4, 5, 2, 3, 4, 1])
+    groups, positions = layout_markers(xy, radii, ranks, BOUNDS)
+
+    assert sorted(map(len, groups)) == [1, 8]
+    cluster = next(index for index, members in enumerate(groups) if len(members) == 8)
+    # Members are listed most important first.
+    assert groups[cluster][0] == 2
+    assert sorted(groups[cluster]) == list(range(8))
+    np.testing.assert_allclose(positions[cluster], blob.mean(axis=0), atol=1e-6)
+    assert cluster_radius(6.0, 8) > 6.0
+
+
+def test_small_groups_are_nudged_apart_not_clustered():
+    xy = np.array([[200.0, 150.0], [203.0, 150.0], [200.0, 153.0]])
+    radii = np.array([8.0, 6.0, 6.0])
+    groups, positions = layout_markers(xy, radii, [1, 2, 3], BOUNDS)
+
+    assert groups == [[0], [1], [2]]
+    for a in range(3):
+        for b in range(a + 1, 3):
+            gap = np.hypot(*(positions[a] - positions[b])) - radii[a] - radii[b]
+            assert gap > -0.5
+    assert ((positions >= radii[:, None]) & (positions <= np.array(BOUNDS[2:]) - radii[:, None])).all()
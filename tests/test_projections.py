@@ -0,0 +1,24 @@
+"""
+Tests for scripts/projections.py.
+"""
+
+import shapely
+
+from projections import conformal_crs
+
+
+def crs_parameters(crs):
+    return {key.lstrip("+"): value for key, _, value in (part.partition("=") for part in crs.split())}
+
+
+def test_conformal_crs_fits_the_geometry():
+    params = crs_parameters(conformal_crs(shapely.box(-90, 30, -80, 42)))
+    assert 30 < float(params["lat_1"]) < float(params["lat_2"]) < 42
+    assert float(params["lat_0"]) == 36
+    assert float(params["lon_0"]) == -85
+
+    # Across the antimeridian the centre is taken over the short way round.
+    alaska = shapely.MultiPolygon([shapely.box(172, 51, 180, 53), shapely.box(-180, 51, -140, 71)])
+    params = crs_parameters(conformal_crs(alaska))
+    assert 51 < float(params["lat_1"]) < float(params["lat_2"]) < 71
+    assert float(params["lon_0"]) == -164
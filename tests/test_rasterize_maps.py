@@ -0,0 +1,31 @@
+"""
+Tests for scripts/rasterize_maps.py.
+"""
+
+import io
+
+import shapely
+from PIL import Image
+
+import generate_state_maps
+from rasterize_maps import rasterize
+
+
+def test_rasterize_state_at_each_scale():
+    state = shapely.Polygon([(-84.8, 38.4), (-80.5, 38.4), (-80.5, 42.0), (-84.8, 42.0)])
+    metros = [
+        {"name": "Columbus", "lat": 40.0, "lng": -83.0, "rank": 1},
+        {"name": "Cleveland", "lat": 41.5, "lng": -81.7, "rank": 2},
+    ]
+    rings, dots, leaders, counts, labels = generate_state_maps.raster_scene(state, "ohio", metros, declutter=True)
+    assert len(rings) == 1 and len(dots) == 2
+
+    targets = [(1, "png"), (2, "png"), (2, "webp")]
+    encoded = rasterize(rings, dots, 400, 300, targets, leaders=leaders, counts=counts, labels=labels)
+    assert set(encoded) == set(targets)
+    for (scale, image_format), data in encoded.items():
+        image = Image.open(io.BytesIO(data))
+        assert image.format == image_format.upper()
+        assert image.size == (400 * scale, 300 * scale)
+        # Something was drawn on the transparent background.
+        assert image.convert("RGBA").getextrema()[3][1] > 0
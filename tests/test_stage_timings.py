@@ -0,0 +1,63 @@
+"""
+Tests for scripts/stage_timings.py.
+"""
+
+import tracemalloc
+
+import pytest
+
+from stage_timings import StageTimings
+
+MB = 1_000_000
+
+
+@pytest.fixture
+def timings():
+    was_tracing = tracemalloc.is_tracing()
+    timings = StageTimings()
+    timings.enable()
+    yield timings
+    if not was_tracing:
+        tracemalloc.stop()
+
+
+def test_disabled_stages_record_nothing():
+    timings = StageTimings()
+    with timings.stage("render", "ohio"):
+        pass
+    assert timings.as_dict() == {"total": None, "stages": {}, "states": {}}
+
+
+def test_nested_peaks_reach_the_parent_and_the_run(timings):
+    with timings.stage("render"):
+        with timings.stage("encode", "ohio"):
+            block = bytearray(8 * MB)
+            del block
+        # A later sibling resets the tracemalloc peak; the parent keeps the
+        # peak of the first one.
+        with timings.stage("write", "ohio"):
+            pass
+    with timings.stage("bundle"):
+        pass
+
+    stages = timings.as_dict()["stages"]
+    assert stages["encode"]["peak_bytes"] >= 8 * MB
+    assert stages["write"]["peak_bytes"] < MB
+    assert stages["render"]["peak_bytes"] >= 8 * MB
+    assert stages["bundle"]["peak_bytes"] < MB
+    assert timings.as_dict()["total"]["peak_bytes"] >= 8 * MB
+
+
+def test_as_dict_totals_stages_and_states(timings):
+    for state in ("ohio", "utah", "ohio"):
+        with timings.stage("render", state):
+            pass
+    timings.record("render", 0.5, 0.25, "utah")
+
+    data = timings.as_dict()
+    assert set(data["total"]) == {"wall", "cpu", "peak_bytes"}
+    assert data["stages"]["render"]["calls"] == 4
+    assert data["stages"]["render"]["wall"] >= 0.5
+    assert set(data["states"]) == {"ohio", "utah"}
+    assert data["states"]["utah"]["render"]["cpu"] >= 0.25
+    assert set(data["states"]["ohio"]["render"]) == {"wall", "cpu"}